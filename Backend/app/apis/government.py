@@ -1,10 +1,29 @@
 from app.models.user import UserProfile
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from app.services.role_service import require_government
 from app.services.appwrite_service import AppwriteService
-from app.services.second_workflow import create_generate_disaster_task_graph
-from app.models.disaster import DisasterRequest
-from app.models.resource import ResourcePayload, DeleteResourceRequest, UpdateAvailabilityRequest
+from app.services.second_workflow import publish_first_task
+from app.services.llm_gateway import llm_gateway
+from app.services.task_generation import get_task_generation_metrics
+from app.services.task_cache import task_cache
+from app.services.task_triage import get_triage_metrics
+from app.services.resource_index import resource_index
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index
+from app.services.task_claims import get_claim_metrics
+from app.services.resource_ledger import resource_ledger, ResourceLedgerConflict
+from app.services.notification_service import notification_outbox
+from app.services.report_dedup import report_deduplicator
+from app.services.image_store import image_store
+from app.services.image_service import get_upload_metrics
+from app.services.report_stream import report_streams, sse_events
+from app.services.guide_templates import guide_templates
+from app.services.resource_import import import_resources, detect_format
+from app.services.moderation_service import stream_batch, accept_item, reject_item, unique_ids, MODERATION_BATCH_MAX
+from app.models.disaster import DisasterRequest, DisasterBatchRequest
+from app.models.resource import ResourcePayload, DeleteResourceRequest, UpdateAvailabilityRequest, ResourceDeltaRequest
 from app.models.user import DeleteUser
 
 
@@ -20,8 +39,8 @@ async def accept_disaster(payload: DisasterRequest, user: UserProfile = Depends(
         if current_status == "active":
             return {"message": f"Disaster {payload.disaster_id} is already active. No action taken."}
         appwrite_service.update_disaster_status(payload.disaster_id, "active")
-        graph = create_generate_disaster_task_graph()
-        graph.invoke({"disaster_id": payload.disaster_id})
+        notification_outbox.enqueue_disaster_alert(payload.disaster_id, disaster)
+        publish_first_task(payload.disaster_id, disaster)
         return {"message": f"Disaster {payload.disaster_id} marked as active."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
@@ -30,26 +49,73 @@ async def accept_disaster(payload: DisasterRequest, user: UserProfile = Depends(
 async def reject_disaster(payload: DisasterRequest, user: UserProfile = Depends(require_government)):
     try:
         appwrite_service.archive_disaster(payload.disaster_id)
-        
+        report_deduplicator.forget(payload.disaster_id)
+        notification_outbox.forget(payload.disaster_id)
         return {"message": f"Disaster {payload.disaster_id} archived."}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
+@router.get("/emergency/{disaster_id}/stream")
+async def stream_disaster_report(disaster_id: str, user: UserProfile = Depends(require_government)):
+    if report_streams.owner(disaster_id) is None:
+        raise HTTPException(status_code=404, detail="No live stream for this disaster")
+    return StreamingResponse(
+        sse_events(disaster_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def batch_ids(payload: DisasterBatchRequest) -> list:
+    disaster_ids = unique_ids(payload.disaster_ids)
+    if len(disaster_ids) > MODERATION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {MODERATION_BATCH_MAX} disasters per batch")
+    return disaster_ids
+
+@router.post("/emergency/accept/batch")
+async def accept_disasters_batch(payload: DisasterBatchRequest, user: UserProfile = Depends(require_government)):
+    disaster_ids = batch_ids(payload)
+    return StreamingResponse(stream_batch(disaster_ids, accept_item), media_type="application/x-ndjson")
+
+@router.post("/emergency/reject/batch")
+async def reject_disasters_batch(payload: DisasterBatchRequest, user: UserProfile = Depends(require_government)):
+    disaster_ids = batch_ids(payload)
+    return StreamingResponse(stream_batch(disaster_ids, reject_item), media_type="application/x-ndjson")
+
 @router.post("/resource/add")
 async def add_resource(payload: ResourcePayload, user: UserProfile = Depends(require_government)):
     try:
-        appwrite_service.add_resource_to_disaster(payload.disasterId, payload.data)
+        document = appwrite_service.add_resource_to_disaster(payload.disasterId, payload.data)
+        resource_index.upsert(payload.disasterId, document)
         
         return {"message": "Resource added successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add resource: {str(e)}")
     
+@router.post("/resource/bulk-import")
+async def bulk_import_resources(
+    disasterId: str = Form(...),
+    file: UploadFile = File(...),
+    user: UserProfile = Depends(require_government)
+):
+    try:
+        disaster = appwrite_service.find_disaster(disasterId)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to look up disaster: {str(e)}")
+    if disaster is None:
+        raise HTTPException(status_code=404, detail=f"Disaster {disasterId} not found")
+    try:
+        file_format = detect_format(file.filename, file.content_type)
+        return await run_in_threadpool(import_resources, disasterId, file.file, file_format)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import resources: {str(e)}")
+
 @router.delete("/resource/delete")
 async def delete_resource(payload: DeleteResourceRequest, user: UserProfile = Depends(require_government)):
     try:
         appwrite_service.delete_resource(payload.resource_id)
+        resource_index.remove(payload.resource_id)
         return {"message": f"Resource {payload.resource_id} deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete resource: {str(e)}")
@@ -57,8 +123,48 @@ async def delete_resource(payload: DeleteResourceRequest, user: UserProfile = De
 @router.patch("/resource/update-availability")
 async def update_resource_availability(payload: UpdateAvailabilityRequest, user: UserProfile = Depends(require_government)):
     try:
-        appwrite_service.update_resource_availability(payload.resource_id, payload.availability)
+        # Goes through the ledger so it is ordered with concurrent reserve/release calls
+        await run_in_threadpool(resource_ledger.set_availability, payload.resource_id, payload.availability)
         return {"message": f"Resource {payload.resource_id} availability updated to {payload.availability}"}
+    except ResourceLedgerConflict as conflict:
+        raise HTTPException(status_code=409, detail=conflict.to_dict())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update availability: {str(e)}")
-    
+
+@router.post("/resource/reserve")
+async def reserve_resource(payload: ResourceDeltaRequest, user: UserProfile = Depends(require_government)):
+    try:
+        return await run_in_threadpool(resource_ledger.reserve, payload.resource_id, payload.amount)
+    except ResourceLedgerConflict as conflict:
+        raise HTTPException(status_code=409, detail=conflict.to_dict())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reserve resource: {str(e)}")
+
+@router.post("/resource/release")
+async def release_resource(payload: ResourceDeltaRequest, user: UserProfile = Depends(require_government)):
+    try:
+        return await run_in_threadpool(resource_ledger.release, payload.resource_id, payload.amount)
+    except ResourceLedgerConflict as conflict:
+        raise HTTPException(status_code=409, detail=conflict.to_dict())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to release resource: {str(e)}")
+
+@router.get("/metrics")
+def get_metrics(user: UserProfile = Depends(require_government)):
+    return {
+        "llm": llm_gateway.get_metrics(),
+        "task_generation": get_task_generation_metrics(),
+        "task_cache": task_cache.get_metrics(),
+        "task_triage": get_triage_metrics(),
+        "resource_index": resource_index.get_metrics(),
+        "dispatch": dispatch_service.get_metrics(),
+        "task_feed": task_index.get_metrics(),
+        "task_claims": get_claim_metrics(),
+        "resource_ledger": resource_ledger.get_metrics(),
+        "notifications": notification_outbox.get_metrics(),
+        "report_dedup": report_deduplicator.get_metrics(),
+        "image_store": image_store.get_metrics(),
+        "report_uploads": get_upload_metrics(),
+        "report_streams": report_streams.get_metrics(),
+        "guide_templates": guide_templates.get_metrics()
+    }
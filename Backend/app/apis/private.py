@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends,HTTPException
-from app.models.user import UserProfile
+from fastapi import APIRouter, Depends,HTTPException, Query
+from app.models.user import UserProfile, UserRole
+import time
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.auth_service import AuthService
-from app.models.task import UpdateTaskStatusRequest
+from app.models.task import UpdateTaskStatusRequest, ClaimTaskRequest, TaskSyncRequest
 from app.services.appwrite_service import AppwriteService
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index, TASK_FEED_MAX_WAIT
+from app.services.role_service import get_current_user
+from app.services.task_claims import claim_task, TaskClaimConflict, TaskNotFound
+from app.services.task_sync import apply_task_status, sync_task_changes, TASK_SYNC_MAX_CHANGES
 
 router = APIRouter(prefix="/private", tags=["Private - Any Authenticated User"])
 security = HTTPBearer()
@@ -20,8 +27,59 @@ def get_profile(credentials: HTTPAuthorizationCredentials = Depends(security)):
 @router.patch("/tasks/{task_id}")
 async def update_task_status(task_id: str, payload: UpdateTaskStatusRequest, user: UserProfile = Depends(security)):
     try:
-        result = appwrite_service.update_task_status(task_id, payload.status, payload.action_done_by)
+        result = apply_task_status(task_id, payload.status, payload.action_done_by)
         return {"message": f"Task {task_id} status updated to {payload.status}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update task status: {str(e)}")
 
+@router.post("/tasks/sync")
+async def sync_task_statuses(payload: TaskSyncRequest, user: UserProfile = Depends(get_current_user)):
+    if len(payload.changes) > TASK_SYNC_MAX_CHANGES:
+        raise HTTPException(status_code=400, detail=f"At most {TASK_SYNC_MAX_CHANGES} changes per sync")
+    try:
+        return await run_in_threadpool(sync_task_changes, payload.changes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to sync task statuses: {str(e)}")
+
+@router.post("/tasks/{task_id}/claim")
+async def claim_task_endpoint(task_id: str, payload: ClaimTaskRequest, user: UserProfile = Depends(get_current_user)):
+    try:
+        document = await run_in_threadpool(
+            claim_task, task_id, user.email, payload.new_status, payload.expected_status, payload.expected_updated_at
+        )
+    except TaskClaimConflict as conflict:
+        raise HTTPException(status_code=409, detail=conflict.to_dict())
+    except TaskNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to claim task: {str(e)}")
+    dispatch_service.retire_task(task_id)
+    task_index.update_status(task_id, document.get("status"), document.get("action_done_by"))
+    return {"message": f"Task {task_id} claimed", "status": document.get("status"), "holder": document.get("action_done_by"), "updated_at": document.get("$updatedAt")}
+
+@router.get("/tasks/candidates")
+def get_candidate_tasks(user: UserProfile = Depends(get_current_user)):
+    return {"tasks": dispatch_service.candidate_tasks(user.uid)}
+
+FEED_ROLES = {
+    UserRole.VOLUNTEER: ["vol"],
+    UserRole.FIRST_RESPONDER: ["fr"],
+    UserRole.GOVERNMENT: ["vol", "fr"],
+}
+
+@router.get("/tasks/feed")
+async def get_task_feed(
+    since: str = Query(""),
+    wait: float = Query(0, ge=0),
+    user: UserProfile = Depends(get_current_user)
+):
+    roles = FEED_ROLES.get(user.role)
+    if roles is None:
+        raise HTTPException(status_code=403, detail="Task feed is for responders and government users")
+    result = task_index.feed(user.latitude, user.longitude, roles, since)
+    deadline = time.monotonic() + min(wait, TASK_FEED_MAX_WAIT)
+    # Long-poll: hold the request until something in range changes or the wait runs out
+    while not (result["tasks"] or result["removed"] or result["reset"]) and time.monotonic() < deadline:
+        await task_index.wait_for_change(result["cursor"], deadline - time.monotonic())
+        result = task_index.feed(user.latitude, user.longitude, roles, since)
+    return result
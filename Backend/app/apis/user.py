@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query as FastAPIQuery
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, Form, HTTPException, Query as FastAPIQuery
+from fastapi.responses import StreamingResponse
 from app.services.role_service import require_user
 from app.models.user import UserProfile
-from typing import Optional
+from typing import List, Optional
 from app.services.third_workflow import process_emergency_request, delete_task_by_id
-from app.services.first_workflow import handle_emergency_report
+from app.services.first_workflow import handle_emergency_report, generate_geohash_date_uuid
+from app.services.report_stream import report_streams, sse_events, GUIDANCE_COMPONENT
+from app.services.image_service import read_image_upload, ImageUploadError, REPORT_MAX_IMAGES
+from app.services.video_service import video_keyframes, VideoUploadError
 from app.models.userrequest import EmergencyRequest
 from app.services.appwrite_service import AppwriteService
-from appwrite.query import Query
+import time
 
 router = APIRouter(prefix="/user", tags=["Users"])
 
@@ -25,6 +29,7 @@ def user_dashboard(current_user: UserProfile = Depends(require_user)):
 # --- Emergency Report Endpoint ---
 @router.post("/emergency/report")
 async def emergency_report(
+    background_tasks: BackgroundTasks,
     emergencyType: str = Form(...),
     urgencyLevel: str = Form(...),
     situation: str = Form(...),
@@ -32,21 +37,63 @@ async def emergency_report(
     latitude: str = Form(...),
     longitude: str = Form(...),
     image: Optional[UploadFile] = File(None),
+    images: Optional[List[UploadFile]] = File(None),
+    video: Optional[UploadFile] = File(None),
     current_user: UserProfile = Depends(require_user)
 ):
-    # Call the emergency service function (placeholder for future logic)
-    await handle_emergency_report(
+    uploads = ([image] if image is not None else []) + list(images or [])
+    if len(uploads) > REPORT_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {REPORT_MAX_IMAGES} images per report")
+    # Reject oversized or non-image uploads before any model or network work
+    photos = []
+    for upload in uploads:
+        try:
+            image_bytes, _ = await read_image_upload(upload)
+        except ImageUploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=f"{upload.filename}: {str(e)}")
+        photos.append(image_bytes)
+    if video is not None:
+        # Scene-change keyframes join the photos in the same batched analysis, within the same cap
+        if len(photos) >= REPORT_MAX_IMAGES:
+            raise HTTPException(status_code=400, detail=f"At most {REPORT_MAX_IMAGES} images per report, including video keyframes")
+        try:
+            photos.extend(await video_keyframes(video, limit=REPORT_MAX_IMAGES - len(photos)))
+        except VideoUploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=f"{video.filename}: {str(e)}")
+
+    try:
+        disaster_id = generate_geohash_date_uuid(latitude, longitude)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid latitude or longitude")
+
+    # The report is processed after responding; clients follow it on the stream
+    report_streams.open(disaster_id, current_user.uid, time.time())
+    background_tasks.add_task(
+        handle_emergency_report,
         emergencyType=emergencyType,
         urgencyLevel=urgencyLevel,
         situation=situation,
         peopleCount=peopleCount,
         latitude=latitude,
         longitude=longitude,
-        image=image,
-        user=current_user
+        image=photos[0] if photos else None,
+        images=photos[1:],
+        user=current_user,
+        disaster_id=disaster_id
     )
 
-    return {"status": "received"}
+    return {"status": "received", "disaster_id": disaster_id, "stream": f"/user/emergency/report/{disaster_id}/stream"}
+
+
+@router.get("/emergency/report/{disaster_id}/stream")
+async def stream_emergency_report(disaster_id: str, current_user: UserProfile = Depends(require_user)):
+    if report_streams.owner(disaster_id) != current_user.uid:
+        raise HTTPException(status_code=404, detail="No live stream for this report")
+    return StreamingResponse(
+        sse_events(disaster_id, {GUIDANCE_COMPONENT}),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/emergency/request")
@@ -105,17 +152,10 @@ async def get_user_request(
     current_user: UserProfile = Depends(require_user)
 ):
     try:
-        docs = appwrite_service.databases.list_documents(
-            database_id=appwrite_service.database_id,
-            collection_id=appwrite_service.user_requests_collection_id,
-            queries=[
-                Query.equal("disaster_id", disasterId),
-                Query.equal("userId", userId)
-            ]
-        )
-        if docs["total"] == 0:
+        doc = appwrite_service.find_user_request_document(disasterId, userId)
+        if doc is None:
             return {"exists": False}
-        return {"exists": True, "request": docs["documents"][0]}
+        return {"exists": True, "request": doc}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch user request: {e}")
 
@@ -127,17 +167,9 @@ async def delete_user_request(
     current_user: UserProfile = Depends(require_user)
 ):
     try:
-        docs = appwrite_service.databases.list_documents(
-            database_id=appwrite_service.database_id,
-            collection_id=appwrite_service.user_requests_collection_id,
-            queries=[
-                Query.equal("disaster_id", disasterId),
-                Query.equal("userId", userId)
-            ]
-        )
-        if docs["total"] == 0:
+        doc = appwrite_service.find_user_request_document(disasterId, userId)
+        if doc is None:
             raise HTTPException(status_code=404, detail="User request not found")
-        doc = docs["documents"][0]
         appwrite_service.delete_user_request_document(doc["$id"])
         task_id = doc.get("task_id")
         if task_id:
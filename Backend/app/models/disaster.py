@@ -1,5 +1,8 @@
-
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List
 
 class DisasterRequest(BaseModel):
-    disaster_id: str
\ No newline at end of file
+    disaster_id: str
+
+class DisasterBatchRequest(BaseModel):
+    disaster_ids: List[str] = Field(min_length=1)
@@ -1,5 +1,5 @@
-
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional
 
 class ResourcePayload(BaseModel):
     disasterId: str
@@ -10,4 +10,43 @@ class DeleteResourceRequest(BaseModel):
 
 class UpdateAvailabilityRequest(BaseModel):
     resource_id: str
-    availability: int
\ No newline at end of file
+    availability: int
+
+class ResourceDeltaRequest(BaseModel):
+    resource_id: str
+    amount: int = Field(gt=0)
+
+class ResourceImportRow(BaseModel):
+    """One resource row of a bulk import (JSON Lines object or CSV record)."""
+    name: str = Field(min_length=1)
+    type: str = Field(min_length=1)
+    description: str = ""
+    contact: str = ""
+    latitude: str
+    longitude: str
+    capacity: int = Field(default=0, ge=0)
+    availability: Optional[int] = Field(default=None, ge=0)
+
+    @field_validator("description", "contact", mode="before")
+    @classmethod
+    def empty_text(cls, value):
+        return "" if value is None else value
+
+    @field_validator("latitude", "longitude", mode="before")
+    @classmethod
+    def coordinate_text(cls, value):
+        return str(value).strip() if value is not None else value
+
+    @field_validator("latitude")
+    @classmethod
+    def valid_latitude(cls, value):
+        if not -90 <= float(value) <= 90:
+            raise ValueError("latitude must be between -90 and 90")
+        return value
+
+    @field_validator("longitude")
+    @classmethod
+    def valid_longitude(cls, value):
+        if not -180 <= float(value) <= 180:
+            raise ValueError("longitude must be between -180 and 180")
+        return value
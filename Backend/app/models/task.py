@@ -1,6 +1,40 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+from datetime import datetime
 
 class UpdateTaskStatusRequest(BaseModel):
     status: str
-    action_done_by: Optional[str] = None 
\ No newline at end of file
+    action_done_by: Optional[str] = None 
+
+class TaskStatusChange(BaseModel):
+    task_id: str
+    status: str
+    action_done_by: Optional[str] = None
+    changed_at: datetime  # when the change was made on the device
+
+class TaskSyncRequest(BaseModel):
+    changes: List[TaskStatusChange] = Field(min_length=1)
+
+class ClaimTaskRequest(BaseModel):
+    expected_status: str = "pending"
+    expected_updated_at: Optional[str] = None  # $updatedAt the client last saw
+    new_status: str = "claimed"
+
+class GeneratedTaskResponse(BaseModel):
+    """Schema the task generation LLM calls are constrained to."""
+    description: str = Field(description="1-2 sentence direct task for responders")
+    roles: Literal["vol", "fr", "both"] = Field(description="Exactly one of 'vol', 'fr' or 'both'")
+    reasoning: Optional[str] = Field(default=None, description="Brief explanation of the role assignment")
+    resource_utilization: Optional[str] = Field(default=None, description="How to use nearby resources, or 'none'")
+
+    @field_validator("roles", mode="before")
+    @classmethod
+    def normalize_roles(cls, value):
+        if isinstance(value, (list, tuple)):
+            value = "both" if {"vol", "fr"} <= {str(v).strip().lower() for v in value} else (value[0] if value else "vol")
+        value = str(value).strip().lower()
+        if value in ("volunteer", "volunteers"):
+            return "vol"
+        if value in ("first_responder", "first responder", "first responders", "first_responders"):
+            return "fr"
+        return value
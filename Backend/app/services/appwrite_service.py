@@ -8,12 +8,19 @@ from appwrite.exception import AppwriteException
 from appwrite.id import ID
 from appwrite.query import Query
 from appwrite.id import ID
+from concurrent.futures import ThreadPoolExecutor
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Documents per list request; at most two pages are held in memory per iterator
+APPWRITE_PAGE_SIZE = int(os.getenv("APPWRITE_PAGE_SIZE", "100"))
+
+# Fetches the next page of every iter_documents stream while the current one is consumed
+page_prefetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("APPWRITE_PREFETCH_WORKERS", "8")), thread_name_prefix="appwrite-prefetch")
+
 class AppwriteService:
     def __init__(self):
         # Initialize Appwrite client
@@ -62,6 +69,46 @@ class AppwriteService:
         self.databases = Databases(self.client)
         self.users = Users(self.client)
         self.storage = Storage(self.client)  # Add storage service initialization
+
+    def iter_documents(self, collection_id: str, queries: Optional[List[str]] = None, page_size: Optional[int] = None, limit: Optional[int] = None) -> Iterator[dict]:
+        """Stream every document matching queries, page by page with Query.cursor_after.
+
+        The next page is requested as soon as the current one arrives, so network
+        time overlaps with the caller's processing. Stops after limit documents if given.
+        """
+        page_size = page_size or APPWRITE_PAGE_SIZE
+        if limit is not None:
+            page_size = min(page_size, limit)
+
+        def fetch(cursor: Optional[str]) -> list:
+            page_queries = list(queries or []) + [Query.limit(page_size)]
+            if cursor:
+                page_queries.append(Query.cursor_after(cursor))
+            try:
+                return self.databases.list_documents(
+                    database_id=self.database_id,
+                    collection_id=collection_id,
+                    queries=page_queries
+                ).get("documents", [])
+            except AppwriteException as e:
+                raise Exception(f"Failed to list documents: {e.message}")
+
+        yielded = 0
+        next_page = page_prefetch_executor.submit(fetch, None)
+        try:
+            while next_page is not None:
+                page = next_page.result()
+                next_page = None
+                if len(page) == page_size and (limit is None or yielded + len(page) < limit):
+                    next_page = page_prefetch_executor.submit(fetch, page[-1]["$id"])
+                for document in page:
+                    yield document
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+        finally:
+            if next_page is not None:
+                next_page.cancel()
     
     def create_user_account(self, email: str, password: str, name: str) -> Dict[str, Any]:
         """Create a new user account in Appwrite Auth"""
@@ -169,23 +216,39 @@ class AppwriteService:
         except AppwriteException as e:
             raise Exception(f"Failed to get user by email: {e.message}")
     
-    def upload_disaster_image_to_storage(self, image_bytes: bytes, disaster_id: str) -> str:
-        """Upload disaster image to Appwrite Storage and return the file URL"""
+    def upload_disaster_image_to_storage(self, image_bytes: bytes, disaster_id: str, file_id: Optional[str] = None, extension: str = "jpg", mime_type: Optional[str] = None) -> str:
+        """Upload disaster image to Appwrite Storage and return the file URL.
+
+        With a file_id (e.g. a content hash) an existing file with that ID counts as uploaded.
+        """
         try:
-            file = InputFile.from_bytes(image_bytes, filename=f"{disaster_id}.jpg")
+            file = InputFile.from_bytes(image_bytes, filename=f"{file_id or disaster_id}.{extension}", mime_type=mime_type)
             result = self.storage.create_file(
                 bucket_id=self.bucket_id,
-                file_id=ID.unique(),
+                file_id=file_id or ID.unique(),
                 file=file
             )
-            file_id = result['$id']
-            file_url = f"{self.endpoint}/storage/buckets/{self.bucket_id}/files/{file_id}/view?project={self.project_id}"
-            return file_url
+            return self.get_file_url(result['$id'])
         except AppwriteException as e:
+            if file_id and e.code == 409:
+                return self.get_file_url(file_id)
             raise Exception(f"Error uploading image to Appwrite: {e.message}")
         except Exception as e:
             raise Exception(f"Error uploading image: {str(e)}")
 
+    def get_file_url(self, file_id: str) -> str:
+        return f"{self.endpoint}/storage/buckets/{self.bucket_id}/files/{file_id}/view?project={self.project_id}"
+
+    def storage_file_exists(self, file_id: str) -> bool:
+        """Check for a file in the images bucket without downloading it."""
+        try:
+            self.storage.get_file(bucket_id=self.bucket_id, file_id=file_id)
+            return True
+        except AppwriteException as e:
+            if e.code == 404:
+                return False
+            raise Exception(f"Failed to look up file: {e.message}")
+
     def save_disaster_to_database(self, disaster_data: dict) -> bool:
         """Save disaster data to Appwrite Database"""
         try:
@@ -224,6 +287,30 @@ class AppwriteService:
         except AppwriteException as e:
             raise Exception(f"Failed to get disaster document: {e.message}")
 
+    def get_task_document(self, task_id: str) -> dict:
+        """Get a task document from the tasks collection."""
+        try:
+            return self.databases.get_document(
+                database_id=self.database_id,
+                collection_id=self.tasks_collection_Id,
+                document_id=task_id
+            )
+        except AppwriteException as e:
+            raise Exception(f"Failed to get task document: {e.message}")
+
+    def find_task_document(self, task_id: str) -> Optional[dict]:
+        """Get a task document, or None if there is no task with this id."""
+        try:
+            return self.databases.get_document(
+                database_id=self.database_id,
+                collection_id=self.tasks_collection_Id,
+                document_id=task_id
+            )
+        except AppwriteException as e:
+            if e.code == 404:
+                return None
+            raise Exception(f"Failed to get task document: {e.message}")
+
     def save_task_document(self, task_data: dict) -> dict:
         """Save a task document to the tasks collection."""
         try:
@@ -239,17 +326,44 @@ class AppwriteService:
         except Exception as e:
             raise
     
-    def list_resources_for_disaster(self, disaster_id: str) -> list:
-        """List resources for a given disaster_id from the resources collection."""
+    def update_task_document(self, task_id: str, data: dict) -> dict:
+        """Patch fields of a task document."""
         try:
-            documents = self.databases.list_documents(
+            document = self.databases.update_document(
                 database_id=self.database_id,
-                collection_id=self.resources_collection_id,
-                queries=[Query.equal("disaster_id", disaster_id)]
+                collection_id=self.tasks_collection_Id,
+                document_id=task_id,
+                data=data
+            )
+            return document
+        except AppwriteException as e:
+            raise Exception(f"Failed to update task document: {e.message}")
+
+    def delete_task_document(self, task_id: str):
+        """Delete a task document."""
+        try:
+            self.databases.delete_document(
+                database_id=self.database_id,
+                collection_id=self.tasks_collection_Id,
+                document_id=task_id
             )
-            return documents.get("documents", [])
         except AppwriteException as e:
-            raise Exception(f"Failed to list resources: {e.message}")
+            raise Exception(f"Failed to delete task: {e.message}")
+
+    def list_tasks_by_disaster_and_status(self, disaster_id: str, status: str) -> list:
+        """List tasks of a disaster that are in the given status."""
+        return list(self.iter_documents(self.tasks_collection_Id, [
+            Query.equal("disaster_id", disaster_id),
+            Query.equal("status", status)
+        ]))
+
+    def iter_resources_for_disaster(self, disaster_id: str) -> Iterator[dict]:
+        """Stream the resources of a given disaster_id from the resources collection."""
+        return self.iter_documents(self.resources_collection_id, [Query.equal("disaster_id", disaster_id)])
+
+    def list_resources_for_disaster(self, disaster_id: str) -> list:
+        """List resources for a given disaster_id from the resources collection."""
+        return list(self.iter_resources_for_disaster(disaster_id))
 
     def save_user_request_document(self, user_id: str, user_request_data: dict) -> dict:
         """Save a user request document to the user requests collection."""
@@ -277,6 +391,19 @@ class AppwriteService:
         except AppwriteException as e:
             raise Exception(f"Failed to update disaster status: {e.message}")
 
+    def update_disaster_document(self, disaster_id: str, data: dict) -> dict:
+        """Patch fields of a disaster document."""
+        try:
+            document = self.databases.update_document(
+                database_id=self.database_id,
+                collection_id=self.disasters_collection_id,
+                document_id=disaster_id,
+                data=data
+            )
+            return document
+        except AppwriteException as e:
+            raise Exception(f"Failed to update disaster document: {e.message}")
+
     def archive_disaster(self, disaster_id: str) -> dict:
         """Archive a disaster (set status to 'archived')."""
         return self.update_disaster_status(disaster_id, "archived")
@@ -295,6 +422,17 @@ class AppwriteService:
         except AppwriteException as e:
             raise Exception(f"Failed to add resource: {e.message}")
         
+    def get_resource_document(self, resource_id: str) -> dict:
+        """Get a resource document from the resources collection."""
+        try:
+            return self.databases.get_document(
+                database_id=self.database_id,
+                collection_id=self.resources_collection_id,
+                document_id=resource_id
+            )
+        except AppwriteException as e:
+            raise Exception(f"Failed to get resource: {e.message}")
+
     def delete_resource(self, resource_id: str):
         """Delete a resource document."""
         try:
@@ -330,20 +468,25 @@ class AppwriteService:
         except AppwriteException as e:
             raise Exception(f"Failed to get disaster: {e.message}")
 
-    def query_disasters_by_geohash_and_time(self, geohash_prefix: str, min_timestamp: int, limit: int = 100) -> list:
+    def find_disaster(self, disaster_id: str) -> Optional[dict]:
+        """Get a disaster document, or None if there is no disaster with this id."""
         try:
-            documents = self.databases.list_documents(
+            return self.databases.get_document(
                 database_id=self.database_id,
                 collection_id=self.disasters_collection_id,
-                queries=[
-                    Query.starts_with('geohash', geohash_prefix),
-                    Query.greater_than('submitted_time', min_timestamp),
-                    Query.limit(limit)
-                ]
+                document_id=disaster_id
             )
-            return documents.get('documents', [])
         except AppwriteException as e:
-            raise Exception(f"Failed to query disasters: {e.message}")
+            if e.code == 404:
+                return None
+            raise Exception(f"Failed to get disaster: {e.message}")
+
+    def query_disasters_by_geohash_and_time(self, geohash_prefix: str, min_timestamp: int, limit: Optional[int] = None) -> Iterator[dict]:
+        """Stream disasters in a geohash cell submitted after min_timestamp (optionally capped at limit)."""
+        return self.iter_documents(self.disasters_collection_id, [
+            Query.starts_with('geohash', geohash_prefix),
+            Query.greater_than('submitted_time', min_timestamp)
+        ], limit=limit)
 
     def update_task_status(self, task_id: str, status: str, action_done_by: str = None) -> dict:
         """Update the status (and optionally action_done_by) of a task document."""
@@ -374,15 +517,14 @@ class AppwriteService:
 
     def list_tasks_by_user_and_disaster(self, user_id: str, disaster_id: str) -> list:
         """List tasks for a given user_id and disaster_id from the tasks collection."""
-        try:
-            documents = self.databases.list_documents(
-                database_id=self.database_id,
-                collection_id=self.tasks_collection_Id,
-                queries=[
-                    Query.equal("user_id", user_id),
-                    Query.equal("disaster_id", disaster_id)
-                ]
-            )
-            return documents.get("documents", [])
-        except AppwriteException as e:
-            raise Exception(f"Failed to list tasks: {e.message}")
\ No newline at end of file
+        return list(self.iter_documents(self.tasks_collection_Id, [
+            Query.equal("user_id", user_id),
+            Query.equal("disaster_id", disaster_id)
+        ]))
+
+    def find_user_request_document(self, disaster_id: str, user_id: str) -> Optional[dict]:
+        """Return the user's request document for a disaster, or None."""
+        return next(self.iter_documents(self.user_requests_collection_id, [
+            Query.equal("disaster_id", disaster_id),
+            Query.equal("userId", user_id)
+        ], limit=1), None)
\ No newline at end of file
@@ -2,6 +2,8 @@ from fastapi import HTTPException
 from app.models.user import UserSignup, UserLogin, UserProfile, Token, Status
 from app.services.jwt_service import JWTService
 from app.services.appwrite_service import AppwriteService
+from app.services.dispatch_service import dispatch_service
+from app.services.user_geo_index import user_geo_index
 import bcrypt
 import yaml
 import pygeohash as ph
@@ -114,6 +116,8 @@ class AuthService:
             }
             self.appwrite.update_user_document(user_uid, update_data)
             user_document.update(update_data)
+            dispatch_service.upsert_responder(user_document)
+            user_geo_index.upsert(user_document)
             token_payload = {
                 "uid": str(user_document["uid"]),
                 "email": str(user_document["email"]),
@@ -35,32 +35,44 @@ def load_disaster_model(path, device):
 def load_yolo_model():
     return YOLO('./.output_models/yolo.pt')
 
-def analyze_image_with_summary(image_input, disaster_model, yolo_model, device):
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                             [0.229, 0.224, 0.225])
-    ])
-    classes = ['earthquake', 'fire', 'flood', 'normal']
+CLASSES = ['earthquake', 'fire', 'flood', 'normal']
+TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                         [0.229, 0.224, 0.225])
+])
 
+def load_image(image_input):
     if isinstance(image_input, BytesIO):
-        image = Image.open(image_input).convert('RGB')
+        return Image.open(image_input).convert('RGB')
     elif isinstance(image_input, Image.Image):
-        image = image_input.convert('RGB')
+        return image_input.convert('RGB')
     else:
         raise TypeError("image_input must be a PIL.Image or BytesIO object")
 
-    input_tensor = transform(image).unsqueeze(0).to(device)
+def analyze_image_with_summary(image_input, disaster_model, yolo_model, device):
+    return analyze_images_with_summary([image_input], disaster_model, yolo_model, device)
+
+def analyze_images_with_summary(image_inputs, disaster_model, yolo_model, device):
+    """Classify several photos of one scene as a single batch.
+
+    Class probabilities are averaged over the photos; the person count is the
+    highest of any single photo, since the same people often appear in several.
+    """
+    images = [load_image(image_input) for image_input in image_inputs]
+
+    input_tensor = torch.stack([TRANSFORM(image) for image in images]).to(device)
     with torch.no_grad():
-        pred = torch.nn.functional.softmax(disaster_model(input_tensor), dim=1)
-    disaster = classes[torch.argmax(pred)]
+        pred = torch.nn.functional.softmax(disaster_model(input_tensor), dim=1).mean(dim=0)
+    disaster = CLASSES[torch.argmax(pred)]
     conf = torch.max(pred).item()
 
-    results = yolo_model(image, conf=0.4, verbose=False)
-    people = sum(1 for r in results for b in r.boxes if int(b.cls) == 0)
+    results = yolo_model(images, conf=0.4, verbose=False)
+    people = max(sum(1 for b in r.boxes if int(b.cls) == 0) for r in results)
 
-    return f"The image likely shows a {disaster.upper()} scene with {people} {'people' if people != 1 else 'person'} detected. (Confidence: {conf*100:.1f}%)"
+    photos = f" across {len(images)} photos" if len(images) > 1 else ""
+    return f"The image likely shows a {disaster.upper()} scene with {people} {'people' if people != 1 else 'person'} detected{photos}. (Confidence: {conf*100:.1f}%)"
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 disaster_model = load_disaster_model('./.output_models/cnn_model.pth', device)
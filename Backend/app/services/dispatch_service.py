@@ -0,0 +1,171 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.geo_utils import haversine_km, geohash_block
+from appwrite.query import Query
+from collections import OrderedDict
+from typing import Optional
+import heapq
+import os
+import threading
+import pygeohash as pgh
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISPATCH_K = int(os.getenv("DISPATCH_K", "10"))
+# Geohash rings (precision 4, roughly 20-40 km cells) searched around a task before giving up
+DISPATCH_MAX_RINGS = int(os.getenv("DISPATCH_MAX_RINGS", "2"))
+DISPATCH_MAX_TASKS_PER_RESPONDER = int(os.getenv("DISPATCH_MAX_TASKS_PER_RESPONDER", "50"))
+
+GEOHASH_PRECISION = 4
+RESPONDER_ROLES = {"volunteer": "vol", "first_responder": "fr"}
+UNAVAILABLE_STATUSES = {"emergency"}
+
+appwrite_service = AppwriteService()
+
+
+def parse_location(latitude, longitude):
+    try:
+        return float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+
+
+class DispatchService:
+    """Matches tasks to the nearest eligible volunteers and first responders.
+
+    Responders are kept in memory bucketed by geohash cell, filled once from the
+    users collection and updated on login, so matching only looks at the cells
+    around a task. Each responder's candidate tasks are kept in a per-user map.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.responders = {}
+        self.candidates = {}
+        self.task_responders = {}
+        self.lock = threading.Lock()
+        self.warmed = False
+        self.metrics = {"dispatched_tasks": 0, "matches": 0, "unmatched_tasks": 0, "retired_tasks": 0}
+
+    def warm(self):
+        """Load all volunteers and first responders once (e.g. at startup)."""
+        count = 0
+        for document in appwrite_service.iter_documents(
+            appwrite_service.users_collection_id,
+            [Query.equal("role", list(RESPONDER_ROLES))]
+        ):
+            # A login during warm-up carries a fresher location than the stored document
+            self.upsert_responder(document, replace=False)
+            count += 1
+        self.warmed = True
+        print(f"Dispatch index warmed with {count} responders")
+
+    def upsert_responder(self, user_document: dict, replace: bool = True):
+        role = RESPONDER_ROLES.get(str(user_document.get("role", "")))
+        uid = str(user_document.get("uid") or user_document.get("$id") or "")
+        location = parse_location(user_document.get("latitude"), user_document.get("longitude"))
+        if not uid:
+            return
+        with self.lock:
+            if not replace and uid in self.responders:
+                return
+            previous = self.responders.pop(uid, None)
+            if previous:
+                self.cells.get(previous["geohash"], {}).pop(uid, None)
+            if role is None or location is None:
+                return
+            geohash = pgh.encode(location[0], location[1], precision=GEOHASH_PRECISION)
+            self.responders[uid] = {
+                "uid": uid,
+                "role": role,
+                "skills": [str(skill).lower() for skill in user_document.get("skills") or []],
+                "status": str(user_document.get("status") or "normal"),
+                "latitude": location[0],
+                "longitude": location[1],
+                "geohash": geohash,
+            }
+            self.cells.setdefault(geohash, {})[uid] = self.responders[uid]
+
+    def nearest_responders(self, latitude: float, longitude: float, roles: list, k: int = DISPATCH_K, skills: Optional[list] = None) -> list:
+        """Return up to k (distance_km, responder) pairs eligible for the given task roles."""
+        wanted_skills = {str(skill).lower() for skill in skills or []}
+        center = pgh.encode(latitude, longitude, precision=GEOHASH_PRECISION)
+        found = []
+        with self.lock:
+            seen = set()
+            for rings in range(DISPATCH_MAX_RINGS + 1):
+                for cell in geohash_block(center, rings):
+                    if cell in seen:
+                        continue
+                    seen.add(cell)
+                    for responder in self.cells.get(cell, {}).values():
+                        if responder["role"] not in roles or responder["status"] in UNAVAILABLE_STATUSES:
+                            continue
+                        if wanted_skills and not wanted_skills & set(responder["skills"]):
+                            continue
+                        found.append(responder)
+                # Cells are ~20-40 km wide, so stop widening once enough responders are in range
+                if len(found) >= k:
+                    break
+        ranked = ((haversine_km(latitude, longitude, r["latitude"], r["longitude"]), r["uid"], r) for r in found)
+        return [(distance, responder) for distance, _, responder in heapq.nsmallest(k, ranked, key=lambda item: (item[0], item[1]))]
+
+    def dispatch_task(self, task: dict) -> list:
+        """Match a newly persisted task to its nearest eligible responders; returns their uids."""
+        location = parse_location(task.get("latitude"), task.get("longitude"))
+        task_id = task.get("task_id") or task.get("$id")
+        if location is None or not task_id:
+            return []
+        matches = self.nearest_responders(location[0], location[1], task.get("roles") or [], skills=task.get("required_skills"))
+        summary = {
+            "task_id": task_id,
+            "disaster_id": task.get("disaster_id", ""),
+            "description": task.get("description", ""),
+            "roles": task.get("roles", []),
+            "emergency_type": task.get("emergency_type", ""),
+            "urgency_level": task.get("urgency_level", ""),
+            "latitude": task.get("latitude"),
+            "longitude": task.get("longitude"),
+        }
+        with self.lock:
+            self.metrics["dispatched_tasks"] += 1
+            self.metrics["matches"] += len(matches)
+            if not matches:
+                self.metrics["unmatched_tasks"] += 1
+            responders = [responder["uid"] for _, responder in matches]
+            self.task_responders[task_id] = responders
+            for distance, responder in matches:
+                tasks = self.candidates.setdefault(responder["uid"], OrderedDict())
+                tasks[task_id] = {**summary, "distance_km": round(distance, 2)}
+                tasks.move_to_end(task_id)
+                while len(tasks) > DISPATCH_MAX_TASKS_PER_RESPONDER:
+                    tasks.popitem(last=False)
+        return list(responders)
+
+    def retire_task(self, task_id: str):
+        """Drop a task that is no longer open from every responder's candidates."""
+        with self.lock:
+            if task_id not in self.task_responders:
+                return
+            for uid in self.task_responders.pop(task_id):
+                self.candidates.get(uid, {}).pop(task_id, None)
+            self.metrics["retired_tasks"] += 1
+
+    def candidate_tasks(self, uid: str) -> list:
+        """Tasks matched to a responder, closest first."""
+        with self.lock:
+            tasks = list(self.candidates.get(uid, {}).values())
+        return sorted(tasks, key=lambda task: task["distance_km"])
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                **self.metrics,
+                "warmed": self.warmed,
+                "responders": len(self.responders),
+                "cells": len(self.cells),
+                "open_tasks": len(self.task_responders),
+            }
+
+
+dispatch_service = DispatchService()
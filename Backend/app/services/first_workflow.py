@@ -1,22 +1,29 @@
 from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from app.services.cnn_service import analyze_image_with_summary, disaster_model, yolo_model, device
+from app.services.cnn_service import analyze_images_with_summary, disaster_model, yolo_model, device
 from langgraph.graph import StateGraph
 from typing import TypedDict
 from io import BytesIO
-import base64
 import requests
 import os
 import json
 import time
 import uuid
 import pygeohash as pgh
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
 import xml.etree.ElementTree as ET
 import math
 from appwrite.services.storage import Storage
 from app.services.appwrite_service import AppwriteService
+from app.services.llm_gateway import llm_gateway
+from app.services.second_workflow import pregenerate_task_draft
+from app.services.image_service import dhash, make_variant, variant_format, read_image_upload, image_data_url, make_collage, ImageUploadError, IMAGE_VARIANTS
+from app.services.image_store import image_store
+from app.services.report_dedup import report_deduplicator, REPORT_DEDUP
+from app.services.report_stream import report_streams
+from app.services.guide_templates import guide_templates, GUIDE_REFINEMENT
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,12 +31,36 @@ load_dotenv()
 appwrite_service = AppwriteService()
 storage = Storage(appwrite_service.client)
 
-gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+# Latency budget (seconds) for a single report. Components that miss their stage
+# deadline are persisted as pending and backfilled once they finish.
+REPORT_LATENCY_SLO = float(os.getenv("REPORT_LATENCY_SLO", "12"))
+DATA_COLLECTION_TIMEOUT = float(os.getenv("REPORT_DATA_COLLECTION_TIMEOUT", "8"))
+# Computer vision decides acceptance, so it gets its own longer bound instead of the data collection deadline
+COMPUTER_VISION_TIMEOUT = float(os.getenv("REPORT_COMPUTER_VISION_TIMEOUT", "30"))
+AI_ANALYSIS_TIMEOUT = float(os.getenv("REPORT_AI_ANALYSIS_TIMEOUT", "8"))
+BACKFILL_TIMEOUT = float(os.getenv("REPORT_BACKFILL_TIMEOUT", "120"))
+# Speculatively draft the first task of accepted reports so government acceptance is a single write
+TASK_PREGENERATION = os.getenv("TASK_PREGENERATION", "true").lower() == "true"
+
+# Shared pools: a stage must be able to return at its deadline while late
+# components keep running, which a `with ThreadPoolExecutor()` block would prevent.
+agent_executor = ThreadPoolExecutor(max_workers=int(os.getenv("REPORT_AGENT_WORKERS", "16")), thread_name_prefix="report-agent")
+# Post-save work (image variants, task drafts); late agents are backfilled from their own callbacks instead
+backfill_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="report-backfill")
+# Image uploads overlap with the analysis graph, which works from the in-memory bytes
+upload_executor = ThreadPoolExecutor(max_workers=int(os.getenv("REPORT_UPLOAD_WORKERS", "8")), thread_name_prefix="report-upload")
+
+# Disaster document field filled in by each backfillable component
+BACKFILL_FIELDS = {
+    "government_analysis_ai": "government_report",
+    "citizen_survival_ai": "citizen_survival_guide",
+}
+
+late_components = {}
+late_components_lock = threading.Lock()
 
 class EmergencyState(TypedDict):
+    disaster_id: str
     image_bytes: bytes
     emergencyType: str
     urgencyLevel: str
@@ -52,6 +83,13 @@ class EmergencyState(TypedDict):
     parallel_tasks_completed: bool
     analysis_ready: bool
     ai_matrix_logs: list
+    deadline: float
+    pending_components: list
+    image_phash: str
+    image_data_url: str
+    images: list
+    image_urls: list
+    guide_template: str
 
 def add_log_to_matrix(state: EmergencyState, message: str, component: str = "system", level: str = "info"):
     if "ai_matrix_logs" not in state:
@@ -152,9 +190,6 @@ def government_analysis_ai_agent(state: EmergencyState) -> EmergencyState:
         state["agents_status"]["government_analysis_ai"] = "failed"
         return state
     
-    image_bytes = state["image_bytes"]
-    img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-
     government_context = f"""
     EMERGENCY REPORT - GOVERNMENT RESPONSE TEAM
 
@@ -199,25 +234,28 @@ def government_analysis_ai_agent(state: EmergencyState) -> EmergencyState:
     Format as government emergency report with actionable recommendations.
     """
 
+    # Tokens go to the report's live stream as they arrive; the full text is kept for the database
+    on_token = lambda text: report_streams.publish_token(state["disaster_id"], "government_report", text)
     try:
-        response = gemini.invoke([
+        state["government_report"] = llm_gateway.stream([
             HumanMessage(
                 content=[
                     {"type": "text", "text": gov_prompt},
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{img_b64}"
+                            "url": state["image_data_url"]
                         }
                     }
                 ]
             )
-        ])
-        state["government_report"] = response.content
+        ], on_token, caller="government_analysis")
         state["agents_status"]["government_analysis_ai"] = "completed"
+        report_streams.publish(state["disaster_id"], "component_done", {"component": "government_report"})
         add_log_to_matrix(state, "✅ AI AGENT: Government Analysis - Report generated successfully", "ai_agent_government", "success")
     except Exception as e:
         state["government_report"] = f"Error generating government report: {str(e)}"
+        report_streams.publish(state["disaster_id"], "component_failed", {"component": "government_report", "error": str(e)})
         state["agents_status"]["government_analysis_ai"] = "failed"
         add_log_to_matrix(state, f"❌ AI AGENT: Government Analysis - Failed: {str(e)}", "ai_agent_government", "error")
     
@@ -232,9 +270,6 @@ def citizen_survival_ai_agent(state: EmergencyState) -> EmergencyState:
         state["agents_status"]["citizen_survival_ai"] = "failed"
         return state
     
-    image_bytes = state["image_bytes"]
-    img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-
     citizen_context = f"""
     EMERGENCY SITUATION:
     TYPE: {state['emergencyType']}
@@ -242,9 +277,21 @@ def citizen_survival_ai_agent(state: EmergencyState) -> EmergencyState:
     WEATHER: {state['weather'].get('current_weather', {})}
     """
 
+    # A template was already shown to the citizen; this run personalises it for the report
+    refinement = f"""
+    GENERAL GUIDE ALREADY SHOWN TO THE CITIZEN:
+    {state['guide_template']}
+
+    REPORTED SITUATION: {state['situation']}
+    PEOPLE AFFECTED: {state['peopleCount']}
+
+    Rewrite the general guide for this specific report, keeping its structure. Use the situation,
+    the photo and the exact weather; drop advice that does not apply and add what is missing.
+    """ if state.get("guide_template") else ""
+
     citizen_prompt = f"""
     {citizen_context}
-
+    {refinement}
     Provide CONCISE SURVIVAL INSTRUCTIONS for {state['emergencyType']} disaster. Keep each point brief and specific:
 
     1. IMMEDIATE ACTIONS (next 30 minutes)
@@ -266,25 +313,28 @@ def citizen_survival_ai_agent(state: EmergencyState) -> EmergencyState:
     Use bullet points. Keep each point to 1-2 sentences maximum. Focus on actionable, specific guidance for {state['emergencyType']} in current conditions.
     """
 
+    on_token = lambda text: report_streams.publish_token(state["disaster_id"], "citizen_survival_guide", text)
     try:
-        response = gemini.invoke([
+        state["citizen_survival_guide"] = llm_gateway.stream([
             HumanMessage(
                 content=[
                     {"type": "text", "text": citizen_prompt},
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{img_b64}"
+                            "url": state["image_data_url"]
                         }
                     }
                 ]
             )
-        ])
-        state["citizen_survival_guide"] = response.content
+        ], on_token, caller="citizen_survival")
         state["agents_status"]["citizen_survival_ai"] = "completed"
+        report_streams.publish(state["disaster_id"], "component_done", {"component": "citizen_survival_guide"})
         add_log_to_matrix(state, "✅ AI AGENT: Citizen Survival - Guide generated successfully", "ai_agent_citizen", "success")
     except Exception as e:
-        state["citizen_survival_guide"] = f"Error generating citizen guide: {str(e)}"
+        # A failed refinement leaves the citizen with the template they already have
+        state["citizen_survival_guide"] = state.get("guide_template") or f"Error generating citizen guide: {str(e)}"
+        report_streams.publish(state["disaster_id"], "component_failed", {"component": "citizen_survival_guide", "error": str(e)})
         state["agents_status"]["citizen_survival_ai"] = "failed"
         add_log_to_matrix(state, f"❌ AI AGENT: Citizen Survival - Failed: {str(e)}", "ai_agent_citizen", "error")
     
@@ -294,8 +344,9 @@ def computer_vision_analysis_tool(state: EmergencyState) -> EmergencyState:
     add_log_to_matrix(state, "🔧 DATA TOOL: Computer Vision - Processing image with CNN/YOLO models...", "data_tool_computer_vision", "info")
     
     try:
-        image_bytes = state["image_bytes"]
-        cnn_result = analyze_image_with_summary(BytesIO(image_bytes), disaster_model, yolo_model, device)
+        # All photos of the report go through the models as one batch
+        images = state.get("images") or [state["image_bytes"]]
+        cnn_result = analyze_images_with_summary([BytesIO(item) for item in images], disaster_model, yolo_model, device)
         state["cnn_result"] = cnn_result
         state["agents_status"]["computer_vision_tool"] = "completed"
         add_log_to_matrix(state, f"✅ DATA TOOL: Computer Vision - Analysis completed: {cnn_result[:100]}...", "data_tool_computer_vision", "success")
@@ -322,6 +373,12 @@ def weather_data_collection_tool(state: EmergencyState) -> EmergencyState:
         state["weather"] = {"error": str(e)}
         state["agents_status"]["weather_data_tool"] = "failed"
         add_log_to_matrix(state, f"❌ DATA TOOL: Weather Collection - Failed: {str(e)}", "data_tool_weather", "error")
+
+    # The weather completes the template key, so the citizen gets guidance now rather than after the AI stage
+    state["guide_template"] = guide_templates.get(state["emergencyType"], state["weather"], lon)
+    if state["guide_template"]:
+        report_streams.publish_template(state["disaster_id"], "citizen_survival_guide", state["guide_template"])
+        add_log_to_matrix(state, "📄 DATA TOOL: Weather Collection - Survival guide template sent to citizen", "data_tool_weather", "success")
     return state
 
 def disaster_history_collection_tool(state: EmergencyState) -> EmergencyState:
@@ -369,6 +426,71 @@ def disaster_history_collection_tool(state: EmergencyState) -> EmergencyState:
     
     return state
 
+def component_state(state: EmergencyState) -> EmergencyState:
+    """Copy of the state for one component, with its own status dict and log list."""
+    return {**state, "agents_status": dict(state["agents_status"]), "ai_matrix_logs": []}
+
+def stage_timeout(state: EmergencyState, stage_limit: float) -> float:
+    """Seconds a stage may wait: its own limit, capped by what is left of the report SLO."""
+    remaining = state.get("deadline", time.time() + stage_limit) - time.time()
+    return max(0.0, min(stage_limit, remaining))
+
+def register_late_component(disaster_id: str, component: str, future):
+    with late_components_lock:
+        late_components.setdefault(disaster_id, {})[component] = future
+
+def discard_late_components(disaster_id: str):
+    """Forget the late agents of a report that will not be saved."""
+    with late_components_lock:
+        late_components.pop(disaster_id, None)
+
+def after_vision(state: EmergencyState, vision, agent) -> Future:
+    """Future of an AI agent that starts once a late computer vision pass has finished.
+
+    The agent is submitted from the vision future's callback, so no worker waits on it.
+    """
+    chained = Future()
+
+    def relay(run):
+        if run.exception() is not None:
+            chained.set_exception(run.exception())
+        else:
+            chained.set_result(run.result())
+
+    def start(done):
+        try:
+            result = done.result()
+            if result["agents_status"]["computer_vision_tool"] != "completed":
+                raise RuntimeError("computer vision analysis failed")
+            agent_state = component_state(state)
+            agent_state["cnn_result"] = result["cnn_result"]
+            agent_state["agents_status"]["computer_vision_tool"] = "completed"
+            agent_executor.submit(agent, agent_state).add_done_callback(relay)
+        except Exception as e:
+            chained.set_exception(e)
+
+    vision.add_done_callback(start)
+    return chained
+
+def collect_stage_results(state: EmergencyState, futures: dict, timeout: float, output_keys: dict, coordinator: str) -> dict:
+    """Wait up to `timeout` for the stage futures and merge the finished ones into the state.
+
+    Returns the futures that missed the deadline, keyed by component name.
+    """
+    done, _ = wait(futures.values(), timeout=timeout)
+    late = {}
+    for component, future in futures.items():
+        if future not in done:
+            late[component] = future
+            continue
+        result = future.result()
+        state[output_keys[component]] = result[output_keys[component]]
+        state["agents_status"][component] = result["agents_status"][component]
+        state["ai_matrix_logs"].extend(result.get("ai_matrix_logs", []))
+    if late:
+        add_log_to_matrix(state, f"⏰ SYSTEM COORDINATOR: Stage deadline ({timeout:.1f}s) reached - late components: {', '.join(late)}", coordinator, "warning")
+    return late
+
 def parallel_data_collection_coordinator(state: EmergencyState) -> EmergencyState:
     add_log_to_matrix(state, "🔄 SYSTEM COORDINATOR: Data Collection - Starting parallel data collection...", "system_coordinator_data", "info")
     
@@ -379,31 +501,43 @@ def parallel_data_collection_coordinator(state: EmergencyState) -> EmergencyStat
         "government_analysis_ai": "pending",
         "citizen_survival_ai": "pending"
     }
+    state.setdefault("pending_components", [])
     
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        cv_future = executor.submit(computer_vision_analysis_tool, state.copy())
-        weather_future = executor.submit(weather_data_collection_tool, state.copy())
-        disaster_future = executor.submit(disaster_history_collection_tool, state.copy())
-        
-        cv_result = cv_future.result()
-        weather_result = weather_future.result()
-        disaster_result = disaster_future.result()
-        
-        state["cnn_result"] = cv_result["cnn_result"]
-        state["weather"] = weather_result["weather"]
-        state["gdac_disasters"] = disaster_result["gdac_disasters"]
-        state["agents_status"]["computer_vision_tool"] = cv_result["agents_status"]["computer_vision_tool"]
-        state["agents_status"]["weather_data_tool"] = weather_result["agents_status"]["weather_data_tool"]
-        state["agents_status"]["disaster_history_tool"] = disaster_result["agents_status"]["disaster_history_tool"]
-        
-        if "ai_matrix_logs" in cv_result:
-            state["ai_matrix_logs"].extend(cv_result["ai_matrix_logs"])
-        if "ai_matrix_logs" in weather_result:
-            state["ai_matrix_logs"].extend(weather_result["ai_matrix_logs"])
-        if "ai_matrix_logs" in disaster_result:
-            state["ai_matrix_logs"].extend(disaster_result["ai_matrix_logs"])
-    
-    state["parallel_tasks_completed"] = True
+    vision_deadline = time.time() + COMPUTER_VISION_TIMEOUT
+    vision = agent_executor.submit(computer_vision_analysis_tool, component_state(state))
+    futures = {
+        "weather_data_tool": agent_executor.submit(weather_data_collection_tool, component_state(state)),
+        "disaster_history_tool": agent_executor.submit(disaster_history_collection_tool, component_state(state)),
+    }
+    output_keys = {
+        "computer_vision_tool": "cnn_result",
+        "weather_data_tool": "weather",
+        "disaster_history_tool": "gdac_disasters",
+    }
+    late = collect_stage_results(state, futures, stage_timeout(state, DATA_COLLECTION_TIMEOUT), output_keys, "system_coordinator_data")
+    late_vision = collect_stage_results(state, {"computer_vision_tool": vision}, max(0.0, vision_deadline - time.time()), output_keys, "system_coordinator_data")
+
+    # Late data sources only feed the AI agents, so they are dropped rather than backfilled
+    for component in late:
+        state["agents_status"][component] = "timeout"
+    if "weather_data_tool" in late:
+        state["weather"] = {"error": "Weather data not ready before deadline"}
+    else:
+        state["guide_template"] = futures["weather_data_tool"].result().get("guide_template")
+    if "disaster_history_tool" in late:
+        state["gdac_disasters"] = {"error": "Disaster history not ready before deadline"}
+
+    # A late vision pass is still awaited: the AI agents are chained onto it and backfilled
+    if late_vision:
+        state["agents_status"]["computer_vision_tool"] = "pending"
+        if state.get("guide_template"):
+            state["citizen_survival_guide"] = state["guide_template"]
+        for component, agent in [("government_analysis_ai", government_analysis_ai_agent), ("citizen_survival_ai", citizen_survival_ai_agent)]:
+            state["agents_status"][component] = "pending"
+            state["pending_components"].append(component)
+            register_late_component(state["disaster_id"], component, after_vision(state, vision, agent))
+    
+    state["parallel_tasks_completed"] = not late and not late_vision
     add_log_to_matrix(state, "✅ SYSTEM COORDINATOR: Data Collection - All data collection tasks completed", "system_coordinator_data", "success")
     return state
 
@@ -424,26 +558,35 @@ def data_validation_coordinator(state: EmergencyState) -> EmergencyState:
 def parallel_ai_analysis_coordinator(state: EmergencyState) -> EmergencyState:
     add_log_to_matrix(state, "🔄 SYSTEM COORDINATOR: AI Analysis - Starting parallel AI agent analysis...", "system_coordinator_ai_analysis", "info")
     
+    if state["agents_status"].get("computer_vision_tool") == "pending":
+        add_log_to_matrix(state, "⏳ SYSTEM COORDINATOR: AI Analysis - Waiting for computer vision; agents will be backfilled", "system_coordinator_ai_analysis", "warning")
+        return state
+
     if not state.get("analysis_ready", False):
         add_log_to_matrix(state, "❌ SYSTEM COORDINATOR: AI Analysis - Cannot proceed: data validation failed", "system_coordinator_ai_analysis", "error")
         return state
     
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        gov_future = executor.submit(government_analysis_ai_agent, state.copy())
-        citizen_future = executor.submit(citizen_survival_ai_agent, state.copy())
-        
-        gov_result = gov_future.result()
-        citizen_result = citizen_future.result()
-        
-        state["government_report"] = gov_result["government_report"]
-        state["citizen_survival_guide"] = citizen_result["citizen_survival_guide"]
-        state["agents_status"]["government_analysis_ai"] = gov_result["agents_status"]["government_analysis_ai"]
-        state["agents_status"]["citizen_survival_ai"] = citizen_result["agents_status"]["citizen_survival_ai"]
-        
-        if "ai_matrix_logs" in gov_result:
-            state["ai_matrix_logs"].extend(gov_result["ai_matrix_logs"])
-        if "ai_matrix_logs" in citizen_result:
-            state["ai_matrix_logs"].extend(citizen_result["ai_matrix_logs"])
+    futures = {
+        "government_analysis_ai": agent_executor.submit(government_analysis_ai_agent, component_state(state)),
+    }
+    refinement = None
+    if state.get("guide_template"):
+        # The template is saved as the guide; a personalised one is backfilled over it when ready
+        state["citizen_survival_guide"] = state["guide_template"]
+        state["agents_status"]["citizen_survival_ai"] = "completed"
+        if GUIDE_REFINEMENT:
+            refinement = agent_executor.submit(citizen_survival_ai_agent, component_state(state))
+    else:
+        futures["citizen_survival_ai"] = agent_executor.submit(citizen_survival_ai_agent, component_state(state))
+    late = collect_stage_results(state, futures, stage_timeout(state, AI_ANALYSIS_TIMEOUT), BACKFILL_FIELDS, "system_coordinator_ai_analysis")
+    if refinement is not None:
+        late["citizen_survival_ai"] = refinement
+
+    # Late agents keep running; their output is patched onto the saved disaster later
+    for component, future in late.items():
+        state["agents_status"][component] = "pending"
+        state["pending_components"].append(component)
+        register_late_component(state["disaster_id"], component, future)
     
     add_log_to_matrix(state, "✅ SYSTEM COORDINATOR: AI Analysis - All AI agent analysis tasks completed", "system_coordinator_ai_analysis", "success")
     return state
@@ -455,11 +598,17 @@ def final_system_coordinator(state: EmergencyState) -> EmergencyState:
     total_components = len(state["agents_status"])
     
     add_log_to_matrix(state, f"📊 Processing Summary: {completed_components}/{total_components} components completed successfully", "system_coordinator_final", "info")
+    if state.get("pending_components"):
+        add_log_to_matrix(state, f"⏳ Pending components (will be backfilled): {', '.join(state['pending_components'])}", "system_coordinator_final", "info")
     
     critical_tools = ["computer_vision_tool"]
     critical_success = all(state["agents_status"].get(tool) == "completed" for tool in critical_tools)
     
-    if critical_success and completed_components >= len(critical_tools):
+    if any(state["agents_status"].get(tool) == "pending" for tool in critical_tools):
+        # Neither accepted nor rejected until the late analysis is backfilled
+        state["status"] = "pending"
+        add_log_to_matrix(state, "⏳ SYSTEM COORDINATOR: Final Processing - Emergency response PENDING computer vision", "system_coordinator_final", "warning")
+    elif critical_success and completed_components >= len(critical_tools):
         state["status"] = "accepted"
         add_log_to_matrix(state, "✅ SYSTEM COORDINATOR: Final Processing - Emergency response ACCEPTED", "system_coordinator_final", "success")
     else:
@@ -489,6 +638,23 @@ def create_multiagent_emergency_graph():
 
 multiagent_graph = create_multiagent_emergency_graph()
 
+async def read_report_image(image) -> bytes:
+    # Fix: Handle different types of image objects
+    if hasattr(image, 'read'):
+        # If it's a file-like object (FastAPI UploadFile, etc.): bounded, validated read
+        image_bytes, _ = await read_image_upload(image)
+        return image_bytes
+    elif hasattr(image, 'file'):
+        # If it's a form file object
+        return image.file.read()
+    elif isinstance(image, bytes):
+        # If it's already bytes
+        return image
+    else:
+        # Try to read as file
+        with open(image, 'rb') as f:
+            return f.read()
+
 async def handle_emergency_report(
     emergencyType,
     urgencyLevel,
@@ -497,8 +663,43 @@ async def handle_emergency_report(
     latitude,
     longitude,
     image,
-    user
+    user,
+    images=None,
+    disaster_id=None
 ):
+    """Process a report and publish its outcome to the report's live stream.
+
+    Callers that return the disaster_id before processing (so clients can follow
+    the stream) generate it and open the stream themselves.
+    """
+    disaster_id = disaster_id or generate_geohash_date_uuid(latitude, longitude)
+    if report_streams.owner(disaster_id) is None:
+        report_streams.open(disaster_id, getattr(user, 'uid', 'anonymous'), time.time())
+    try:
+        result = await process_emergency_report(
+            emergencyType, urgencyLevel, situation, peopleCount, latitude, longitude, image, user, images, disaster_id
+        )
+    except Exception as e:
+        report_streams.publish(disaster_id, "error", {"error": str(e)})
+        raise
+    if "error" in result:
+        report_streams.publish(disaster_id, "error", {"error": result["error"]})
+    elif result.get("duplicate"):
+        report_streams.publish(disaster_id, "duplicate", {
+            "disaster_id": result["disaster_id"],
+            "report_count": result["report_count"],
+            "government_report": result["government_report"],
+            "citizen_survival_guide": result["citizen_survival_guide"],
+        })
+    else:
+        # With components still pending, the backfill closes the stream once they land
+        summary = {"status": result["status"], "image_url": result["image_url"], "pending_components": result["pending_components"]}
+        report_streams.publish(disaster_id, "saved" if result["pending_components"] else "complete", summary)
+    return result
+
+
+async def process_emergency_report(emergencyType, urgencyLevel, situation, peopleCount, latitude, longitude,
+                                   image, user, images, disaster_id):
     print("🚨 MULTIAGENT EMERGENCY RESPONSE SYSTEM ACTIVATED 🚨")
     
     if image is None:
@@ -507,34 +708,74 @@ async def handle_emergency_report(
     submitted_time = time.time()
     ai_processing_start_time = time.time()
     
-    disaster_id = generate_geohash_date_uuid(latitude, longitude)
     print(f"📋 Generated Disaster ID: {disaster_id}")
     
-    # Fix: Handle different types of image objects
     try:
-        if hasattr(image, 'read'):
-            # If it's a file-like object (FastAPI UploadFile, etc.)
-            image_bytes = await image.read()
-        elif hasattr(image, 'file'):
-            # If it's a form file object
-            image_bytes = image.file.read()
-        elif isinstance(image, bytes):
-            # If it's already bytes
-            image_bytes = image
-        else:
-            # Try to read as file
-            with open(image, 'rb') as f:
-                image_bytes = f.read()
+        image_list = [await read_report_image(item) for item in [image] + list(images or [])]
+    except ImageUploadError as e:
+        print(f"Rejected image upload: {str(e)}")
+        return {"error": str(e)}
     except Exception as e:
         print(f"Error reading image: {str(e)}")
         return {"error": f"Failed to read image: {str(e)}"}
-    
-    print("📤 Uploading image to Appwrite Storage...")
-    image_url = upload_disaster_image_to_storage(image_bytes, disaster_id)
+    # The first photo identifies the report for deduplication and listings
+    image_bytes = image_list[0]
+
+    # Decoding is CPU work; off the event loop so a report surge does not stall other requests
+    image_phash = await run_in_threadpool(dhash, image_bytes) or ""
+    user_id = getattr(user, 'uid', 'anonymous')
+    deduplicate = REPORT_DEDUP and bool(image_phash)
+    if deduplicate:
+        try:
+            location = (float(latitude), float(longitude))
+        except (TypeError, ValueError):
+            deduplicate = False
+    if deduplicate:
+        # Runs off the event loop: a duplicate may wait for the original report's analysis
+        duplicate = await run_in_threadpool(
+            report_deduplicator.find_duplicate,
+            disaster_id, emergencyType, location[0], location[1], image_phash, submitted_time, user_id
+        )
+        if duplicate is not None:
+            analysis = duplicate["analysis"]
+            print(f"♻️ Report matches disaster {duplicate['disaster_id']}; reusing its analysis")
+            return {
+                "disaster_id": duplicate["disaster_id"],
+                "duplicate": True,
+                "report_count": duplicate["report_count"],
+                "government_report": analysis.get("government_report", ""),
+                "citizen_survival_guide": analysis.get("citizen_survival_guide", ""),
+                "processing_time": time.time() - ai_processing_start_time,
+                "image_url": analysis.get("image_url", ""),
+                "status": analysis.get("status", "pending"),
+                "agents_status": {},
+                "pending_components": analysis.get("pending_components") or [],
+                "ai_matrix_saved": False
+            }
+
+    try:
+        # The graph blocks for seconds; keep the event loop free for streams and other requests
+        return await run_in_threadpool(
+            run_emergency_pipeline,
+            disaster_id, image_list, image_phash, emergencyType, urgencyLevel, situation,
+            peopleCount, latitude, longitude, user_id, submitted_time, ai_processing_start_time
+        )
+    finally:
+        # Waiting duplicates need an answer even if this report failed before being saved
+        if deduplicate:
+            report_deduplicator.abandon(disaster_id)
+
+
+def run_emergency_pipeline(disaster_id, image_list, image_phash, emergencyType, urgencyLevel, situation,
+                                 peopleCount, latitude, longitude, user_id, submitted_time, ai_processing_start_time):
+    image_bytes = image_list[0]
+    print(f"📤 Uploading {len(image_list)} image(s) to Appwrite Storage...")
+    image_uploads = [upload_executor.submit(upload_disaster_image_to_storage, item, disaster_id) for item in image_list]
 
-    # Rest of the function remains the same...
     initial_state: EmergencyState = {
+        "disaster_id": disaster_id,
         "image_bytes": image_bytes,
+        "images": image_list,
         "emergencyType": emergencyType,
         "urgencyLevel": urgencyLevel,
         "situation": situation,
@@ -546,37 +787,64 @@ async def handle_emergency_report(
         "gdac_disasters": {},
         "government_report": "",
         "citizen_survival_guide": "",
-        "user_id": getattr(user, 'uid', 'anonymous'),
+        "user_id": user_id,
         "submitted_time": submitted_time,
         "ai_processing_start_time": ai_processing_start_time,
         "ai_processing_end_time": 0,
         "status": "pending",
-        "image_url": image_url,
+        "image_url": "",
         "agents_status": {},
         "parallel_tasks_completed": False,
         "analysis_ready": False,
-        "ai_matrix_logs": []  
+        "ai_matrix_logs": [],
+        "deadline": ai_processing_start_time + REPORT_LATENCY_SLO,
+        "pending_components": [],
+        "image_phash": image_phash,
+        "guide_template": "",
+        # Encoded once here instead of once per Gemini agent
+        "image_data_url": image_data_url(image_bytes if len(image_list) == 1 else make_collage(image_list))
     }
 
     add_log_to_matrix(initial_state, "🚨 MULTIAGENT EMERGENCY RESPONSE SYSTEM ACTIVATED 🚨", "system", "info")
     add_log_to_matrix(initial_state, f"📋 Generated Disaster ID: {disaster_id}", "system", "info")
+    add_log_to_matrix(initial_state, f"📦 Images: {len(image_list)}, {sum(len(item) for item in image_list) / 1024:.0f} KB", "system", "info")
     
-    final_state = multiagent_graph.invoke(initial_state)
-    
-    ai_processing_end_time = time.time()
-    final_state["ai_processing_end_time"] = ai_processing_end_time
-    
-    processing_time = ai_processing_end_time - ai_processing_start_time
-    
-    add_log_to_matrix(final_state, f"⏱️ Total Processing Time: {processing_time:.2f} seconds", "system", "info")
-    
-    add_log_to_matrix(final_state, "💾 Saving to Appwrite Database...", "system", "info")
-    save_success = save_disaster_to_database(final_state, disaster_id, processing_time)
+    try:
+        final_state = multiagent_graph.invoke(initial_state)
+        image_urls = [upload.result() for upload in image_uploads]
+        image_url = image_urls[0]
+        final_state["image_url"] = image_url
+        final_state["image_urls"] = [url for url in image_urls if url]
+
+        ai_processing_end_time = time.time()
+        final_state["ai_processing_end_time"] = ai_processing_end_time
+        
+        processing_time = ai_processing_end_time - ai_processing_start_time
+        
+        add_log_to_matrix(final_state, f"⏱️ Total Processing Time: {processing_time:.2f} seconds", "system", "info")
+        
+        add_log_to_matrix(final_state, "💾 Saving to Appwrite Database...", "system", "info")
+        save_success = save_disaster_to_database(final_state, disaster_id, processing_time)
+    except Exception:
+        discard_late_components(disaster_id)
+        raise
     
     if not save_success:
+        discard_late_components(disaster_id)
         add_log_to_matrix(final_state, "❌ Failed to save disaster report to database", "system", "error")
         return {"error": "Failed to save disaster report to database"}
 
+    report_deduplicator.complete(disaster_id, final_state)
+
+    if image_url:
+        backfill_executor.submit(store_image_variants, disaster_id, image_bytes)
+
+    if final_state["pending_components"]:
+        backfill_pending_components(disaster_id, list(final_state["pending_components"]))
+
+    if TASK_PREGENERATION and final_state["status"] == "accepted":
+        backfill_executor.submit(pregenerate_task_draft, disaster_id)
+
     add_log_to_matrix(final_state, "💾 Saving AI Matrix logs to database...", "system", "info")
     ai_matrix_success = save_ai_matrix_to_appwrite(final_state, disaster_id)
     
@@ -593,20 +861,36 @@ async def handle_emergency_report(
         "citizen_survival_guide": final_state["citizen_survival_guide"],
         "processing_time": processing_time,
         "image_url": image_url,
+        "image_urls": final_state["image_urls"],
         "status": final_state["status"],
         "agents_status": final_state["agents_status"],  
+        "pending_components": final_state["pending_components"],
         "ai_matrix_saved": ai_matrix_success  
     }
 def upload_disaster_image_to_storage(image_bytes: bytes, disaster_id: str) -> str:
     try:
-        return appwrite_service.upload_disaster_image_to_storage(
-            image_bytes=image_bytes,
-            disaster_id=disaster_id
-        )
+        return image_store.store(image_bytes, disaster_id)
     except Exception as e:
         print(f"Error uploading image: {str(e)}")
         return ""
 
+def store_image_variants(disaster_id: str, image_bytes: bytes):
+    """Upload downscaled copies of the report image and patch their URLs onto the disaster."""
+    image_format, _ = variant_format()
+    patch = {}
+    for field, max_side in IMAGE_VARIANTS.items():
+        try:
+            patch[field] = image_store.store(make_variant(image_bytes, max_side), disaster_id, image_format=image_format)
+        except Exception as e:
+            print(f"Error creating {field} for disaster {disaster_id}: {str(e)}")
+    if not patch:
+        return
+    try:
+        appwrite_service.update_disaster_document(disaster_id, patch)
+        print(f"Stored image variants for disaster {disaster_id}")
+    except Exception as e:
+        print(f"Error saving image variants for disaster {disaster_id}: {str(e)}")
+
 def save_disaster_to_database(state: EmergencyState, disaster_id: str, processing_time: float):
     try:
         disaster_data = {
@@ -624,7 +908,11 @@ def save_disaster_to_database(state: EmergencyState, disaster_id: str, processin
             'ai_processing_time': float(processing_time),
             'status': "pending",
             'image_url': state['image_url'],
-            'geohash': pgh.encode(float(state['latitude']), float(state['longitude']), precision=4)
+            'image_urls': state.get('image_urls', []),
+            'pending_components': state.get('pending_components', []),
+            'geohash': pgh.encode(float(state['latitude']), float(state['longitude']), precision=4),
+            'image_phash': state.get('image_phash', ''),
+            'report_count': 1
         }
         appwrite_service.save_disaster_to_database(disaster_data)
         print(f"Disaster {disaster_id} saved to Appwrite Database")
@@ -634,6 +922,60 @@ def save_disaster_to_database(state: EmergencyState, disaster_id: str, processin
         return False
     
 
+def backfill_pending_components(disaster_id: str, pending: list):
+    """Patch the output of agents that missed the report deadline onto the saved disaster.
+
+    Returns at once: each late agent patches its field from its future's done
+    callback, and a timer gives up on whatever is still pending after
+    BACKFILL_TIMEOUT. No worker is held while the agents run.
+    """
+    with late_components_lock:
+        futures = late_components.pop(disaster_id, {})
+    remaining = list(pending)
+    # Reentrant: the last patch finishes the backfill while still holding it
+    lock = threading.RLock()
+    closed = []
+
+    def finish():
+        with lock:
+            if closed:
+                return
+            closed.append(True)
+            still_pending = list(remaining)
+        timer.cancel()
+        if still_pending:
+            print(f"Backfill for disaster {disaster_id} timed out; still pending: {', '.join(still_pending)}")
+        report_streams.publish(disaster_id, "complete", {"pending_components": still_pending})
+
+    def patch_component(component: str, future):
+        field = BACKFILL_FIELDS[component]
+        # Patches are written one at a time so pending_components only ever shrinks
+        with lock:
+            if closed:
+                return
+            remaining.remove(component)
+            try:
+                result = future.result()
+                patch = {field: result[field], 'pending_components': list(remaining)}
+            except Exception as e:
+                patch = {field: f"Error generating {field}: {str(e)}", 'pending_components': list(remaining)}
+            try:
+                appwrite_service.update_disaster_document(disaster_id, patch)
+                report_deduplicator.update_analysis(disaster_id, patch)
+                print(f"Backfilled {component} for disaster {disaster_id}")
+            except Exception as e:
+                print(f"Error backfilling {component} for disaster {disaster_id}: {str(e)}")
+            if not remaining:
+                finish()
+
+    timer = threading.Timer(BACKFILL_TIMEOUT, finish)
+    timer.daemon = True
+    timer.start()
+    for component, future in futures.items():
+        future.add_done_callback(lambda done, component=component: patch_component(component, done))
+    if not futures:
+        finish()
+
 def save_ai_matrix_to_appwrite(state: EmergencyState, disaster_id: str):
     try:
         total_components = len(state["agents_status"])
@@ -0,0 +1,37 @@
+import math
+import pygeohash as pgh
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_block(geohash: str, rings: int = 1) -> list:
+    """Cells within `rings` steps of geohash (the cell itself plus its neighbours)."""
+    row = [geohash]
+    west = east = geohash
+    for _ in range(rings):
+        try:
+            west = pgh.get_adjacent(west, "left")
+            east = pgh.get_adjacent(east, "right")
+        except Exception:
+            break
+        row = [west] + row + [east]
+    cells = list(row)
+    north = south = row
+    for _ in range(rings):
+        try:
+            north = [pgh.get_adjacent(cell, "top") for cell in north]
+            south = [pgh.get_adjacent(cell, "bottom") for cell in south]
+        except Exception:
+            # No cells beyond the poles
+            break
+        cells.extend(north + south)
+    return list(dict.fromkeys(cells))
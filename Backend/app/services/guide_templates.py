@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from langchain_core.messages import HumanMessage
+from app.services.llm_gateway import llm_gateway, TokenBucket
+from typing import Optional, Tuple
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GUIDE_TEMPLATES = os.getenv("GUIDE_TEMPLATES", "true").lower() == "true"
+# Follow a served template with a guide personalised to the report, patched in when ready
+GUIDE_REFINEMENT = os.getenv("GUIDE_REFINEMENT", "true").lower() == "true"
+# Templates older than this (seconds) are regenerated in the background; stale ones are still served meanwhile
+GUIDE_TEMPLATE_TTL = float(os.getenv("GUIDE_TEMPLATE_TTL", "21600"))
+GUIDE_TEMPLATE_REFRESH_INTERVAL = float(os.getenv("GUIDE_TEMPLATE_REFRESH_INTERVAL", "600"))
+GUIDE_TEMPLATE_WORKERS = int(os.getenv("GUIDE_TEMPLATE_WORKERS", "1"))
+# Templates share the Gemini quota with live reports, so they get a small budget of their own
+GUIDE_TEMPLATE_CALLS_PER_MINUTE = float(os.getenv("GUIDE_TEMPLATE_CALLS_PER_MINUTE", "6"))
+# Generate every template at startup instead of on first use (costs one call per combination)
+GUIDE_TEMPLATE_PREWARM = os.getenv("GUIDE_TEMPLATE_PREWARM", "false").lower() == "true"
+# Emergency types with templates; reports of any other type always get a fully generated guide
+GUIDE_TEMPLATE_TYPES = [item.strip().lower() for item in os.getenv("GUIDE_TEMPLATE_TYPES", "fire,flood,earthquake,storm,other").split(",") if item.strip()]
+
+# Open-Meteo reports WMO weather codes; neighbouring codes call for the same guidance
+WEATHER_BUCKETS = {
+    "clear": {0, 1},
+    "cloudy": {2, 3},
+    "fog": {45, 48},
+    "rain": {51, 53, 55, 56, 57, 61, 63, 65, 66, 67, 80, 81, 82},
+    "snow": {71, 73, 75, 77, 85, 86},
+    "storm": {95, 96, 99},
+}
+UNKNOWN_WEATHER = "unknown"
+DAYPARTS = ["day", "night"]
+
+
+def weather_bucket(weather: dict) -> str:
+    """Coarse weather condition of an Open-Meteo response, or "unknown" if it has none."""
+    code = (weather or {}).get("current_weather", {}).get("weathercode")
+    for bucket, codes in WEATHER_BUCKETS.items():
+        if code in codes:
+            return bucket
+    return UNKNOWN_WEATHER
+
+
+def daypart(weather: dict, longitude) -> str:
+    """"day" or "night" from Open-Meteo's is_day flag, else from the approximate local solar time."""
+    is_day = (weather or {}).get("current_weather", {}).get("is_day")
+    if is_day is not None:
+        return "day" if is_day else "night"
+    try:
+        now = datetime.now(timezone.utc)
+        solar_hour = (now.hour + now.minute / 60 + float(longitude) / 15) % 24
+    except (TypeError, ValueError):
+        return "day"
+    return "day" if 6 <= solar_hour < 18 else "night"
+
+
+def template_key(emergency_type: str, weather: dict, longitude) -> Tuple[str, str, str]:
+    return str(emergency_type).strip().lower(), weather_bucket(weather), daypart(weather, longitude)
+
+
+def template_prompt(key: Tuple[str, str, str]) -> str:
+    emergency_type, bucket, part = key
+    conditions = "unknown weather" if bucket == UNKNOWN_WEATHER else f"{bucket} weather"
+    return f"""
+    Provide CONCISE SURVIVAL INSTRUCTIONS for a {emergency_type} disaster during the {part} in {conditions}.
+    They are shown to a citizen the moment they report the emergency, before anything else about
+    the report is known, so they must hold for any location. Keep each point brief and specific:
+
+    1. IMMEDIATE ACTIONS (next 30 minutes)
+    - List 3-5 critical safety steps
+    - Key hazards to avoid
+    - Best safe position/location
+
+    2. SITUATION PREDICTION (next 2-6 hours)
+    - Expected conditions changes
+    - Peak danger timeframe
+    - Key warning signs to monitor
+
+    3. SURVIVAL PRIORITIES
+    - Essential shelter requirements
+    - Water/food priorities
+    - Medical concerns specific to {emergency_type}
+    - Protection needed from elements
+
+    Use bullet points. Keep each point to 1-2 sentences maximum. Focus on actionable guidance for {emergency_type} in {conditions} at {part}.
+    """
+
+
+class GuideTemplateStore:
+    """Pre-generated survival guides keyed by (emergency type, weather bucket, day or night).
+
+    The citizen guide otherwise depends only on these plus the coordinates, so a
+    template can be shown the moment the report's weather is known. A lookup that
+    misses schedules its key so the next report of that kind gets a template, and
+    a refresher regenerates templates older than GUIDE_TEMPLATE_TTL that were
+    served since they were generated. Generation is paced by its own budget
+    (GUIDE_TEMPLATE_CALLS_PER_MINUTE) so it never crowds out live reports;
+    GUIDE_TEMPLATE_PREWARM queues every combination at startup.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.in_flight = set()
+        self.served = set()
+        self.budget = TokenBucket(GUIDE_TEMPLATE_CALLS_PER_MINUTE / 60, 1)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=GUIDE_TEMPLATE_WORKERS, thread_name_prefix="guide-template")
+        self.refresher = None
+        self.metrics = {"hits": 0, "stale_hits": 0, "misses": 0, "generated": 0, "failed": 0}
+
+    def get(self, emergency_type: str, weather: dict, longitude) -> Optional[str]:
+        """The template for a report, or None (a miss on a known type is generated for next time)."""
+        if not GUIDE_TEMPLATES:
+            return None
+        key = template_key(emergency_type, weather, longitude)
+        if key[0] not in GUIDE_TEMPLATE_TYPES:
+            return None
+        with self.lock:
+            entry = self.templates.get(key)
+            if entry is None:
+                self.metrics["misses"] += 1
+            elif time.time() - entry[1] > GUIDE_TEMPLATE_TTL:
+                self.metrics["stale_hits"] += 1
+            else:
+                self.metrics["hits"] += 1
+            if entry is not None:
+                self.served.add(key)
+        if entry is None or time.time() - entry[1] > GUIDE_TEMPLATE_TTL:
+            self.schedule(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key: Tuple[str, str, str]):
+        with self.lock:
+            if key in self.in_flight:
+                return
+            self.in_flight.add(key)
+        self.executor.submit(self.generate, key)
+
+    def generate(self, key: Tuple[str, str, str]):
+        try:
+            self.budget.acquire()
+            response = llm_gateway.invoke([HumanMessage(content=template_prompt(key))], caller="guide_template")
+            text = str(response.content).strip()
+            if not text:
+                raise ValueError("empty template")
+            with self.lock:
+                self.templates[key] = (text, time.time())
+                self.served.discard(key)
+                self.metrics["generated"] += 1
+        except Exception as e:
+            with self.lock:
+                self.metrics["failed"] += 1
+            print(f"Failed to generate survival guide template {'/'.join(key)}: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+
+    def warm(self):
+        """Start the background refresher, and queue every template if GUIDE_TEMPLATE_PREWARM is set."""
+        if not GUIDE_TEMPLATES:
+            return
+        with self.lock:
+            if self.refresher is None or not self.refresher.is_alive():
+                self.refresher = threading.Thread(target=self.refresh_loop, name="guide-template-refresh", daemon=True)
+                self.refresher.start()
+        if not GUIDE_TEMPLATE_PREWARM:
+            return
+        for emergency_type in GUIDE_TEMPLATE_TYPES:
+            for bucket in list(WEATHER_BUCKETS) + [UNKNOWN_WEATHER]:
+                for part in DAYPARTS:
+                    self.schedule((emergency_type, bucket, part))
+        print(f"Queued survival guide templates for {len(GUIDE_TEMPLATE_TYPES)} emergency types")
+
+    def refresh_loop(self):
+        while True:
+            time.sleep(GUIDE_TEMPLATE_REFRESH_INTERVAL)
+            now = time.time()
+            with self.lock:
+                # Templates nobody asked for are left stale; a lookup still schedules them
+                stale = [key for key, (_, generated_at) in self.templates.items()
+                         if key in self.served and now - generated_at > GUIDE_TEMPLATE_TTL]
+            for key in stale:
+                self.schedule(key)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            now = time.time()
+            lookups = self.metrics["hits"] + self.metrics["stale_hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "templates": len(self.templates),
+                "generating": len(self.in_flight),
+                "hit_rate": round((self.metrics["hits"] + self.metrics["stale_hits"]) / lookups, 3) if lookups else 0.0,
+                "oldest_seconds": round(max((now - generated_at for _, generated_at in self.templates.values()), default=0.0), 1),
+            }
+
+
+guide_templates = GuideTemplateStore()
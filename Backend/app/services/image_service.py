@@ -0,0 +1,192 @@
+from PIL import Image, ImageOps, features
+from io import BytesIO
+from typing import List, Optional, Tuple
+import base64
+import math
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DHASH_SIZE = 8
+# Longest side (pixels) of the downscaled copies served to listings and detail views
+IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "320"))
+IMAGE_MEDIUM_SIZE = int(os.getenv("IMAGE_MEDIUM_SIZE", "1280"))
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "webp").lower()
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+
+# Uploads larger than this many bytes or pixels are rejected before any analysis
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))
+# Photos per report; several are sent to Gemini as one collage of at most IMAGE_COLLAGE_SIZE pixels a side
+REPORT_MAX_IMAGES = int(os.getenv("REPORT_MAX_IMAGES", "6"))
+IMAGE_COLLAGE_SIZE = int(os.getenv("IMAGE_COLLAGE_SIZE", "1280"))
+IMAGE_UPLOAD_CHUNK_SIZE = int(os.getenv("IMAGE_UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+# MPO is how some phones label their JPEGs
+IMAGE_ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP"}
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "MPO": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+IMAGE_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp"}
+
+# Disaster document field for each variant
+IMAGE_VARIANTS = {
+    "thumbnail_url": IMAGE_THUMBNAIL_SIZE,
+    "medium_url": IMAGE_MEDIUM_SIZE,
+}
+
+
+upload_metrics = {"accepted": 0, "too_large": 0, "unsupported": 0, "bytes_accepted": 0, "largest_bytes": 0}
+upload_metrics_lock = threading.Lock()
+
+
+class ImageUploadError(Exception):
+    """An upload rejected before analysis; status_code is 413 (too large) or 415 (not a supported image)."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def count_upload(outcome: str, size: int = 0):
+    with upload_metrics_lock:
+        upload_metrics[outcome] += 1
+        if outcome == "accepted":
+            upload_metrics["bytes_accepted"] += size
+            upload_metrics["largest_bytes"] = max(upload_metrics["largest_bytes"], size)
+
+
+def inspect_image_header(header: bytes) -> dict:
+    """Format and dimensions of an image from its leading bytes, without decoding pixels."""
+    try:
+        with Image.open(BytesIO(header)) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise ImageUploadError(415, "Upload is not a readable image")
+    if image_format not in IMAGE_ALLOWED_FORMATS:
+        raise ImageUploadError(415, f"Unsupported image format {image_format}; use JPEG, PNG or WebP")
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageUploadError(413, f"Image is {width}x{height}; at most {IMAGE_MAX_PIXELS} pixels are accepted")
+    return {"format": image_format, "width": width, "height": height}
+
+
+def image_file_type(image_bytes: bytes, image_format: Optional[str] = None) -> Tuple[str, str]:
+    """File extension and MIME type of an image, from its format or else from its header."""
+    if image_format is None:
+        try:
+            image_format = inspect_image_header(image_bytes[:IMAGE_UPLOAD_CHUNK_SIZE])["format"]
+        except ImageUploadError:
+            image_format = "JPEG"
+    return IMAGE_EXTENSIONS.get(image_format, "jpg"), IMAGE_MIME_TYPES.get(image_format, "image/jpeg")
+
+
+async def read_image_upload(upload) -> Tuple[bytes, dict]:
+    """Read an UploadFile in chunks, enforcing IMAGE_MAX_BYTES and validating the header first.
+
+    The multipart body is already spooled to disk by the server, so at most
+    IMAGE_MAX_BYTES of it is ever held in memory here; anything that is not a
+    supported image is rejected after the first chunk.
+    """
+    try:
+        declared = getattr(upload, "size", None)
+        if declared is not None and declared > IMAGE_MAX_BYTES:
+            raise ImageUploadError(413, f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+        chunks = [await upload.read(IMAGE_UPLOAD_CHUNK_SIZE)]
+        info = inspect_image_header(chunks[0])
+        size = len(chunks[0])
+        while True:
+            chunk = await upload.read(IMAGE_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > IMAGE_MAX_BYTES:
+                raise ImageUploadError(413, f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+            chunks.append(chunk)
+    except ImageUploadError as e:
+        count_upload("too_large" if e.status_code == 413 else "unsupported")
+        raise
+    count_upload("accepted", size)
+    info["bytes"] = size
+    return b"".join(chunks), info
+
+
+def image_data_url(image_bytes: bytes) -> str:
+    """Base64 data URL of an image, labelled with its real MIME type."""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            mime_type = IMAGE_MIME_TYPES.get(image.format, "image/jpeg")
+    except Exception:
+        mime_type = "image/jpeg"
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+
+def get_upload_metrics() -> dict:
+    with upload_metrics_lock:
+        return dict(upload_metrics)
+
+
+def dhash(image_bytes: bytes, hash_size: int = DHASH_SIZE) -> Optional[str]:
+    """Difference hash of an image as a hex string, or None if it cannot be decoded.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and each bit
+    records whether a pixel is brighter than its right neighbour, so re-encoded,
+    resized or slightly reframed photos of the same scene get nearby hashes.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            # Grayscale JPEG decode at up to 1/8 scale; the hash only needs a few pixels
+            image.draft("L", (hash_size + 1, hash_size))
+            pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except Exception as e:
+        print(f"Could not hash image: {e}")
+        return None
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(first: str, second: str) -> int:
+    """Number of differing bits between two hex hashes of the same length."""
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+
+def variant_format() -> Tuple[str, str]:
+    """(PIL format, file extension) for variants; WebP falls back to JPEG if Pillow lacks it."""
+    if IMAGE_VARIANT_FORMAT == "webp" and features.check("webp"):
+        return "WEBP", "webp"
+    return "JPEG", "jpg"
+
+
+def make_variant(image_bytes: bytes, max_side: int) -> bytes:
+    """Re-encode an image so its longest side is at most max_side (never upscaled)."""
+    image_format, _ = variant_format()
+    with Image.open(BytesIO(image_bytes)) as image:
+        # JPEGs decode directly at a reduced scale, far cheaper than decoding full size
+        image.draft("RGB", (max_side, max_side))
+        # Phone photos carry their rotation in EXIF, which re-encoding would drop
+        variant = ImageOps.exif_transpose(image).convert("RGB")
+    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = BytesIO()
+    variant.save(output, format=image_format, quality=IMAGE_VARIANT_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def make_collage(images: List[bytes], max_side: int = IMAGE_COLLAGE_SIZE) -> bytes:
+    """Tile several photos into one JPEG grid no larger than max_side on either side."""
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    tile = max_side // columns
+    collage = Image.new("RGB", (columns * tile, rows * tile))
+    for position, image_bytes in enumerate(images):
+        with Image.open(BytesIO(image_bytes)) as image:
+            image.draft("RGB", (tile, tile))
+            photo = ImageOps.exif_transpose(image).convert("RGB")
+        photo.thumbnail((tile, tile), Image.LANCZOS)
+        row, column = divmod(position, columns)
+        collage.paste(photo, (column * tile + (tile - photo.width) // 2, row * tile + (tile - photo.height) // 2))
+    output = BytesIO()
+    collage.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
@@ -0,0 +1,104 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.image_service import image_file_type
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+import hashlib
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Content hashes remembered as already stored; a miss costs one metadata lookup
+IMAGE_INDEX_SIZE = int(os.getenv("IMAGE_INDEX_SIZE", "10000"))
+
+# Appwrite file IDs are limited to 36 characters; 36 hex digits keep 144 bits of SHA-256
+FILE_ID_LENGTH = 36
+
+appwrite_service = AppwriteService()
+
+
+def content_file_id(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()[:FILE_ID_LENGTH]
+
+
+class ImageStore:
+    """Content-addressed image uploads.
+
+    Every image is stored under a file ID derived from its SHA-256, so a photo that
+    was already uploaded (forwarded between users, resubmitted) is never transferred
+    again. Hashes known to be stored are kept in a bounded local index; concurrent
+    uploads of the same bytes share one transfer.
+    """
+
+    def __init__(self):
+        self.stored = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.metrics = {"uploads": 0, "index_hits": 0, "storage_hits": 0, "failures": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+    def remember(self, file_id: str, url: str):
+        # Caller holds self.lock
+        self.stored[file_id] = url
+        self.stored.move_to_end(file_id)
+        while len(self.stored) > IMAGE_INDEX_SIZE:
+            self.stored.popitem(last=False)
+
+    def store(self, image_bytes: bytes, disaster_id: str, image_format: Optional[str] = None) -> str:
+        """Return the URL of the image, uploading it only if its content is new.
+
+        The file is named and typed after image_format (a Pillow format name),
+        read from the image header when not given.
+        """
+        file_id = content_file_id(image_bytes)
+        with self.lock:
+            url = self.stored.get(file_id)
+            if url:
+                self.stored.move_to_end(file_id)
+                self.metrics["index_hits"] += 1
+                self.metrics["bytes_saved"] += len(image_bytes)
+                return url
+            future = self.in_flight.get(file_id)
+            owner = future is None
+            if owner:
+                future = self.in_flight[file_id] = Future()
+        if not owner:
+            url = future.result()
+            with self.lock:
+                self.metrics["bytes_saved"] += len(image_bytes)
+            return url
+
+        try:
+            if appwrite_service.storage_file_exists(file_id):
+                url = appwrite_service.get_file_url(file_id)
+                uploaded = False
+            else:
+                extension, mime_type = image_file_type(image_bytes, image_format)
+                url = appwrite_service.upload_disaster_image_to_storage(image_bytes, disaster_id, file_id=file_id, extension=extension, mime_type=mime_type)
+                uploaded = True
+        except Exception as e:
+            with self.lock:
+                self.in_flight.pop(file_id, None)
+                self.metrics["failures"] += 1
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            self.in_flight.pop(file_id, None)
+            self.remember(file_id, url)
+            if uploaded:
+                self.metrics["uploads"] += 1
+                self.metrics["bytes_uploaded"] += len(image_bytes)
+            else:
+                self.metrics["storage_hits"] += 1
+                self.metrics["bytes_saved"] += len(image_bytes)
+        future.set_result(url)
+        return url
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {**self.metrics, "indexed": len(self.stored), "in_flight": len(self.in_flight)}
+
+
+image_store = ImageStore()
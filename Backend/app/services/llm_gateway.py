@@ -0,0 +1,305 @@
+from langchain_google_genai import ChatGoogleGenerativeAI
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Provider errors worth retrying: quota, overload and transient network failures.
+# Classified on the HTTP status the Google client attaches, never on message text.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+try:
+    import httpx
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)
+except ImportError:
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a provider error is transient, judged from it and the errors it wraps."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, TRANSIENT_ERRORS):
+            return True
+        code = getattr(error, "code", None)
+        if isinstance(code, int) and not isinstance(code, bool):
+            return code in RETRYABLE_STATUS_CODES
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class LLMGatewayError(Exception):
+    """Raised when the gateway gives up on a call (rate limit wait, timeout or retries exhausted)."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_for = min(wait_for, remaining)
+            time.sleep(wait_for)
+
+
+class LLMGateway:
+    """Single entry point for Gemini calls.
+
+    Every call goes through a token-bucket rate limiter and a concurrency cap, is
+    retried with jittered exponential backoff on transient errors, and identical
+    in-flight requests are coalesced into one provider call. Latency, token usage
+    and error counts are recorded per caller.
+
+    Provider calls run on the gateway's own workers so the caller's timeout bounds
+    the whole call, not just the wait for capacity. A call abandoned at its deadline
+    keeps its concurrency slot until the provider returns (the client-wide
+    LLM_TIMEOUT still ends it), so the cap on calls in flight holds.
+    """
+
+    def __init__(self, model: str = LLM_MODEL):
+        self.llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            timeout=LLM_TIMEOUT,
+            max_retries=0
+        )
+        self.bucket = TokenBucket(LLM_REQUESTS_PER_SECOND, LLM_BURST)
+        self.slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+        # Never queues: every submitted call already holds one of the LLM_MAX_CONCURRENCY slots
+        self.provider_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-call")
+        self.in_flight: Dict[str, Future] = {}
+        self.in_flight_lock = threading.Lock()
+        self.metrics = defaultdict(lambda: {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "coalesced": 0,
+            "rate_limited": 0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+        })
+        self.metrics_lock = threading.Lock()
+
+    def invoke(self, messages, caller: str = "default", timeout: float = LLM_TIMEOUT, runnable=None) -> Any:
+        """Invoke the model (or `runnable`, e.g. a structured-output wrapper) with gateway policies applied."""
+        key = self._request_key(messages, runnable)
+        with self.in_flight_lock:
+            leader = self.in_flight.get(key)
+            if leader is None:
+                future = Future()
+                self.in_flight[key] = future
+        if leader is not None:
+            self._record(caller, coalesced=1)
+            try:
+                return leader.result(timeout=timeout)
+            except FuturesTimeoutError:
+                raise LLMGatewayError(f"Timed out waiting for coalesced LLM call after {timeout}s")
+
+        try:
+            result = self._call_with_retries(messages, caller, timeout, runnable or self.llm)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.pop(key, None)
+
+    def _call_with_retries(self, messages, caller: str, timeout: float, runnable) -> Any:
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            self._acquire_capacity(caller, deadline, timeout)
+            started = time.monotonic()
+            call = self.submit_call(runnable.invoke, messages)
+            call.add_done_callback(lambda _: self.slots.release())
+            try:
+                response = call.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                self._record(caller, calls=1, errors=1, latency=time.monotonic() - started)
+                raise LLMGatewayError(f"LLM call for {caller} did not finish within {timeout}s")
+            except Exception as e:
+                # The call has finished, so its slot is already free while we back off
+                retryable = is_retryable(e)
+                backoff = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)) * random.random()
+                if not retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    self._record(caller, calls=1, errors=1, latency=time.monotonic() - started)
+                    raise
+                attempt += 1
+                self._record(caller, retries=1)
+                print(f"LLM call for {caller} failed ({e}); retry {attempt}/{LLM_MAX_RETRIES} in {backoff:.2f}s")
+                time.sleep(backoff)
+                continue
+            tokens_in, tokens_out = self._usage(response)
+            self._record(caller, calls=1, latency=time.monotonic() - started, tokens_in=tokens_in, tokens_out=tokens_out)
+            return response
+
+    def stream(self, messages, on_token: Callable[[str], None], caller: str = "default", timeout: float = LLM_TIMEOUT) -> str:
+        """Stream the model's reply, passing each text chunk to on_token, and return the full text.
+
+        Rate limiting and the concurrency cap apply as for invoke(). Streams are not
+        coalesced, and a failure is only retried while nothing has been emitted yet.
+        """
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            self._acquire_capacity(caller, deadline, timeout)
+            started = time.monotonic()
+            chunks = queue.Queue()
+            cancelled = threading.Event()
+            pump = self.submit_call(self._pump, messages, chunks, cancelled)
+            pump.add_done_callback(lambda _: self.slots.release())
+            message = None
+            parts = []
+            try:
+                while True:
+                    try:
+                        kind, item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise LLMGatewayError(f"LLM stream did not finish within {timeout}s")
+                    if kind == "done":
+                        break
+                    if kind == "error":
+                        raise item
+                    message = item if message is None else message + item
+                    text = self._text(item.content)
+                    if text:
+                        parts.append(text)
+                        on_token(text)
+            except Exception as e:
+                cancelled.set()
+                retryable = is_retryable(e)
+                backoff = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)) * random.random()
+                if parts or not retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    self._record(caller, calls=1, errors=1, latency=time.monotonic() - started)
+                    raise
+                attempt += 1
+                self._record(caller, retries=1)
+                print(f"LLM stream for {caller} failed ({e}); retry {attempt}/{LLM_MAX_RETRIES} in {backoff:.2f}s")
+                time.sleep(backoff)
+                continue
+            tokens_in, tokens_out = self._usage(message)
+            self._record(caller, calls=1, latency=time.monotonic() - started, tokens_in=tokens_in, tokens_out=tokens_out)
+            return "".join(parts)
+
+    def submit_call(self, function, *args) -> Future:
+        # The caller holds a slot; give it back if the call never starts (e.g. during shutdown)
+        try:
+            return self.provider_executor.submit(function, *args)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _pump(self, messages, chunks: queue.Queue, cancelled: threading.Event):
+        # Runs on a provider worker; the reading caller enforces the deadline
+        try:
+            for chunk in self.llm.stream(messages):
+                if cancelled.is_set():
+                    return
+                chunks.put(("chunk", chunk))
+            chunks.put(("done", None))
+        except Exception as e:
+            chunks.put(("error", e))
+
+    def _acquire_capacity(self, caller: str, deadline: float, timeout: float):
+        if not self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._record(caller, errors=1, rate_limited=1)
+            raise LLMGatewayError(f"LLM rate limit: no capacity within {timeout}s")
+        if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._record(caller, errors=1, rate_limited=1)
+            raise LLMGatewayError(f"LLM concurrency limit: no free slot within {timeout}s")
+
+    @staticmethod
+    def _text(content) -> str:
+        # Gemini chunks carry either a string or a list of content parts
+        if isinstance(content, str):
+            return content
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
+
+    @staticmethod
+    def _request_key(messages, runnable) -> str:
+        payload = json.dumps(messages, default=str, sort_keys=True)
+        return hashlib.sha256(f"{id(runnable)}:{payload}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _usage(response) -> tuple:
+        # Structured-output runnables with include_raw return {"raw": AIMessage, ...}
+        message = response.get("raw") if isinstance(response, dict) else response
+        usage = getattr(message, "usage_metadata", None) or {}
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    def _record(self, caller: str, calls: int = 0, errors: int = 0, retries: int = 0, coalesced: int = 0,
+                rate_limited: int = 0, latency: float = 0.0, tokens_in: int = 0, tokens_out: int = 0):
+        with self.metrics_lock:
+            m = self.metrics[caller]
+            m["calls"] += calls
+            m["errors"] += errors
+            m["retries"] += retries
+            m["coalesced"] += coalesced
+            m["rate_limited"] += rate_limited
+            m["tokens_in"] += tokens_in
+            m["tokens_out"] += tokens_out
+            m["total_latency"] += latency
+            m["max_latency"] = max(m["max_latency"], latency)
+
+    def average_latency(self, caller: str) -> float:
+        with self.metrics_lock:
+            m = self.metrics.get(caller)
+            if not m or not m["calls"]:
+                return 0.0
+            return m["total_latency"] / m["calls"]
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self.metrics_lock:
+            snapshot = {}
+            for caller, m in self.metrics.items():
+                snapshot[caller] = {
+                    **m,
+                    "total_latency": round(m["total_latency"], 3),
+                    "max_latency": round(m["max_latency"], 3),
+                    "avg_latency": round(m["total_latency"] / m["calls"], 3) if m["calls"] else 0.0,
+                }
+            return snapshot
+
+
+llm_gateway = LLMGateway()
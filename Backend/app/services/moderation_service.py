@@ -0,0 +1,103 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.second_workflow import publish_first_task
+from app.services.notification_service import notification_outbox
+from app.services.report_dedup import report_deduplicator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
+import json
+import os
+import queue
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODERATION_BATCH_MAX = int(os.getenv("MODERATION_BATCH_MAX", "200"))
+# Status updates are cheap Appwrite writes; task generation may call Gemini and is kept narrower
+MODERATION_STATUS_WORKERS = int(os.getenv("MODERATION_STATUS_WORKERS", "16"))
+MODERATION_TASK_WORKERS = int(os.getenv("MODERATION_TASK_WORKERS", "4"))
+# Longest wait (seconds) for the next item to finish before the rest are reported as timed out
+MODERATION_RESULT_TIMEOUT = float(os.getenv("MODERATION_RESULT_TIMEOUT", "120"))
+
+appwrite_service = AppwriteService()
+status_executor = ThreadPoolExecutor(max_workers=MODERATION_STATUS_WORKERS, thread_name_prefix="moderation-status")
+task_executor = ThreadPoolExecutor(max_workers=MODERATION_TASK_WORKERS, thread_name_prefix="moderation-task")
+
+
+def unique_ids(disaster_ids: List[str]) -> List[str]:
+    return list(dict.fromkeys(disaster_id.strip() for disaster_id in disaster_ids if disaster_id.strip()))
+
+
+def accept_item(disaster_id: str, results: queue.Queue, started: float):
+    def finish(outcome: dict):
+        results.put({"disaster_id": disaster_id, **outcome, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    try:
+        disaster = appwrite_service.get_disaster(disaster_id)
+        if disaster.get("status") == "active":
+            finish({"status": "already_active"})
+            return
+        appwrite_service.update_disaster_status(disaster_id, "active")
+        notification_outbox.enqueue_disaster_alert(disaster_id, disaster)
+    except Exception as e:
+        finish({"status": "error", "error": str(e)})
+        return
+
+    def generate():
+        try:
+            finish({"status": "accepted", "task": publish_first_task(disaster_id, disaster)})
+        except Exception as e:
+            # The disaster is already active; only its first task is missing
+            finish({"status": "accepted", "task": "error", "error": str(e)})
+
+    task_executor.submit(generate)
+
+
+def reject_item(disaster_id: str, results: queue.Queue, started: float):
+    try:
+        appwrite_service.archive_disaster(disaster_id)
+        report_deduplicator.forget(disaster_id)
+        notification_outbox.forget(disaster_id)
+        outcome = {"status": "archived"}
+    except Exception as e:
+        outcome = {"status": "error", "error": str(e)}
+    results.put({"disaster_id": disaster_id, **outcome, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+
+def run_item(item_handler, disaster_id: str, results: queue.Queue, started: float):
+    # A handler that raises has not reported its item; report it so the stream does not wait for it
+    try:
+        item_handler(disaster_id, results, started)
+    except Exception as e:
+        results.put({"disaster_id": disaster_id, "status": "error", "error": str(e), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+
+def stream_batch(disaster_ids: List[str], item_handler) -> Iterator[str]:
+    """Run item_handler for every disaster concurrently and yield NDJSON lines as items finish.
+
+    Items still unfinished after MODERATION_RESULT_TIMEOUT without progress are
+    reported with status "timeout". The last line is a summary with the count of
+    each outcome status.
+    """
+    results = queue.Queue()
+    started = time.perf_counter()
+    for disaster_id in disaster_ids:
+        status_executor.submit(run_item, item_handler, disaster_id, results, started)
+    counts = {}
+    waiting = set(disaster_ids)
+    while waiting:
+        try:
+            result = results.get(timeout=MODERATION_RESULT_TIMEOUT)
+        except queue.Empty:
+            for disaster_id in disaster_ids:
+                if disaster_id in waiting:
+                    counts["timeout"] = counts.get("timeout", 0) + 1
+                    yield json.dumps({"disaster_id": disaster_id, "status": "timeout"}) + "\n"
+            break
+        if result["disaster_id"] not in waiting:
+            continue
+        waiting.discard(result["disaster_id"])
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        yield json.dumps(result) + "\n"
+    summary = {"total": len(disaster_ids), **counts, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    yield json.dumps({"summary": summary}) + "\n"
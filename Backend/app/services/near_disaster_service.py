@@ -21,8 +21,7 @@ def get_nearby_disasters(latitude: float, longitude: float) -> List[dict]:
     try:
         documents = appwrite_service.query_disasters_by_geohash_and_time(
             geohash_prefix=geohash_prefix,
-            min_timestamp=one_week_ago,
-            limit=100
+            min_timestamp=one_week_ago
         )
 
         results = []
@@ -35,6 +34,11 @@ def get_nearby_disasters(latitude: float, longitude: float) -> List[dict]:
             if not isinstance(submitted_time, (int, float)) or submitted_time < one_week_ago:
                 continue
 
+            # Listings show the thumbnail; the original stays reachable for detail views
+            if cleaned.get('thumbnail_url'):
+                cleaned['full_image_url'] = cleaned.get('image_url')
+                cleaned['image_url'] = cleaned['thumbnail_url']
+
             results.append(cleaned)
 
         return results
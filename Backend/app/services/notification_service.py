@@ -0,0 +1,230 @@
+from app.services.geo_utils import geohash_block
+from app.services.llm_gateway import TokenBucket
+from app.services.user_geo_index import user_geo_index
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List
+import json
+import os
+import queue
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Comma-separated: any of "webhook", "telegram", "file" ("file" is a local sink for testing).
+# Alerts are not delivered anywhere until at least one channel is configured.
+NOTIFY_CHANNELS = [name.strip() for name in os.getenv("NOTIFY_CHANNELS", "").split(",") if name.strip()]
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL", "")
+NOTIFY_FILE_PATH = os.getenv("NOTIFY_FILE_PATH", "notifications.jsonl")
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# Telegram limits bots to about 30 messages per second overall
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "25"))
+NOTIFY_RINGS = int(os.getenv("NOTIFY_RINGS", "1"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "500"))
+NOTIFY_BATCHES_PER_SECOND = float(os.getenv("NOTIFY_BATCHES_PER_SECOND", "20"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "8"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+# Disaster ids remembered so an alert is sent once; archived ones are dropped, the oldest past this many
+NOTIFY_ALERTED_MAX = int(os.getenv("NOTIFY_ALERTED_MAX", "10000"))
+
+
+class NotificationChannel(ABC):
+    """A delivery channel.
+
+    send_batch adds the uid of every recipient it has delivered to `delivered`
+    and raises on failure, so a retry only re-sends to the rest.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def send_batch(self, alert: dict, recipients: List[dict], delivered: set):
+        pass
+
+
+class WebhookChannel(NotificationChannel):
+    """POSTs each batch (alert + recipients) as JSON to NOTIFY_WEBHOOK_URL."""
+
+    name = "webhook"
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = requests.Session()
+
+    def send_batch(self, alert: dict, recipients: List[dict], delivered: set):
+        response = self.session.post(self.url, json={"alert": alert, "recipients": recipients}, timeout=NOTIFY_TIMEOUT)
+        response.raise_for_status()
+        delivered.update(recipient["uid"] for recipient in recipients)
+
+
+class TelegramChannel(NotificationChannel):
+    """Sends the alert text to every recipient with a telegram_chat_id, one message each.
+
+    Messages are paced by a bucket shared across batches, since Telegram's limit
+    is per bot rather than per request.
+    """
+
+    name = "telegram"
+
+    def __init__(self, bot_token: str):
+        self.url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        self.session = requests.Session()
+        self.bucket = TokenBucket(TELEGRAM_MESSAGES_PER_SECOND, max(1, int(TELEGRAM_MESSAGES_PER_SECOND)))
+
+    def send_batch(self, alert: dict, recipients: List[dict], delivered: set):
+        for recipient in recipients:
+            chat_id = recipient.get("telegram_chat_id")
+            if chat_id:
+                self.bucket.acquire()
+                response = self.session.post(self.url, json={"chat_id": chat_id, "text": alert["message"]}, timeout=NOTIFY_TIMEOUT)
+                if response.status_code == 429:
+                    # Back off for as long as Telegram asks before the batch is retried
+                    time.sleep(float(response.json().get("parameters", {}).get("retry_after", 1)))
+                response.raise_for_status()
+            delivered.add(recipient["uid"])
+
+
+class FileChannel(NotificationChannel):
+    """Appends one JSON line per batch to a local file (for testing)."""
+
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send_batch(self, alert: dict, recipients: List[dict], delivered: set):
+        line = json.dumps({"alert": alert, "recipients": [recipient["uid"] for recipient in recipients], "sent_at": time.time()})
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as sink:
+                sink.write(line + "\n")
+        delivered.update(recipient["uid"] for recipient in recipients)
+
+
+def build_channels(names: List[str]) -> List[NotificationChannel]:
+    channels = []
+    for name in names:
+        if name == "webhook" and NOTIFY_WEBHOOK_URL:
+            channels.append(WebhookChannel(NOTIFY_WEBHOOK_URL))
+        elif name == "telegram" and TELEGRAM_BOT_TOKEN:
+            channels.append(TelegramChannel(TELEGRAM_BOT_TOKEN))
+        elif name == "file":
+            channels.append(FileChannel(NOTIFY_FILE_PATH))
+        else:
+            print(f"Notification channel '{name}' is not configured and will be skipped")
+    if not channels:
+        print("No notification channel configured (NOTIFY_CHANNELS); disaster alerts will not be delivered")
+    return channels
+
+
+def alert_message(disaster: dict) -> str:
+    return (
+        f"Emergency alert: {disaster.get('emergency_type', 'emergency')} reported near your area "
+        f"({disaster.get('latitude')}, {disaster.get('longitude')}), urgency {disaster.get('urgency_level', 'unknown')}. "
+        f"Follow official guidance and stay safe."
+    )
+
+
+class NotificationOutbox:
+    """Queue of disaster alerts delivered by a background worker.
+
+    enqueue() only records the alert, so callers never wait on delivery. The worker
+    resolves recipients from the user geohash index (disaster cell and its
+    neighbours), splits them into batches and sends the batches of every channel
+    in parallel, paced by a shared rate limit and retried with backoff.
+    """
+
+    def __init__(self, channels: List[NotificationChannel]):
+        self.channels = channels
+        self.jobs = queue.Queue()
+        self.bucket = TokenBucket(NOTIFY_BATCHES_PER_SECOND, max(1, int(NOTIFY_BATCHES_PER_SECOND)))
+        self.executor = ThreadPoolExecutor(max_workers=NOTIFY_WORKERS, thread_name_prefix="notify")
+        self.alerted = OrderedDict()
+        self.lock = threading.Lock()
+        self.worker = None
+        self.metrics = {"alerts": 0, "recipients": 0, "batches_sent": 0, "batches_failed": 0, "retries": 0, "last_fanout_seconds": 0.0}
+
+    def enqueue_disaster_alert(self, disaster_id: str, disaster: dict) -> bool:
+        """Queue an alert for a newly active disaster; returns False if it was already queued."""
+        with self.lock:
+            if disaster_id in self.alerted:
+                return False
+            self.alerted[disaster_id] = True
+            while len(self.alerted) > NOTIFY_ALERTED_MAX:
+                self.alerted.popitem(last=False)
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name="notification-outbox", daemon=True)
+                self.worker.start()
+        self.jobs.put((disaster_id, disaster))
+        return True
+
+    def forget(self, disaster_id: str):
+        """Drop an archived disaster so alerting it again is possible and the id does not linger."""
+        with self.lock:
+            self.alerted.pop(disaster_id, None)
+
+    def run(self):
+        while True:
+            disaster_id, disaster = self.jobs.get()
+            try:
+                self.deliver(disaster_id, disaster)
+            except Exception as e:
+                print(f"Failed to deliver alerts for disaster {disaster_id}: {e}")
+
+    def deliver(self, disaster_id: str, disaster: dict):
+        if not self.channels:
+            return
+        started = time.perf_counter()
+        geohash = str(disaster.get("geohash") or "")[:4]
+        if not geohash:
+            print(f"Disaster {disaster_id} has no geohash; no alerts sent")
+            return
+        recipients = user_geo_index.users_in_cells(geohash_block(geohash, NOTIFY_RINGS))
+        alert = {
+            "disaster_id": disaster_id,
+            "emergency_type": disaster.get("emergency_type"),
+            "urgency_level": disaster.get("urgency_level"),
+            "latitude": disaster.get("latitude"),
+            "longitude": disaster.get("longitude"),
+            "message": alert_message(disaster),
+        }
+        batches = [recipients[i:i + NOTIFY_BATCH_SIZE] for i in range(0, len(recipients), NOTIFY_BATCH_SIZE)]
+        futures = [self.executor.submit(self.send_with_retries, channel, alert, batch) for channel in self.channels for batch in batches]
+        wait(futures)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.metrics["alerts"] += 1
+            self.metrics["recipients"] += len(recipients)
+            self.metrics["last_fanout_seconds"] = round(elapsed, 3)
+        print(f"Alerted {len(recipients)} users about disaster {disaster_id} in {elapsed:.2f}s")
+
+    def send_with_retries(self, channel: NotificationChannel, alert: dict, batch: List[dict]):
+        delivered = set()
+        for attempt in range(NOTIFY_MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                channel.send_batch(alert, [recipient for recipient in batch if recipient["uid"] not in delivered], delivered)
+                with self.lock:
+                    self.metrics["batches_sent"] += 1
+                return
+            except Exception as e:
+                if attempt == NOTIFY_MAX_RETRIES:
+                    with self.lock:
+                        self.metrics["batches_failed"] += 1
+                    print(f"Notification batch via {channel.name} failed: {e}")
+                    return
+                with self.lock:
+                    self.metrics["retries"] += 1
+                time.sleep(min(2 ** attempt, 30))
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {**self.metrics, "channels": [channel.name for channel in self.channels], "queued": self.jobs.qsize()}
+
+
+notification_outbox = NotificationOutbox(build_channels(NOTIFY_CHANNELS))
@@ -0,0 +1,211 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.geo_utils import haversine_km, geohash_block
+from app.services.image_service import hamming_distance
+from appwrite.query import Query
+from typing import Optional
+import os
+import threading
+import time
+import pygeohash as pgh
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REPORT_DEDUP = os.getenv("REPORT_DEDUP", "true").lower() == "true"
+# Reports of the same type within this window (seconds) and radius are candidate duplicates
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "1800"))
+DEDUP_RADIUS_KM = float(os.getenv("DEDUP_RADIUS_KM", "5"))
+# Largest dHash distance (out of 64 bits) still treated as the same scene
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "12"))
+# Seconds a duplicate waits for the original report's analysis to finish
+DEDUP_WAIT = float(os.getenv("DEDUP_WAIT", "30"))
+
+GEOHASH_PRECISION = 4
+ANALYSIS_FIELDS = ["government_report", "citizen_survival_guide", "image_url", "status", "pending_components"]
+CLOSED_STATUSES = {"archived"}
+
+appwrite_service = AppwriteService()
+
+
+class ReportDeduplicator:
+    """Recent reports bucketed by geohash cell, used to collapse surges into one analysis.
+
+    The first report of an incident registers itself before running the pipeline,
+    so reports arriving while it is still being analysed already match it and wait
+    for its result instead of starting their own run. A match needs the same
+    emergency type, a location within DEDUP_RADIUS_KM, a submission within
+    DEDUP_WINDOW and an image hash within DEDUP_MAX_HAMMING bits.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.cells = {}
+        self.lock = threading.Lock()
+        self.pruned_at = 0.0
+        self.warmed = False
+        self.metrics = {"reports": 0, "pipeline_runs": 0, "duplicates": 0, "waited": 0, "wait_timeouts": 0}
+
+    def warm(self):
+        """Load disasters reported within the dedup window (e.g. at startup)."""
+        count = 0
+        for document in appwrite_service.iter_documents(
+            appwrite_service.disasters_collection_id,
+            [Query.greater_than("submitted_time", time.time() - DEDUP_WINDOW)]
+        ):
+            if self.remember(document):
+                count += 1
+        self.warmed = True
+        print(f"Report dedup index warmed with {count} recent disasters")
+
+    def remember(self, document: dict) -> bool:
+        """Track an already analysed disaster document; returns False if it cannot be matched."""
+        disaster_id = document.get("disaster_id") or document.get("$id")
+        if not disaster_id or not document.get("image_phash") or document.get("status") in CLOSED_STATUSES:
+            return False
+        try:
+            entry = self.new_entry(disaster_id, document.get("emergency_type"), float(document["latitude"]),
+                                   float(document["longitude"]), document["image_phash"], float(document["submitted_time"]))
+        except (KeyError, TypeError, ValueError):
+            return False
+        entry["report_count"] = int(document.get("report_count") or 1)
+        entry["analysis"] = {field: document.get(field) for field in ANALYSIS_FIELDS}
+        entry["ready"].set()
+        with self.lock:
+            if disaster_id not in self.entries:
+                self.store(entry)
+        return True
+
+    def new_entry(self, disaster_id: str, emergency_type: str, latitude: float, longitude: float, image_phash: str, submitted_time: float) -> dict:
+        return {
+            "disaster_id": disaster_id,
+            "emergency_type": str(emergency_type or "").strip().lower(),
+            "latitude": latitude,
+            "longitude": longitude,
+            "geohash": pgh.encode(latitude, longitude, precision=GEOHASH_PRECISION),
+            "image_phash": image_phash,
+            "submitted_time": submitted_time,
+            "report_count": 1,
+            "analysis": None,
+            "ready": threading.Event(),
+            "link_lock": threading.Lock(),
+        }
+
+    def store(self, entry: dict):
+        # Caller holds self.lock
+        self.entries[entry["disaster_id"]] = entry
+        self.cells.setdefault(entry["geohash"], set()).add(entry["disaster_id"])
+
+    def drop(self, disaster_id: str) -> Optional[dict]:
+        # Caller holds self.lock
+        entry = self.entries.pop(disaster_id, None)
+        if entry:
+            self.cells.get(entry["geohash"], set()).discard(disaster_id)
+        return entry
+
+    def prune(self, now: float):
+        # Caller holds self.lock; expired entries are skipped by matching anyway, so sweep rarely
+        if now - self.pruned_at < 60:
+            return
+        self.pruned_at = now
+        for disaster_id, entry in list(self.entries.items()):
+            if entry["submitted_time"] < now - DEDUP_WINDOW and entry["ready"].is_set():
+                self.drop(disaster_id)
+
+    def best_match(self, candidate: dict) -> Optional[dict]:
+        # Caller holds self.lock
+        best = None
+        for cell in geohash_block(candidate["geohash"], 1):
+            for disaster_id in self.cells.get(cell, ()):
+                entry = self.entries[disaster_id]
+                if entry["emergency_type"] != candidate["emergency_type"]:
+                    continue
+                if candidate["submitted_time"] - entry["submitted_time"] > DEDUP_WINDOW:
+                    continue
+                distance = haversine_km(candidate["latitude"], candidate["longitude"], entry["latitude"], entry["longitude"])
+                if distance > DEDUP_RADIUS_KM:
+                    continue
+                bits = hamming_distance(candidate["image_phash"], entry["image_phash"])
+                if bits > DEDUP_MAX_HAMMING:
+                    continue
+                if best is None or (bits, distance) < best[0]:
+                    best = ((bits, distance), entry)
+        return best[1] if best else None
+
+    def find_duplicate(self, disaster_id: str, emergency_type: str, latitude: float, longitude: float,
+                       image_phash: str, submitted_time: float, user_id: str) -> Optional[dict]:
+        """Link a report to a matching disaster, or register it as a new incident.
+
+        Returns the linked disaster's id, report count and analysis, or None when the
+        caller must run the pipeline and later call complete() or abandon().
+        """
+        candidate = self.new_entry(disaster_id, emergency_type, latitude, longitude, image_phash, submitted_time)
+        with self.lock:
+            self.metrics["reports"] += 1
+        while True:
+            with self.lock:
+                self.prune(submitted_time)
+                match = self.best_match(candidate)
+                if match is None:
+                    self.store(candidate)
+                    self.metrics["pipeline_runs"] += 1
+                    return None
+                if not match["ready"].is_set():
+                    self.metrics["waited"] += 1
+            if not match["ready"].wait(DEDUP_WAIT):
+                with self.lock:
+                    self.metrics["wait_timeouts"] += 1
+            with self.lock:
+                abandoned = match["disaster_id"] not in self.entries
+                if not abandoned:
+                    self.metrics["duplicates"] += 1
+            if abandoned:
+                # The original report was never saved (or was rejected); look again, possibly becoming the original
+                continue
+            return self.link(match, user_id)
+
+    def link(self, entry: dict, user_id: str) -> dict:
+        # Writes are serialized per disaster so the stored count never goes backwards
+        with entry["link_lock"]:
+            entry["report_count"] += 1
+            report_count = entry["report_count"]
+            try:
+                appwrite_service.update_disaster_document(entry["disaster_id"], {"report_count": report_count})
+            except Exception as e:
+                print(f"Error linking report from {user_id} to disaster {entry['disaster_id']}: {str(e)}")
+        print(f"Report from {user_id} linked to disaster {entry['disaster_id']} ({report_count} reports)")
+        return {"disaster_id": entry["disaster_id"], "report_count": report_count, "analysis": dict(entry["analysis"] or {})}
+
+    def complete(self, disaster_id: str, analysis: dict):
+        """Publish the saved analysis of a registered report to waiting duplicates."""
+        with self.lock:
+            entry = self.entries.get(disaster_id)
+        if entry:
+            entry["analysis"] = {field: analysis.get(field) for field in ANALYSIS_FIELDS}
+            entry["ready"].set()
+
+    def update_analysis(self, disaster_id: str, patch: dict):
+        with self.lock:
+            entry = self.entries.get(disaster_id)
+            if entry and entry["analysis"] is not None:
+                entry["analysis"].update({field: patch[field] for field in ANALYSIS_FIELDS if field in patch})
+
+    def abandon(self, disaster_id: str):
+        """Unregister a report unless its analysis was saved; waiting duplicates retry."""
+        with self.lock:
+            entry = self.entries.get(disaster_id)
+            if entry is None or entry["ready"].is_set():
+                return
+            self.drop(disaster_id)
+        entry["ready"].set()
+
+    def forget(self, disaster_id: str):
+        """Stop linking new reports to a disaster (e.g. once it is rejected)."""
+        with self.lock:
+            self.drop(disaster_id)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {**self.metrics, "enabled": REPORT_DEDUP, "warmed": self.warmed, "tracked_disasters": len(self.entries)}
+
+
+report_deduplicator = ReportDeduplicator()
@@ -0,0 +1,148 @@
+from typing import AsyncIterator, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long a finished report stays replayable for late subscribers (seconds)
+REPORT_STREAM_TTL = float(os.getenv("REPORT_STREAM_TTL", "600"))
+REPORT_STREAM_KEEPALIVE = float(os.getenv("REPORT_STREAM_KEEPALIVE", "15"))
+
+TERMINAL_EVENTS = {"complete", "error", "duplicate"}
+GUIDANCE_COMPONENT = "citizen_survival_guide"
+REPORT_COMPONENTS = {"government_report", "citizen_survival_guide"}
+
+
+class ReportStreamHub:
+    """In-memory pub/sub of report progress, one channel per disaster_id.
+
+    Agents publish from worker threads; every event is also kept in the channel's
+    history so a client that subscribes late replays what it missed before
+    following live. Channels end with a terminal event and are dropped
+    REPORT_STREAM_TTL seconds later.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.guidance = {"reports": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0}
+
+    def open(self, disaster_id: str, user_id: str, submitted_time: float):
+        now = time.time()
+        with self.lock:
+            for stale_id, channel in list(self.channels.items()):
+                if channel["closed_at"] and now - channel["closed_at"] > REPORT_STREAM_TTL:
+                    del self.channels[stale_id]
+            self.channels[disaster_id] = {
+                "user_id": user_id,
+                "submitted_time": submitted_time,
+                "events": [],
+                "subscribers": [],
+                "first_token": set(),
+                "closed_at": None,
+            }
+
+    def owner(self, disaster_id: str) -> Optional[str]:
+        """The reporting user's id, or None if there is no stream for this disaster."""
+        with self.lock:
+            channel = self.channels.get(disaster_id)
+            return channel["user_id"] if channel else None
+
+    def publish(self, disaster_id: str, event: str, data: dict):
+        with self.lock:
+            channel = self.channels.get(disaster_id)
+            if channel is None or channel["closed_at"]:
+                return
+            channel["events"].append((event, data))
+            if event in TERMINAL_EVENTS:
+                channel["closed_at"] = time.time()
+            subscribers = list(channel["subscribers"])
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def publish_token(self, disaster_id: str, component: str, text: str):
+        self.record_first_output(disaster_id, component)
+        self.publish(disaster_id, "token", {"component": component, "text": text})
+
+    def publish_template(self, disaster_id: str, component: str, text: str):
+        """Send a complete pre-generated text; token events that follow for the component replace it."""
+        self.record_first_output(disaster_id, component)
+        self.publish(disaster_id, "template", {"component": component, "text": text})
+
+    def record_first_output(self, disaster_id: str, component: str):
+        with self.lock:
+            channel = self.channels.get(disaster_id)
+            if channel is None or component in channel["first_token"]:
+                return
+            channel["first_token"].add(component)
+            if component == GUIDANCE_COMPONENT:
+                elapsed = time.time() - channel["submitted_time"]
+                self.guidance["reports"] += 1
+                self.guidance["total_seconds"] += elapsed
+                self.guidance["max_seconds"] = max(self.guidance["max_seconds"], elapsed)
+                self.guidance["last_seconds"] = elapsed
+
+    async def subscribe(self, disaster_id: str) -> AsyncIterator[Tuple[str, Optional[dict]]]:
+        """Yield (event, data) pairs: the history first, then live events until a terminal one.
+
+        ("keepalive", None) is yielded after REPORT_STREAM_KEEPALIVE seconds without events.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self.lock:
+            channel = self.channels.get(disaster_id)
+            if channel is None:
+                return
+            history = list(channel["events"])
+            live = channel["closed_at"] is None
+            if live:
+                channel["subscribers"].append((loop, queue))
+        try:
+            for item in history:
+                yield item
+            while live:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), REPORT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield "keepalive", None
+                    continue
+                yield event, data
+                live = event not in TERMINAL_EVENTS
+        finally:
+            with self.lock:
+                if (loop, queue) in channel["subscribers"]:
+                    channel["subscribers"].remove((loop, queue))
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            reports = self.guidance["reports"]
+            return {
+                "open_streams": sum(1 for channel in self.channels.values() if not channel["closed_at"]),
+                "subscribers": sum(len(channel["subscribers"]) for channel in self.channels.values()),
+                "time_to_first_guidance": {
+                    "reports": reports,
+                    "avg_seconds": round(self.guidance["total_seconds"] / reports, 3) if reports else 0.0,
+                    "max_seconds": round(self.guidance["max_seconds"], 3),
+                    "last_seconds": round(self.guidance["last_seconds"], 3),
+                },
+            }
+
+
+async def sse_events(disaster_id: str, components: Set[str] = REPORT_COMPONENTS) -> AsyncIterator[str]:
+    """Server-sent events for a report stream, limited to the given report components."""
+    async for event, data in report_streams.subscribe(disaster_id):
+        if event == "keepalive":
+            yield ": keepalive\n\n"
+            continue
+        if data.get("component") and data["component"] not in components:
+            continue
+        hidden = REPORT_COMPONENTS - components
+        data = {key: value for key, value in data.items() if key not in hidden}
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+report_streams = ReportStreamHub()
@@ -0,0 +1,106 @@
+from app.models.resource import ResourceImportRow
+from app.services.appwrite_service import AppwriteService
+from app.services.resource_index import resource_index
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import ValidationError
+from typing import BinaryIO, Iterator, Tuple
+import codecs
+import csv
+import json
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESOURCE_IMPORT_CONCURRENCY = int(os.getenv("RESOURCE_IMPORT_CONCURRENCY", "8"))
+RESOURCE_IMPORT_MAX_ROWS = int(os.getenv("RESOURCE_IMPORT_MAX_ROWS", "10000"))
+
+appwrite_service = AppwriteService()
+
+
+def detect_format(filename: str, content_type: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or "csv" in (content_type or ""):
+        return "csv"
+    return "jsonl"
+
+
+def iter_rows(stream: BinaryIO, file_format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (row_number, raw_row) pairs while reading the upload line by line.
+
+    raw_row is a dict, or an Exception for a line that could not be decoded.
+    """
+    text = codecs.getreader("utf-8-sig")(stream)
+    if file_format == "csv":
+        for row_number, record in enumerate(csv.DictReader(text), start=1):
+            # Empty CSV cells mean "not given", not an empty value
+            yield row_number, {key: value for key, value in record.items() if key and value not in ("", None)}
+        return
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, e
+
+
+def validation_errors(error: ValidationError) -> list:
+    return [f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()]
+
+
+def import_resources(disaster_id: str, stream: BinaryIO, file_format: str) -> dict:
+    """Validate and create resources from a JSON Lines or CSV upload.
+
+    Rows are validated as they are read and created on a bounded pool, so at most
+    RESOURCE_IMPORT_CONCURRENCY creates are in flight and only those rows are held
+    in memory. Returns a per-row report; the resource index is updated once at the end.
+    """
+    results = []
+    created_documents = []
+    results_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(RESOURCE_IMPORT_CONCURRENCY)
+
+    def create(row_number: int, row: ResourceImportRow):
+        try:
+            data = row.model_dump(exclude_none=True)
+            document = appwrite_service.add_resource_to_disaster(disaster_id, {"disaster_id": disaster_id, **data})
+            with results_lock:
+                created_documents.append(document)
+                results.append({"row": row_number, "status": "created", "resource_id": document["$id"]})
+        except Exception as e:
+            with results_lock:
+                results.append({"row": row_number, "status": "failed", "errors": [str(e)]})
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=RESOURCE_IMPORT_CONCURRENCY, thread_name_prefix="resource-import") as executor:
+        for row_number, raw_row in iter_rows(stream, file_format):
+            if row_number > RESOURCE_IMPORT_MAX_ROWS:
+                results.append({"row": row_number, "status": "skipped", "errors": [f"Import is limited to {RESOURCE_IMPORT_MAX_ROWS} rows"]})
+                break
+            if isinstance(raw_row, Exception):
+                errors = [f"Invalid JSON: {raw_row}"]
+            elif not isinstance(raw_row, dict):
+                errors = ["Row must be a JSON object"]
+            else:
+                try:
+                    row = ResourceImportRow.model_validate(raw_row)
+                except ValidationError as e:
+                    errors = validation_errors(e)
+                else:
+                    in_flight.acquire()
+                    executor.submit(create, row_number, row)
+                    continue
+            with results_lock:
+                results.append({"row": row_number, "status": "invalid", "errors": errors})
+
+    resource_index.upsert_many(disaster_id, created_documents)
+    results.sort(key=lambda result: result["row"])
+    summary = {"total": len(results), "created": 0, "invalid": 0, "failed": 0, "skipped": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return {**summary, "results": results}
@@ -0,0 +1,134 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.geo_utils import haversine_km
+import heapq
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Safety net for changes made outside this process (e.g. the Appwrite console)
+RESOURCE_INDEX_TTL = float(os.getenv("RESOURCE_INDEX_TTL", "300"))
+
+appwrite_service = AppwriteService()
+
+
+def parse_coordinates(document: dict):
+    try:
+        return float(document["latitude"]), float(document["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_available(document: dict, min_availability: int) -> bool:
+    availability = document.get("availability")
+    # Resources registered without an availability count are treated as available
+    if availability is None:
+        return True
+    try:
+        return int(availability) >= min_availability
+    except (TypeError, ValueError):
+        return True
+
+
+class ResourceIndex:
+    """In-memory index of each disaster's resources for nearest-resource queries.
+
+    A disaster is loaded on first use (all pages) and then kept current by the
+    resource add/delete/availability endpoints; entries older than
+    RESOURCE_INDEX_TTL are reloaded.
+    """
+
+    def __init__(self):
+        self.disasters = {}
+        self.resource_disaster = {}
+        self.lock = threading.Lock()
+        self.metrics = {"loads": 0, "queries": 0, "updates": 0}
+
+    def load(self, disaster_id: str) -> dict:
+        resources = {}
+        for document in appwrite_service.iter_resources_for_disaster(disaster_id):
+            coordinates = parse_coordinates(document)
+            if coordinates:
+                resources[document["$id"]] = {"document": document, "coordinates": coordinates}
+        with self.lock:
+            previous = self.disasters.get(disaster_id)
+            for resource_id in (previous or {}).get("resources", {}):
+                self.resource_disaster.pop(resource_id, None)
+            self.disasters[disaster_id] = {"resources": resources, "loaded": time.time()}
+            for resource_id in resources:
+                self.resource_disaster[resource_id] = disaster_id
+            self.metrics["loads"] += 1
+        return resources
+
+    def resources_for(self, disaster_id: str) -> dict:
+        with self.lock:
+            entry = self.disasters.get(disaster_id)
+            if entry and time.time() - entry["loaded"] < RESOURCE_INDEX_TTL:
+                return entry["resources"]
+        return self.load(disaster_id)
+
+    def nearest(self, disaster_id: str, latitude: float, longitude: float, k: int = 5, min_availability: int = 1) -> list:
+        """Return the k closest available resources, each with a "distance" in km."""
+        resources = self.resources_for(disaster_id)
+        with self.lock:
+            self.metrics["queries"] += 1
+            entries = list(resources.items())
+        candidates = (
+            (haversine_km(latitude, longitude, *entry["coordinates"]), resource_id, entry["document"])
+            for resource_id, entry in entries
+            if is_available(entry["document"], min_availability)
+        )
+        closest = heapq.nsmallest(k, candidates, key=lambda candidate: (candidate[0], candidate[1]))
+        return [
+            {**document, "distance": round(distance, 3), "resource_id": resource_id}
+            for distance, resource_id, document in closest
+        ]
+
+    def upsert(self, disaster_id: str, document: dict):
+        """Add or replace a resource in a loaded disaster (unloaded disasters load lazily)."""
+        self.upsert_many(disaster_id, [document])
+
+    def upsert_many(self, disaster_id: str, documents: list):
+        """Apply a batch of created or changed resources under a single lock acquisition."""
+        with self.lock:
+            entry = self.disasters.get(disaster_id)
+            if entry is None:
+                return
+            for document in documents:
+                self.metrics["updates"] += 1
+                coordinates = parse_coordinates(document)
+                if coordinates is None:
+                    entry["resources"].pop(document["$id"], None)
+                    self.resource_disaster.pop(document["$id"], None)
+                    continue
+                entry["resources"][document["$id"]] = {"document": document, "coordinates": coordinates}
+                self.resource_disaster[document["$id"]] = disaster_id
+
+    def remove(self, resource_id: str):
+        with self.lock:
+            disaster_id = self.resource_disaster.pop(resource_id, None)
+            if disaster_id in self.disasters:
+                self.disasters[disaster_id]["resources"].pop(resource_id, None)
+                self.metrics["updates"] += 1
+
+    def set_availability(self, resource_id: str, availability: int):
+        with self.lock:
+            disaster_id = self.resource_disaster.get(resource_id)
+            entry = self.disasters.get(disaster_id, {}).get("resources", {}).get(resource_id)
+            if entry is None:
+                return
+            entry["document"] = {**entry["document"], "availability": availability}
+            self.metrics["updates"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                **self.metrics,
+                "disasters": len(self.disasters),
+                "resources": len(self.resource_disaster),
+            }
+
+
+resource_index = ResourceIndex()
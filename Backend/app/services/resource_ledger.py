@@ -0,0 +1,144 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.resource_index import resource_index
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESOURCE_LEDGER_TIMEOUT = float(os.getenv("RESOURCE_LEDGER_TIMEOUT", "15"))
+RESOURCE_LEDGER_WORKERS = int(os.getenv("RESOURCE_LEDGER_WORKERS", "4"))
+
+appwrite_service = AppwriteService()
+
+
+class ResourceLedgerConflict(Exception):
+    """A reservation or release that the resource's availability cannot satisfy."""
+
+    def __init__(self, resource_id: str, reason: str, availability: Optional[int], capacity: Optional[int]):
+        super().__init__(f"Resource {resource_id}: {reason}")
+        self.resource_id = resource_id
+        self.reason = reason
+        self.availability = availability
+        self.capacity = capacity
+
+    def to_dict(self) -> dict:
+        return {"message": str(self), "reason": self.reason, "availability": self.availability, "capacity": self.capacity}
+
+
+def as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResourceLedger:
+    """Serializes availability changes per resource and commits them in groups.
+
+    Callers enqueue a delta (reserve/release) or an absolute value and wait. The
+    first operation for an idle resource schedules a committer on the ledger's
+    workers: it reads the current availability once, applies every queued
+    operation in order (rejecting those that would go below zero or above
+    capacity) and writes the result in a single update. Operations queued
+    meanwhile form the next group, committed by a fresh job so busy resources take
+    turns on the workers; concurrent allocations cost one read and one write per
+    group instead of per request.
+    """
+
+    def __init__(self):
+        self.ledgers = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=RESOURCE_LEDGER_WORKERS, thread_name_prefix="resource-ledger")
+        self.metrics = {"operations": 0, "commits": 0, "rejected": 0, "failed_commits": 0}
+
+    def submit(self, resource_id: str, kind: str, amount: int) -> dict:
+        future = Future()
+        with self.lock:
+            ledger = self.ledgers.setdefault(resource_id, {"queue": [], "committing": False})
+            ledger["queue"].append((kind, amount, future))
+            self.metrics["operations"] += 1
+            commit = not ledger["committing"]
+            if commit:
+                ledger["committing"] = True
+        if commit:
+            self.executor.submit(self.commit_next, resource_id)
+        return future.result(timeout=RESOURCE_LEDGER_TIMEOUT)
+
+    def reserve(self, resource_id: str, amount: int) -> dict:
+        return self.submit(resource_id, "delta", -amount)
+
+    def release(self, resource_id: str, amount: int) -> dict:
+        return self.submit(resource_id, "delta", amount)
+
+    def set_availability(self, resource_id: str, availability: int) -> dict:
+        return self.submit(resource_id, "set", availability)
+
+    def commit_next(self, resource_id: str):
+        with self.lock:
+            ledger = self.ledgers[resource_id]
+            batch, ledger["queue"] = ledger["queue"], []
+            if not batch:
+                ledger["committing"] = False
+                del self.ledgers[resource_id]
+                return
+        try:
+            self.commit(resource_id, batch)
+        finally:
+            self.executor.submit(self.commit_next, resource_id)
+
+    def commit(self, resource_id: str, batch: list):
+        try:
+            # Serialization is per process: a write from another replica between this
+            # read and our update is overwritten, but the fresh read per group keeps that window short
+            document = appwrite_service.get_resource_document(resource_id)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        capacity = as_int(document.get("capacity"))
+        availability = as_int(document.get("availability")) or 0
+        outcomes = []
+        for kind, amount, future in batch:
+            proposed = amount if kind == "set" else availability + amount
+            if proposed < 0:
+                outcomes.append((future, ResourceLedgerConflict(resource_id, "insufficient availability", availability, capacity)))
+            elif capacity and proposed > capacity and kind == "delta":
+                outcomes.append((future, ResourceLedgerConflict(resource_id, "release exceeds capacity", availability, capacity)))
+            else:
+                availability = proposed
+                outcomes.append((future, None))
+
+        try:
+            if any(error is None for _, error in outcomes):
+                appwrite_service.update_resource_availability(resource_id, availability)
+                resource_index.set_availability(resource_id, availability)
+        except Exception as e:
+            with self.lock:
+                self.metrics["failed_commits"] += 1
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.lock:
+            self.metrics["commits"] += 1
+            self.metrics["rejected"] += sum(1 for _, error in outcomes if error is not None)
+        for future, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result({"resource_id": resource_id, "availability": availability, "capacity": capacity, "group_size": len(batch)})
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            commits = self.metrics["commits"]
+            return {
+                **self.metrics,
+                "avg_group_size": round(self.metrics["operations"] / commits, 2) if commits else 0.0,
+                "active_resources": len(self.ledgers),
+            }
+
+
+resource_ledger = ResourceLedger()
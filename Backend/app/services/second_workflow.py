@@ -1,20 +1,23 @@
 from langgraph.graph import StateGraph
 from typing import TypedDict
 import uuid
-from langchain_google_genai import ChatGoogleGenerativeAI
-import os
+import time
 import json
+import hashlib
 from app.services.appwrite_service import AppwriteService
+from app.services.llm_gateway import llm_gateway
+from app.services.task_cache import task_cache
+from app.services.task_generation import generate_structured_task, repair_json, roles_from_choice, record_metric
+from app.services.task_triage import triage_disaster, should_answer_with_rules, record_triage
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index
+from app.services.task_claims import claim_task, forget_claim, TaskClaimConflict, TaskNotFound
 from dotenv import load_dotenv
 
 load_dotenv()
 
 appwrite_service = AppwriteService()
 
-gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
 
 class TaskState(TypedDict):
     disaster_id: str
@@ -28,6 +31,25 @@ def fetch_disaster_data(state: TaskState) -> TaskState:
     except Exception as e:
         raise ValueError(f"Disaster data not found: {e}")
 
+def build_first_task(data: dict, description: str, roles: list, generated_by: str, reasoning: str) -> dict:
+    # generated_by is "llm", "cache", "rules" or "fallback"; only the last is an LLM failure
+    return {
+        "task_id": str(uuid.uuid4()),
+        "description": description,
+        "status": "pending",
+        "action_done_by": "",
+        "roles": roles,
+        "emergency_type": data.get("emergency_type", ""),
+        "urgency_level": data.get("urgency_level", "minimal"),
+        "latitude": data.get("latitude", ""),
+        "longitude": data.get("longitude", ""),
+        "people_count": data.get("people_count", ""),
+        "is_fallback": generated_by == "fallback",
+        "generated_by": generated_by,
+        "first_Task": True,
+        "ai_reasoning": reasoning
+    }
+
 def generate_task(state: TaskState) -> TaskState:
     data = state['disaster_data']
     urgency = data.get("urgency_level", "minimal")
@@ -37,6 +59,21 @@ def generate_task(state: TaskState) -> TaskState:
     latitude = data.get("latitude", "")
     longitude = data.get("longitude", "")
 
+    triage_started = time.perf_counter()
+    triage = triage_disaster(emergency_type, urgency, people, situation, latitude, longitude)
+    answered_by_rules = should_answer_with_rules(triage)
+    record_triage(triage, not answered_by_rules, "disaster_task", time.perf_counter() - triage_started)
+    if answered_by_rules:
+        print(f"Task triage answered by rules: {triage['roles']} (confidence {triage['confidence']})")
+        reasoning = f"Rules-based triage (confidence {triage['confidence']})"
+        task = build_first_task(data, triage["description"], triage["roles"], "rules", reasoning)
+        return {"generated_task": task, **state}
+
+    cached = task_cache.lookup(emergency_type, urgency, people, situation, latitude, longitude)
+    if cached:
+        print(f"Task cache hit for {emergency_type}/{urgency} (similarity {cached['similarity']:.2f})")
+        task = build_first_task(data, cached["description"], cached["roles"], "cache", cached["reasoning"])
+        return {"generated_task": task, **state}
 
     prompt = f"""
     You are an emergency response coordinator AI. Analyze the following disaster situation and generate both an appropriate emergency response task AND determine which responder roles are needed.
@@ -107,46 +144,19 @@ def generate_task(state: TaskState) -> TaskState:
     """
 
     try:
-        messages = [{"role": "user", "content": prompt}]
-        response = gemini.invoke(messages)
-        ai_response = response.content.strip()
-        
-        if ai_response.startswith('```json'):
-            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-        elif ai_response.startswith('```'):
-            ai_response = ai_response.replace('```', '').strip()
+        ai_task = generate_structured_task(prompt, caller="disaster_task")
+        if ai_task is None:
+            raise ValueError("No usable task JSON from Gemini")
         
-        ai_data = json.loads(ai_response)
-        
-        ai_generated_description = ai_data.get("description", "").strip()
-        ai_selected_role = ai_data.get("roles", "vol")
-        
-        if ai_selected_role == "both":
-            valid_roles = ["vol", "fr"]
-        elif ai_selected_role in ["vol", "fr"]:
-            valid_roles = [ai_selected_role]
-        else:
-            valid_roles = ["vol"]
+        ai_generated_description = ai_task.description.strip()
+        valid_roles = roles_from_choice(ai_task.roles)
 
         if not ai_generated_description:
             raise ValueError("Empty description from Gemini")
 
-        task_id = str(uuid.uuid4())
-        task = {
-            "task_id": task_id,
-            "description": ai_generated_description,
-            "status": "pending",
-            "action_done_by": "",
-            "roles": valid_roles,
-            "emergency_type": emergency_type,
-            "urgency_level": urgency,
-            "latitude": latitude,
-            "longitude": longitude,
-            "people_count": people,
-            "is_fallback": False,
-            "first_Task": True,
-            "ai_reasoning": ai_data.get("reasoning", "AI-determined role assignment")
-        }
+        reasoning = ai_task.reasoning or "AI-determined role assignment"
+        task = build_first_task(data, ai_generated_description, valid_roles, "llm", reasoning)
+        task_cache.store(emergency_type, urgency, people, situation, latitude, longitude, valid_roles, ai_generated_description, reasoning)
 
         return {"generated_task": task, **state}
 
@@ -167,67 +177,19 @@ def generate_task(state: TaskState) -> TaskState:
             """
             
             fallback_messages = [{"role": "user", "content": fallback_prompt}]
-            fallback_response = gemini.invoke(fallback_messages)
-            fallback_text = fallback_response.content.strip()
-            fallback_data = json.loads(fallback_text)
+            record_metric("fallback_llm_calls")
+            fallback_response = llm_gateway.invoke(fallback_messages, caller="disaster_task_fallback")
+            fallback_data = repair_json(fallback_response.content)
             
-            role_choice = fallback_data.get("roles", "vol")
-            if role_choice == "both":
-                roles = ["vol", "fr"]
-            elif role_choice in ["vol", "fr"]:
-                roles = [role_choice]
-            else:
-                roles = ["vol"]
+            roles = roles_from_choice(fallback_data.get("roles", "vol"))
             
             description = fallback_data.get("description", f"Respond to {emergency_type} affecting {people} people at coordinates ({latitude}, {longitude}).")
             
         except Exception:
-            situation_lower = situation.lower()
-            emergency_lower = emergency_type.lower()
-            
-            mass_casualty_keywords = ['many dead', 'multiple casualties', 'mass casualties', 'hundreds', 'thousands', 'devastating', 'widespread']
-            complex_emergency_keywords = ['major', 'large-scale', 'widespread', 'multiple buildings', 'entire neighborhood', 'community-wide']
-            
-            has_mass_casualties = any(keyword in situation_lower for keyword in mass_casualty_keywords)
-            is_complex_emergency = any(keyword in situation_lower for keyword in complex_emergency_keywords) or any(keyword in emergency_lower for keyword in complex_emergency_keywords)
-            
-            people_count_high = False
-            if people and str(people).isdigit() and int(people) > 50:
-                    people_count_high = True
-            elif any(word in str(people).lower() for word in ['many', 'hundreds', 'thousands', 'community', 'neighborhood']):
-                    people_count_high = True
-            
-            needs_professional = urgency in ["urgent", "high"] or emergency_lower in ["fire", "medical", "collapse", "rescue", "explosion", "gas leak", "hazmat"]
-            
-            if (has_mass_casualties or is_complex_emergency or people_count_high) and needs_professional:
-                roles = ["vol", "fr"]
-                description = f"Coordinate multi-team response to {emergency_type} affecting {people} people at ({latitude}, {longitude}). Establish professional rescue operations and volunteer support systems simultaneously."
-            elif needs_professional:
-                roles = ["fr"]
-                description = f"Deploy professional emergency response to {emergency_type} at ({latitude}, {longitude}) affecting {people} people."
-            else:
-                roles = ["vol"]
-                description = f"Provide community support and assistance for {emergency_type} situation affecting {people} people at ({latitude}, {longitude})."
-            
-            if situation and len(situation) > 10:
-                description += f" Situation: {situation[:100]}..."
+            roles = triage["roles"]
+            description = triage["description"]
         
-        task_id = str(uuid.uuid4())
-        task = {
-            "task_id": task_id,
-            "description": description,
-            "status": "pending",
-            "action_done_by": "",
-            "roles": roles,
-            "emergency_type": emergency_type,
-            "urgency_level": urgency,
-            "latitude": latitude,
-            "longitude": longitude,
-            "people_count": people,
-            "is_fallback": True,
-            "first_Task": True,
-            "ai_reasoning": "Enhanced fallback assignment considering scale and complexity"
-        }
+        task = build_first_task(data, description, roles, "fallback", "Enhanced fallback assignment considering scale and complexity")
 
         return {"generated_task": task, **state}
 
@@ -236,6 +198,8 @@ def save_task(state: TaskState) -> TaskState:
         task_data = state['generated_task'].copy()
         task_data['disaster_id'] = state['disaster_id']
         appwrite_service.save_task_document(task_data)
+        dispatch_service.dispatch_task(task_data)
+        task_index.upsert(task_data)
         return state
     except Exception as e:
         print(f"Error saving task: {e}")
@@ -251,4 +215,87 @@ def create_generate_disaster_task_graph():
     graph.add_edge("fetch", "generate")
     graph.add_edge("generate", "save")
     graph.set_finish_point("save")
-    return graph.compile()
\ No newline at end of file
+    return graph.compile()
+
+# Fields whose change makes a pre-generated draft stale
+FINGERPRINT_FIELDS = ["emergency_type", "urgency_level", "situation", "people_count", "latitude", "longitude"]
+
+def disaster_fingerprint(data: dict) -> str:
+    payload = json.dumps({field: data.get(field) for field in FINGERPRINT_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def claim_draft(task_id: str, holder: str) -> bool:
+    """Take a draft out of the "draft" status for holder; False if publish or discard got it first.
+
+    Publishing and discarding a draft both go through this claim, so a draft that
+    became the live task is never deleted and a discarded one is never published.
+    """
+    try:
+        claim_task(task_id, holder, new_status=f"{holder}ing", expected_status="draft")
+        return True
+    except (TaskClaimConflict, TaskNotFound):
+        return False
+
+def discard_draft(task_id: str):
+    if not claim_draft(task_id, "discard"):
+        return
+    appwrite_service.delete_task_document(task_id)
+    forget_claim(task_id)
+
+def publish_draft(task_id: str):
+    if not claim_draft(task_id, "publish"):
+        return None
+    task = appwrite_service.update_task_document(task_id, {"status": "pending", "action_done_by": ""})
+    # The claim only guarded the draft; the published task is open to responders
+    forget_claim(task_id)
+    return task
+
+def pregenerate_task_draft(disaster_id: str):
+    """Generate the first task of a pending disaster ahead of acceptance and store it as a draft."""
+    try:
+        disaster = appwrite_service.get_disaster_document(disaster_id)
+        if disaster.get("status") != "pending":
+            return
+        state = generate_task({"disaster_id": disaster_id, "disaster_data": disaster})
+        draft = {
+            **state["generated_task"],
+            "disaster_id": disaster_id,
+            "status": "draft",
+            "source_fingerprint": disaster_fingerprint(disaster)
+        }
+        appwrite_service.save_task_document(draft)
+        # The disaster may have been accepted while the draft was generated; accept
+        # has then published this draft or created the first task itself, and only
+        # in the latter case is the draft still there to discard.
+        if appwrite_service.get_disaster_document(disaster_id).get("status") != "pending":
+            discard_draft(draft["task_id"])
+            return
+        print(f"Pre-generated first task draft for disaster {disaster_id}")
+    except Exception as e:
+        print(f"Error pre-generating task draft for disaster {disaster_id}: {e}")
+
+def publish_first_task(disaster_id: str, disaster: dict) -> str:
+    """Publish the pre-generated draft if it still matches the disaster, otherwise generate the task now.
+
+    Returns "published" or "generated".
+    """
+    fingerprint = disaster_fingerprint(disaster)
+    published = False
+    for draft in appwrite_service.list_tasks_by_disaster_and_status(disaster_id, "draft"):
+        try:
+            if not published and draft.get("source_fingerprint") == fingerprint:
+                task = publish_draft(draft["$id"])
+                if task is None:
+                    continue
+                dispatch_service.dispatch_task(task)
+                task_index.upsert(task)
+                published = True
+            else:
+                discard_draft(draft["$id"])
+        except Exception as e:
+            print(f"Error handling task draft {draft.get('$id')}: {e}")
+    if published:
+        return "published"
+    graph = create_generate_disaster_task_graph()
+    graph.invoke({"disaster_id": disaster_id})
+    return "generated"
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from typing import Optional
+import math
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TASK_CACHE_MAX_BUCKETS = int(os.getenv("TASK_CACHE_MAX_BUCKETS", "256"))
+TASK_CACHE_BUCKET_SIZE = int(os.getenv("TASK_CACHE_BUCKET_SIZE", "8"))
+TASK_CACHE_TTL = float(os.getenv("TASK_CACHE_TTL", "1800"))
+TASK_CACHE_SIMILARITY = float(os.getenv("TASK_CACHE_SIMILARITY", "0.5"))
+TASK_CACHE_EMBEDDINGS = os.getenv("TASK_CACHE_EMBEDDINGS", "false").lower() == "true"
+
+LAT_PLACEHOLDER = "\x00LAT\x00"
+LON_PLACEHOLDER = "\x00LON\x00"
+PEOPLE_PLACEHOLDER = "\x00PEOPLE\x00"
+
+STOPWORDS = {"a", "an", "the", "and", "or", "of", "in", "on", "at", "to", "is", "are", "was", "were",
+             "with", "for", "by", "from", "there", "this", "that", "it", "we", "our", "has", "have"}
+
+
+def people_bucket(people) -> str:
+    """Coarse bucket for the reported people count (numbers or words like 'many')."""
+    text = str(people).strip().lower()
+    digits = re.findall(r"\d+", text)
+    if digits:
+        count = int(digits[0])
+        if count <= 1:
+            return "1"
+        if count <= 10:
+            return "2-10"
+        if count <= 50:
+            return "11-50"
+        if count <= 200:
+            return "51-200"
+        return "200+"
+    if any(word in text for word in ["hundreds", "thousands", "community", "neighborhood"]):
+        return "200+"
+    if any(word in text for word in ["many", "several", "multiple", "group", "families"]):
+        return "11-50"
+    return "unknown"
+
+
+def value_pattern(value: str) -> str:
+    """Regex for a value as a whole token, so 5 does not match 15, 5.2 or floor 50."""
+    return rf"(?<![\w.]){re.escape(value)}(?!\.?\w)"
+
+
+def to_template(text: str, people, latitude, longitude) -> Optional[str]:
+    """Replace the people count and coordinates in generated text with placeholders.
+
+    Only the phrases the generator emits are templated: "<people> people" and the
+    "<latitude>, <longitude>" pair. Returns None if a value still appears anywhere
+    else, since it could not be told apart from other text (e.g. "floor 5").
+    """
+    people, latitude, longitude = (str(value).strip() for value in (people, latitude, longitude))
+    template = str(text)
+    if latitude and longitude:
+        template = re.sub(rf"{value_pattern(latitude)}(\s*,\s*(?:longitude:?\s*)?){value_pattern(longitude)}",
+                          lambda match: f"{LAT_PLACEHOLDER}{match.group(1)}{LON_PLACEHOLDER}", template, flags=re.IGNORECASE)
+    if people:
+        template = re.sub(rf"{value_pattern(people)}(?=\s+(?:people|persons|individuals)\b)", PEOPLE_PLACEHOLDER, template, flags=re.IGNORECASE)
+    for value in (people, latitude, longitude):
+        if value and re.search(value_pattern(value), template, flags=re.IGNORECASE):
+            return None
+    return template
+
+
+def from_template(template: str, people, latitude, longitude) -> str:
+    return (template
+            .replace(LAT_PLACEHOLDER, str(latitude))
+            .replace(LON_PLACEHOLDER, str(longitude))
+            .replace(PEOPLE_PLACEHOLDER, str(people)))
+
+
+def tokenize(text: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]+", str(text).lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cosine(a: list, b: list) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class TaskGenerationCache:
+    """LRU + TTL cache of AI task decisions keyed by normalized disaster features.
+
+    Entries are grouped by (emergency type, urgency, people-count bucket); within a
+    bucket the closest cached situation wins if it is similar enough. Cached
+    descriptions and reasoning are stored as templates so a hit gets its own
+    coordinates and people count; text that cannot be templated is not cached.
+    """
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+        self.embedder = None
+        if TASK_CACHE_EMBEDDINGS:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            self.embedder = GoogleGenerativeAIEmbeddings(
+                model="models/text-embedding-004",
+                google_api_key=os.getenv("GOOGLE_API_KEY")
+            )
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "skipped": 0, "expired": 0, "evictions": 0}
+
+    @staticmethod
+    def bucket_key(emergency_type, urgency, people) -> tuple:
+        return (str(emergency_type).strip().lower(), str(urgency).strip().lower(), people_bucket(people))
+
+    def situation_signature(self, situation: str) -> dict:
+        signature = {"tokens": tokenize(situation), "embedding": None}
+        if self.embedder is not None and situation:
+            try:
+                signature["embedding"] = self.embedder.embed_query(situation)
+            except Exception as e:
+                print(f"Task cache embedding failed, using keyword similarity: {e}")
+        return signature
+
+    @staticmethod
+    def similarity(a: dict, b: dict) -> float:
+        if a["embedding"] is not None and b["embedding"] is not None:
+            return cosine(a["embedding"], b["embedding"])
+        return jaccard(a["tokens"], b["tokens"])
+
+    def lookup(self, emergency_type, urgency, people, situation, latitude, longitude) -> Optional[dict]:
+        """Return {"roles", "description", "reasoning"} for a similar cached disaster, or None."""
+        key = self.bucket_key(emergency_type, urgency, people)
+        signature = self.situation_signature(situation)
+        now = time.time()
+        with self.lock:
+            entries = self.buckets.get(key)
+            if entries:
+                fresh = [entry for entry in entries if now - entry["created"] < TASK_CACHE_TTL]
+                self.metrics["expired"] += len(entries) - len(fresh)
+                entries[:] = fresh
+            best, best_score = None, TASK_CACHE_SIMILARITY
+            for entry in entries or []:
+                score = self.similarity(signature, entry["signature"])
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.metrics["misses"] += 1
+                return None
+            self.buckets.move_to_end(key)
+            self.metrics["hits"] += 1
+        return {
+            "roles": best["roles"],
+            "description": from_template(best["template"], people, latitude, longitude),
+            "reasoning": from_template(best["reasoning"], people, latitude, longitude),
+            "similarity": best_score,
+        }
+
+    def store(self, emergency_type, urgency, people, situation, latitude, longitude, roles: list, description: str, reasoning: str):
+        template = to_template(description, people, latitude, longitude)
+        reasoning_template = to_template(reasoning, people, latitude, longitude)
+        if template is None or reasoning_template is None:
+            with self.lock:
+                self.metrics["skipped"] += 1
+            return
+        entry = {
+            "signature": self.situation_signature(situation),
+            "roles": list(roles),
+            "template": template,
+            "reasoning": reasoning_template,
+            "created": time.time(),
+        }
+        key = self.bucket_key(emergency_type, urgency, people)
+        with self.lock:
+            entries = self.buckets.setdefault(key, [])
+            entries.append(entry)
+            del entries[:-TASK_CACHE_BUCKET_SIZE]
+            self.buckets.move_to_end(key)
+            self.metrics["stores"] += 1
+            while len(self.buckets) > TASK_CACHE_MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "buckets": len(self.buckets),
+                "hit_rate": round(self.metrics["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+task_cache = TaskGenerationCache()
@@ -0,0 +1,140 @@
+from app.services.appwrite_service import AppwriteService
+from collections import OrderedDict
+from typing import Optional
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long a settled claim answers competing claims without asking Appwrite
+TASK_CLAIM_CACHE_TTL = float(os.getenv("TASK_CLAIM_CACHE_TTL", "300"))
+TASK_CLAIM_CACHE_SIZE = int(os.getenv("TASK_CLAIM_CACHE_SIZE", "10000"))
+
+appwrite_service = AppwriteService()
+
+
+class TaskClaimConflict(Exception):
+    """A claim lost: the task is not in the expected state or someone else holds it."""
+
+    def __init__(self, task_id: str, reason: str, status: Optional[str] = None, holder: Optional[str] = None, updated_at: Optional[str] = None):
+        super().__init__(f"Task {task_id} cannot be claimed: {reason}")
+        self.task_id = task_id
+        self.reason = reason
+        self.status = status
+        self.holder = holder
+        self.updated_at = updated_at
+
+    def to_dict(self) -> dict:
+        return {
+            "message": str(self),
+            "reason": self.reason,
+            "status": self.status,
+            "holder": self.holder,
+            "updated_at": self.updated_at,
+        }
+
+
+class TaskNotFound(Exception):
+    """There is no task with the requested id."""
+
+
+task_locks = {}
+task_locks_guard = threading.Lock()
+settled_claims = OrderedDict()
+settled_claims_guard = threading.Lock()
+claim_metrics = {"claimed": 0, "conflicts": 0, "short_circuited": 0}
+
+
+def record(name: str):
+    with settled_claims_guard:
+        claim_metrics[name] += 1
+
+
+def settled_claim(task_id: str) -> Optional[dict]:
+    with settled_claims_guard:
+        claim = settled_claims.get(task_id)
+        if claim and time.time() - claim["settled"] > TASK_CLAIM_CACHE_TTL:
+            del settled_claims[task_id]
+            return None
+        return claim
+
+
+def remember_claim(task_id: str, status: str, holder: Optional[str], updated_at: str):
+    # Only a real holder settles a claim; caching "nobody" would turn every later claim away
+    if not holder:
+        return
+    with settled_claims_guard:
+        settled_claims[task_id] = {"status": status, "holder": holder, "updated_at": updated_at, "settled": time.time()}
+        settled_claims.move_to_end(task_id)
+        while len(settled_claims) > TASK_CLAIM_CACHE_SIZE:
+            settled_claims.popitem(last=False)
+
+
+def forget_claim(task_id: str):
+    """Drop the cached claim after any other status change to the task."""
+    with settled_claims_guard:
+        settled_claims.pop(task_id, None)
+
+
+def claim_task(task_id: str, holder: str, new_status: str = "claimed", expected_status: str = "pending", expected_updated_at: Optional[str] = None) -> dict:
+    """Move a task from expected_status to new_status for holder.
+
+    Raises TaskNotFound for an unknown task, and TaskClaimConflict when the task is
+    not in expected_status, was modified after expected_updated_at ($updatedAt the
+    client last saw), is being claimed by another request in this process, or is
+    seen held by someone else after the write. Claiming a task the caller already
+    holds succeeds again.
+
+    Claims are serialized within this process only. Appwrite has no conditional
+    update, so two replicas whose read-write-reread sequences interleave can both
+    report success; the later write is the one that sticks.
+    """
+    claim = settled_claim(task_id)
+    if claim and claim["holder"] != holder:
+        record("short_circuited")
+        raise TaskClaimConflict(task_id, "already claimed", claim["status"], claim["holder"], claim["updated_at"])
+
+    with task_locks_guard:
+        lock = task_locks.setdefault(task_id, threading.Lock())
+        acquired = lock.acquire(blocking=False)
+    if not acquired:
+        record("short_circuited")
+        raise TaskClaimConflict(task_id, "claim in progress")
+    try:
+        document = appwrite_service.find_task_document(task_id)
+        if document is None:
+            raise TaskNotFound(f"Task {task_id} not found")
+        status = document.get("status")
+        current_holder = document.get("action_done_by") or None
+        if status == new_status and current_holder == holder:
+            return document
+        if status != expected_status:
+            record("conflicts")
+            raise TaskClaimConflict(task_id, f"status is {status}", status, current_holder, document.get("$updatedAt"))
+        if expected_updated_at and document.get("$updatedAt") != expected_updated_at:
+            record("conflicts")
+            raise TaskClaimConflict(task_id, "task changed since it was read", status, current_holder, document.get("$updatedAt"))
+
+        appwrite_service.update_task_status(task_id, new_status, holder)
+        # Re-read to catch most claims that landed from another replica between our
+        # read and write; this narrows the race but does not close it
+        document = appwrite_service.get_task_document(task_id)
+        if document.get("action_done_by") != holder:
+            record("conflicts")
+            remember_claim(task_id, document.get("status"), document.get("action_done_by"), document.get("$updatedAt"))
+            raise TaskClaimConflict(task_id, "claimed concurrently", document.get("status"), document.get("action_done_by"), document.get("$updatedAt"))
+        remember_claim(task_id, new_status, holder, document.get("$updatedAt"))
+        record("claimed")
+        return document
+    finally:
+        lock.release()
+        with task_locks_guard:
+            if task_locks.get(task_id) is lock and not lock.locked():
+                del task_locks[task_id]
+
+
+def get_claim_metrics() -> dict:
+    with settled_claims_guard:
+        return {**claim_metrics, "cached_claims": len(settled_claims)}
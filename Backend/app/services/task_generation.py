@@ -0,0 +1,157 @@
+from app.models.task import GeneratedTaskResponse
+from app.services.llm_gateway import llm_gateway
+from pydantic import ValidationError
+from typing import Optional
+import json
+import re
+import threading
+
+# Gemini constrained to the task schema; include_raw keeps the raw reply so a
+# near-valid answer can still be repaired locally instead of re-asking the model.
+structured_task_llm = llm_gateway.llm.with_structured_output(GeneratedTaskResponse, include_raw=True)
+
+task_generation_metrics = {
+    "structured_ok": 0,
+    "repaired_locally": 0,
+    "unparseable": 0,
+    "fallback_llm_calls": 0,
+}
+metrics_lock = threading.Lock()
+
+
+def record_metric(name: str, amount: int = 1):
+    with metrics_lock:
+        task_generation_metrics[name] = task_generation_metrics.get(name, 0) + amount
+
+
+def get_task_generation_metrics() -> dict:
+    with metrics_lock:
+        return dict(task_generation_metrics)
+
+
+def roles_from_choice(role_choice: str) -> list:
+    """Map a single role choice ('vol', 'fr' or 'both') to the roles list stored on tasks."""
+    if role_choice == "both":
+        return ["vol", "fr"]
+    if role_choice in ["vol", "fr"]:
+        return [role_choice]
+    return ["vol"]
+
+
+def close_truncated_json(text: str) -> str:
+    """Close any string, array or object left open by a truncated reply."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def outside_strings(text: str, transform) -> str:
+    """Apply transform to the parts of text that are not inside double-quoted strings."""
+    parts = []
+    segment_start = 0
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                parts.append(text[segment_start:index + 1])
+                segment_start = index + 1
+        elif char == '"':
+            in_string = True
+            parts.append(transform(text[segment_start:index]))
+            segment_start = index
+    tail = text[segment_start:]
+    parts.append(tail if in_string else transform(tail))
+    return "".join(parts)
+
+
+def repair_json(text: str) -> dict:
+    """Parse near-valid JSON from an LLM reply.
+
+    Handles Markdown fences, prose around the object, smart quotes, trailing
+    commas, Python literals, unquoted keys, single-quoted strings and replies cut
+    off mid-object. Raises ValueError if nothing parseable remains.
+    """
+    candidate = text.strip()
+    candidate = re.sub(r"^```(?:json)?\s*", "", candidate)
+    candidate = re.sub(r"\s*```\s*$", "", candidate)
+    start = candidate.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in response")
+    end = candidate.rfind("}")
+    candidate = candidate[start:end + 1] if end > start else candidate[start:]
+
+    repairs = [
+        lambda s: s,
+        lambda s: s.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'"),
+        # Structural fixes only touch text outside strings, so values like "Note: ..." survive
+        lambda s: outside_strings(s, lambda part: re.sub(r",\s*([}\]])", r"\1", part)),
+        lambda s: outside_strings(s, lambda part: re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", part)))),
+        lambda s: outside_strings(s, lambda part: re.sub(r"'([^'\n]*)'(\s*[:,}\]])", r'"\1"\2', part)),
+        lambda s: outside_strings(s, lambda part: re.sub(r"([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:", r'\1"\2":', part)),
+        close_truncated_json,
+    ]
+    for repair in repairs:
+        candidate = repair(candidate)
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    raise ValueError("Could not repair JSON response")
+
+
+def parse_task_response(text: str) -> GeneratedTaskResponse:
+    """Repair and validate a raw task reply against the task schema."""
+    return GeneratedTaskResponse.model_validate(repair_json(text))
+
+
+def generate_structured_task(prompt: str, caller: str) -> Optional[GeneratedTaskResponse]:
+    """Generate a task with schema-constrained output.
+
+    Returns None only when neither the structured result nor local repair of the
+    raw reply yields a valid task, in which case callers fall back to a second prompt.
+    """
+    result = llm_gateway.invoke([{"role": "user", "content": prompt}], caller=caller, runnable=structured_task_llm)
+    parsed = result.get("parsed")
+    if parsed is not None:
+        record_metric("structured_ok")
+        return parsed
+
+    raw = result.get("raw")
+    raw_texts = [getattr(raw, "content", "") or ""]
+    raw_texts += [json.dumps(call.get("args", {})) for call in getattr(raw, "tool_calls", []) or []]
+    for raw_text in raw_texts:
+        if not isinstance(raw_text, str) or not raw_text.strip():
+            continue
+        try:
+            task = parse_task_response(raw_text)
+        except (ValueError, ValidationError):
+            continue
+        record_metric("repaired_locally")
+        return task
+
+    record_metric("unparseable")
+    print(f"Task generation for {caller} returned no usable JSON: {result.get('parsing_error')}")
+    return None
@@ -0,0 +1,198 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.geo_utils import geohash_block
+from appwrite.query import Query
+from typing import Optional
+import asyncio
+import os
+import threading
+import time
+import pygeohash as pgh
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Geohash rings around the caller included in the feed (precision 4, roughly 20-40 km cells)
+TASK_FEED_RINGS = int(os.getenv("TASK_FEED_RINGS", "1"))
+TASK_FEED_MAX_WAIT = float(os.getenv("TASK_FEED_MAX_WAIT", "30"))
+# How long closed tasks are remembered so incremental clients learn to drop them
+TASK_FEED_TOMBSTONE_TTL = float(os.getenv("TASK_FEED_TOMBSTONE_TTL", "3600"))
+
+GEOHASH_PRECISION = 4
+OPEN_STATUSES = {"pending"}
+FEED_FIELDS = ["task_id", "disaster_id", "description", "status", "roles", "emergency_type",
+               "urgency_level", "latitude", "longitude", "people_count", "action_done_by"]
+
+appwrite_service = AppwriteService()
+
+
+class TaskIndex:
+    """Open tasks bucketed by geohash cell, versioned for incremental sync.
+
+    Every change bumps a global version and stamps the task with it, so a client
+    passing the cursor it last saw gets only what changed since. Cursors are
+    "<epoch>-<version>" where the epoch identifies this process, because versions
+    restart after a restart. Closed tasks stay as tombstones for
+    TASK_FEED_TOMBSTONE_TTL; older cursors and cursors from another epoch get a
+    full reset.
+    """
+
+    def __init__(self):
+        self.epoch = str(int(time.time() * 1000))
+        self.tasks = {}
+        self.cells = {}
+        self.version = 0
+        self.floor = 0
+        self.pruned_at = 0.0
+        self.lock = threading.Lock()
+        self.waiters = []
+        self.warmed = False
+
+    def warm(self):
+        """Load all open tasks once (e.g. at startup)."""
+        count = 0
+        for document in appwrite_service.iter_documents(
+            appwrite_service.tasks_collection_Id,
+            [Query.equal("status", list(OPEN_STATUSES))]
+        ):
+            # Tasks written during warm-up are already newer than the listed document
+            self.upsert(document, notify=False, replace=False)
+            count += 1
+        self.warmed = True
+        print(f"Task feed index warmed with {count} open tasks")
+
+    def upsert(self, task: dict, notify: bool = True, replace: bool = True):
+        task_id = task.get("task_id") or task.get("$id")
+        try:
+            geohash = pgh.encode(float(task["latitude"]), float(task["longitude"]), precision=GEOHASH_PRECISION)
+        except (KeyError, TypeError, ValueError):
+            return
+        if not task_id:
+            return
+        with self.lock:
+            previous = self.tasks.get(task_id)
+            if previous and not replace:
+                return
+            entry = {**(previous or {}), **{field: task[field] for field in FEED_FIELDS if field in task}}
+            entry["task_id"] = task_id
+            self.store(entry, geohash, previous)
+        if notify:
+            self.notify()
+
+    def update_status(self, task_id: str, status: str, action_done_by: str = None):
+        with self.lock:
+            previous = self.tasks.get(task_id)
+            if previous is None:
+                return
+            entry = {**previous, "status": status}
+            if action_done_by:
+                entry["action_done_by"] = action_done_by
+            self.store(entry, previous["geohash"], previous)
+        self.notify()
+
+    def remove(self, task_id: str):
+        self.update_status(task_id, "deleted")
+
+    def store(self, entry: dict, geohash: str, previous: dict):
+        # Caller holds self.lock
+        if previous and previous["geohash"] != geohash:
+            self.cells.get(previous["geohash"], set()).discard(entry["task_id"])
+        self.version += 1
+        entry["geohash"] = geohash
+        entry["version"] = self.version
+        entry["changed_at"] = time.time()
+        self.tasks[entry["task_id"]] = entry
+        self.cells.setdefault(geohash, set()).add(entry["task_id"])
+
+    def prune(self):
+        # Caller holds self.lock; a full sweep at most once a minute is enough for tombstones
+        now = time.time()
+        if now - self.pruned_at < 60:
+            return
+        self.pruned_at = now
+        cutoff = now - TASK_FEED_TOMBSTONE_TTL
+        for task_id, entry in list(self.tasks.items()):
+            if entry["status"] not in OPEN_STATUSES and entry["changed_at"] < cutoff:
+                del self.tasks[task_id]
+                self.cells.get(entry["geohash"], set()).discard(task_id)
+                self.floor = max(self.floor, entry["version"])
+
+    def cursor(self, version: int) -> str:
+        return f"{self.epoch}-{version}"
+
+    def parse_cursor(self, cursor: str) -> Optional[int]:
+        """Version of a cursor from this process, 0 for no cursor, None for anything else."""
+        if not cursor or cursor == "0":
+            return 0
+        epoch, _, version = str(cursor).partition("-")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def feed(self, latitude: float, longitude: float, roles: list, cursor: str = "") -> dict:
+        """Tasks near a location for the given roles that changed after `cursor`.
+
+        Open tasks are returned in "tasks", tasks closed since then in "removed".
+        "reset" tells the client to drop its local copy because the cursor is too old,
+        malformed or predates a server restart.
+        """
+        center = pgh.encode(latitude, longitude, precision=GEOHASH_PRECISION)
+        since = self.parse_cursor(cursor)
+        with self.lock:
+            self.prune()
+            reset = since is None or since > self.version or (since and since < self.floor)
+            if reset:
+                since = 0
+            tasks, removed = [], []
+            for cell in geohash_block(center, TASK_FEED_RINGS):
+                for task_id in self.cells.get(cell, ()):
+                    entry = self.tasks[task_id]
+                    if entry["version"] <= since or not set(entry.get("roles") or []) & set(roles):
+                        continue
+                    if entry["status"] in OPEN_STATUSES:
+                        tasks.append({key: value for key, value in entry.items() if key != "changed_at"})
+                    elif since:
+                        removed.append(task_id)
+            version = self.version
+        tasks.sort(key=lambda task: task["version"])
+        return {"cursor": self.cursor(version), "reset": bool(reset), "tasks": tasks, "removed": removed}
+
+    async def wait_for_change(self, cursor: str, timeout: float):
+        """Wait until the index moves past `cursor` or the timeout expires."""
+        since = self.parse_cursor(cursor)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            if since is None or self.version > since:
+                return
+            self.waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                if (loop, future) in self.waiters:
+                    self.waiters.remove((loop, future))
+
+    def notify(self):
+        # Changes arrive from worker threads; wake long-polls on their own event loop
+        with self.lock:
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(True))
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            open_tasks = sum(1 for entry in self.tasks.values() if entry["status"] in OPEN_STATUSES)
+            return {
+                "warmed": self.warmed,
+                "epoch": self.epoch,
+                "version": self.version,
+                "open_tasks": open_tasks,
+                "tombstones": len(self.tasks) - open_tasks,
+                "cells": len(self.cells),
+                "waiting_clients": len(self.waiters),
+            }
+
+
+task_index = TaskIndex()
@@ -0,0 +1,73 @@
+from app.services.appwrite_service import AppwriteService
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index
+from app.services.task_claims import forget_claim
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TASK_SYNC_MAX_CHANGES = int(os.getenv("TASK_SYNC_MAX_CHANGES", "500"))
+TASK_SYNC_CONCURRENCY = int(os.getenv("TASK_SYNC_CONCURRENCY", "8"))
+
+appwrite_service = AppwriteService()
+sync_executor = ThreadPoolExecutor(max_workers=TASK_SYNC_CONCURRENCY, thread_name_prefix="task-sync")
+
+
+def apply_task_status(task_id: str, status: str, action_done_by: Optional[str] = None) -> dict:
+    """Write a task status and keep the dispatch, feed and claim caches in step."""
+    document = appwrite_service.update_task_status(task_id, status, action_done_by)
+    if status != "pending":
+        dispatch_service.retire_task(task_id)
+    task_index.update_status(task_id, status, action_done_by)
+    forget_claim(task_id)
+    return document
+
+
+def as_utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def apply_synced_change(change) -> dict:
+    """Apply one collapsed change unless the server copy was modified after it."""
+    try:
+        document = appwrite_service.get_task_document(change.task_id)
+        updated_at = document.get("$updatedAt")
+        if updated_at and datetime.fromisoformat(updated_at.replace("Z", "+00:00")) > as_utc(change.changed_at):
+            return {"status": "stale", "server_status": document.get("status"), "server_updated_at": updated_at}
+        if document.get("status") == change.status and (not change.action_done_by or document.get("action_done_by") == change.action_done_by):
+            return {"status": "unchanged"}
+        apply_task_status(change.task_id, change.status, change.action_done_by)
+        return {"status": "applied"}
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+
+def sync_task_changes(changes: List) -> dict:
+    """Collapse offline changes to the latest per task, apply them concurrently, report per item.
+
+    Items are reported in request order; earlier changes to a task that a later
+    one replaced are "superseded". A change older than the server's copy is "stale".
+    """
+    latest = {}
+    for position, change in enumerate(changes):
+        current = latest.get(change.task_id)
+        if current is None or as_utc(change.changed_at) >= as_utc(changes[current].changed_at):
+            latest[change.task_id] = position
+
+    futures = {position: sync_executor.submit(apply_synced_change, changes[position]) for position in latest.values()}
+    results = []
+    for position, change in enumerate(changes):
+        if position in futures:
+            outcome = futures[position].result()
+        else:
+            outcome = {"status": "superseded"}
+        results.append({"index": position, "task_id": change.task_id, **outcome})
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"total": len(changes), "tasks": len(latest), **summary, "results": results}
@@ -0,0 +1,182 @@
+from app.services.llm_gateway import llm_gateway
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "rules_first": answer confident cases with the keyword classifier and only ask
+# Gemini about the rest. "llm_first": always ask Gemini (classifier is the last fallback).
+TASK_TRIAGE_MODE = os.getenv("TASK_TRIAGE_MODE", "rules_first")
+TASK_TRIAGE_MIN_CONFIDENCE = float(os.getenv("TASK_TRIAGE_MIN_CONFIDENCE", "0.7"))
+# Used for the latency-saved estimate until the gateway has observed real calls
+TASK_TRIAGE_LLM_LATENCY_ESTIMATE = float(os.getenv("TASK_TRIAGE_LLM_LATENCY_ESTIMATE", "2.0"))
+
+MASS_CASUALTY_KEYWORDS = ['many dead', 'multiple casualties', 'mass casualties', 'hundreds', 'thousands', 'devastating', 'widespread']
+COMPLEX_EMERGENCY_KEYWORDS = ['major', 'large-scale', 'widespread', 'multiple buildings', 'entire neighborhood', 'community-wide']
+HIGH_PEOPLE_WORDS = ['many', 'hundreds', 'thousands', 'community', 'neighborhood']
+PROFESSIONAL_EMERGENCY_TYPES = ["fire", "medical", "collapse", "rescue", "explosion", "gas leak", "hazmat"]
+LOW_URGENCY_LEVELS = ["low", "minimal"]
+
+INAPPROPRIATE_KEYWORDS = ["joke", "funny", "lol", "haha", "prank", "fake", "test123", "random"]
+GROUP_HELP_KEYWORDS = ["many people", "multiple people", "crowd", "group", "families"]
+COMPLEX_HELP_TYPE_KEYWORDS = ["major", "widespread", "multiple", "mass", "large scale"]
+FIRST_RESPONDER_HELP_KEYWORDS = ["medical", "injury", "hurt", "bleeding", "unconscious", "rescue", "trapped", "fire", "emergency"]
+URGENT_HELP_KEYWORDS = ["urgent", "critical", "immediate", "asap"]
+BASIC_NEEDS_KEYWORDS = ["food", "water", "shelter", "blanket", "clothes", "supplies", "transport", "information", "charger", "medicine refill"]
+
+triage_metrics = {
+    "decisions": {"vol": 0, "fr": 0, "both": 0},
+    "rules_answered": 0,
+    "escalated": 0,
+    "rules_time_total": 0.0,
+    "latency_saved_estimate": 0.0,
+}
+metrics_lock = threading.Lock()
+
+
+def roles_choice(roles: list) -> str:
+    return "both" if len(roles) > 1 else roles[0]
+
+
+def triage_disaster(emergency_type, urgency, people, situation, latitude, longitude) -> dict:
+    """Deterministic role decision for a disaster's first task.
+
+    Returns {"roles", "description", "confidence", "signals"}; confidence grows with
+    the number of independent signals that agree on the decision.
+    """
+    situation_lower = str(situation).lower()
+    emergency_lower = str(emergency_type).lower()
+
+    has_mass_casualties = any(keyword in situation_lower for keyword in MASS_CASUALTY_KEYWORDS)
+    is_complex_emergency = any(keyword in situation_lower for keyword in COMPLEX_EMERGENCY_KEYWORDS) or any(keyword in emergency_lower for keyword in COMPLEX_EMERGENCY_KEYWORDS)
+
+    people_count_high = False
+    if people and str(people).isdigit() and int(people) > 50:
+        people_count_high = True
+    elif any(word in str(people).lower() for word in HIGH_PEOPLE_WORDS):
+        people_count_high = True
+    people_count_small = bool(people) and str(people).isdigit() and int(people) <= 10
+
+    high_urgency = urgency in ["urgent", "high"]
+    professional_type = emergency_lower in PROFESSIONAL_EMERGENCY_TYPES
+
+    scale_signals = sum([has_mass_casualties, is_complex_emergency, people_count_high])
+    professional_signals = sum([high_urgency, professional_type])
+
+    if scale_signals and professional_signals:
+        roles = ["vol", "fr"]
+        confidence = 0.55 + 0.15 * (scale_signals + professional_signals - 2)
+        description = f"Coordinate multi-team response to {emergency_type} affecting {people} people at ({latitude}, {longitude}). Establish professional rescue operations and volunteer support systems simultaneously."
+    elif professional_signals:
+        roles = ["fr"]
+        confidence = 0.85 if professional_signals == 2 else 0.6
+        description = f"Deploy professional emergency response to {emergency_type} at ({latitude}, {longitude}) affecting {people} people."
+    else:
+        roles = ["vol"]
+        # No professional signal is only strong evidence when urgency is explicitly low and few are affected
+        confidence = 0.8 if urgency in LOW_URGENCY_LEVELS and people_count_small else 0.45
+        description = f"Provide community support and assistance for {emergency_type} situation affecting {people} people at ({latitude}, {longitude})."
+
+    if situation and len(situation) > 10:
+        description += f" Situation: {situation[:100]}..."
+
+    return {
+        "roles": roles,
+        "description": description,
+        "confidence": round(min(confidence, 0.95), 2),
+        "signals": {
+            "mass_casualties": has_mass_casualties,
+            "complex_emergency": is_complex_emergency,
+            "people_count_high": people_count_high,
+            "high_urgency": high_urgency,
+            "professional_type": professional_type,
+        },
+    }
+
+
+def triage_help_request(help_needed, emergency_type, urgency, latitude, longitude, nearby_resources) -> dict:
+    """Deterministic role decision for a citizen help request (same shape as triage_disaster)."""
+    description = f"Assist person needing {help_needed} at location ({latitude}, {longitude})."
+    help_lower = str(help_needed).lower()
+    emergency_lower = str(emergency_type).lower()
+
+    is_inappropriate = any(keyword in help_lower for keyword in INAPPROPRIATE_KEYWORDS)
+    mass_casualty = any(keyword in help_lower for keyword in GROUP_HELP_KEYWORDS)
+    complex_emergency = any(keyword in emergency_lower for keyword in COMPLEX_HELP_TYPE_KEYWORDS)
+    fr_hits = sum(1 for keyword in FIRST_RESPONDER_HELP_KEYWORDS if keyword in help_lower)
+    needs_fr = fr_hits > 0
+    high_urgency = urgency in ["high", "urgent"] or any(keyword in help_lower for keyword in URGENT_HELP_KEYWORDS)
+    basic_needs = any(keyword in help_lower for keyword in BASIC_NEEDS_KEYWORDS)
+
+    if is_inappropriate:
+        description = "Assess situation appropriately and provide guidance on proper emergency procedures."
+        roles = ["vol"]
+        # Keywords like "random" also appear in genuine requests; let the LLM judge
+        confidence = 0.5
+    elif (mass_casualty or complex_emergency) and (needs_fr or high_urgency):
+        roles = ["vol", "fr"]
+        confidence = 0.6 + 0.1 * (sum([mass_casualty, complex_emergency, needs_fr, high_urgency]) - 2)
+    elif needs_fr or high_urgency:
+        roles = ["fr"]
+        if needs_fr and high_urgency:
+            confidence = 0.85
+        elif needs_fr:
+            confidence = 0.7 if fr_hits > 1 or urgency != "low" else 0.55
+        else:
+            confidence = 0.5
+    else:
+        roles = ["vol"]
+        confidence = 0.8 if basic_needs else 0.4
+
+    if nearby_resources and not is_inappropriate:
+        closest_resource = nearby_resources[0]
+        description += f" Coordinate with {closest_resource.get('name', 'nearby resource')} for assistance."
+
+    return {
+        "roles": roles,
+        "description": description,
+        "confidence": round(min(confidence, 0.95), 2),
+        "signals": {
+            "inappropriate": is_inappropriate,
+            "group": mass_casualty,
+            "complex_emergency": complex_emergency,
+            "needs_first_responder": needs_fr,
+            "high_urgency": high_urgency,
+            "basic_needs": basic_needs,
+        },
+    }
+
+
+def should_answer_with_rules(decision: dict) -> bool:
+    return TASK_TRIAGE_MODE == "rules_first" and decision["confidence"] >= TASK_TRIAGE_MIN_CONFIDENCE
+
+
+def record_triage(decision: dict, escalated: bool, llm_caller: str, elapsed: float):
+    """Record a triage outcome; answered cases add the LLM latency they avoided."""
+    with metrics_lock:
+        triage_metrics["rules_time_total"] += elapsed
+        if escalated:
+            triage_metrics["escalated"] += 1
+            return
+        triage_metrics["rules_answered"] += 1
+        triage_metrics["decisions"][roles_choice(decision["roles"])] += 1
+    saved = llm_gateway.average_latency(llm_caller) or TASK_TRIAGE_LLM_LATENCY_ESTIMATE
+    with metrics_lock:
+        triage_metrics["latency_saved_estimate"] += saved
+
+
+def get_triage_metrics() -> dict:
+    with metrics_lock:
+        total = triage_metrics["rules_answered"] + triage_metrics["escalated"]
+        return {
+            "mode": TASK_TRIAGE_MODE,
+            "min_confidence": TASK_TRIAGE_MIN_CONFIDENCE,
+            "decisions": dict(triage_metrics["decisions"]),
+            "rules_answered": triage_metrics["rules_answered"],
+            "escalated": triage_metrics["escalated"],
+            "escalation_rate": round(triage_metrics["escalated"] / total, 3) if total else 0.0,
+            "avg_rules_time_ms": round(triage_metrics["rules_time_total"] / total * 1000, 3) if total else 0.0,
+            "latency_saved_estimate": round(triage_metrics["latency_saved_estimate"], 2),
+        }
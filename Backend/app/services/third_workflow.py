@@ -1,21 +1,28 @@
-from langgraph.graph import StateGraph
-from typing import TypedDict
+from langgraph.graph import StateGraph, START, END
+from typing import TypedDict, Annotated
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-from langchain_google_genai import ChatGoogleGenerativeAI
-import os
-import math
-import json
+import time
 from app.services.appwrite_service import AppwriteService
+from app.services.resource_index import resource_index
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index
+from app.services.llm_gateway import llm_gateway
+from app.services.task_generation import generate_structured_task, repair_json, roles_from_choice, record_metric
+from app.services.task_triage import triage_help_request, should_answer_with_rules, record_triage
 from dotenv import load_dotenv
 
 load_dotenv()
 
 appwrite_service = AppwriteService()
 
-gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+# Shared pool for the concurrent write batch in save_task_to_db
+write_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="emergency-request-write")
+
+
+def merge_timings(current: dict, update: dict) -> dict:
+    return {**(current or {}), **(update or {})}
+
 
 class EmergencyRequestState(TypedDict):
     disaster_id: str
@@ -28,40 +35,35 @@ class EmergencyRequestState(TypedDict):
     nearby_resources: list
     generated_task: dict
     user_request_data: dict
+    node_timings: Annotated[dict, merge_timings]
+
+
+def timed_node(name: str, node):
+    """Wrap a graph node so its wall time (ms) is recorded in state["node_timings"]."""
+    def run(state: EmergencyRequestState) -> dict:
+        started = time.perf_counter()
+        result = node(state)
+        return {**result, "node_timings": {name: round((time.perf_counter() - started) * 1000, 1)}}
+    return run
 
 
 def fetch_disaster_type(state: EmergencyRequestState) -> EmergencyRequestState:
     try:
         document = appwrite_service.get_disaster_document(state["disaster_id"])
         emergency_type = document.get("emergency_type", "general emergency")
-        return {**state, "emergency_type": emergency_type}
+        return {"emergency_type": emergency_type}
     except Exception as e:
         raise ValueError(f"Disaster data not found: {e}")
 
 
 def fetch_nearby_resources(state: EmergencyRequestState) -> EmergencyRequestState:
     try:
-        documents = appwrite_service.list_resources_for_disaster(state["disaster_id"])
-        nearby_resources = []
-        user_lat = float(state["latitude"])
-        user_lon = float(state["longitude"])
-        for doc in documents:
-            if doc.get("latitude") and doc.get("longitude"):
-                resource_lat = float(doc["latitude"])
-                resource_lon = float(doc["longitude"])
-                distance = math.sqrt(
-                    (user_lat - resource_lat) ** 2 + (user_lon - resource_lon) ** 2
-                )
-                resource_data = {
-                    **doc,
-                    "distance": distance,
-                    "resource_id": doc["$id"]
-                }
-                nearby_resources.append(resource_data)
-        nearby_resources.sort(key=lambda x: x.get("distance", float("inf")))
-        return {**state, "nearby_resources": nearby_resources[:5]}
+        nearby_resources = resource_index.nearest(
+            state["disaster_id"], float(state["latitude"]), float(state["longitude"]), k=5
+        )
+        return {"nearby_resources": nearby_resources}
     except Exception as e:
-        return {**state, "nearby_resources": []}
+        return {"nearby_resources": []}
 
 
 def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestState:
@@ -81,8 +83,34 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
             resource_info += f"  Description: {resource.get('description', 'No description')}\n"
             resource_info += f"  Contact: {resource.get('contact', 'No contact')}\n"
             resource_info += f"  Status: {resource.get('status', 'unknown')}\n"
+            resource_info += f"  Distance: {resource.get('distance')} km\n"
     else:
         resource_info = "No nearby resources identified."
+    triage_started = time.perf_counter()
+    triage = triage_help_request(help_needed, emergency_type, urgency, latitude, longitude, nearby_resources)
+    answered_by_rules = should_answer_with_rules(triage)
+    record_triage(triage, not answered_by_rules, "emergency_task", time.perf_counter() - triage_started)
+    if answered_by_rules:
+        task = {
+            "task_id": str(uuid.uuid4()),
+            "description": triage["description"],
+            "status": "pending",
+            "action_done_by": "",
+            "roles": triage["roles"],
+            "emergency_type": emergency_type,
+            "urgency_level": urgency,
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "help_needed": help_needed,
+            "user_id": state["user_id"],
+            "disaster_id": state["disaster_id"],
+            "first_Task": False,
+            "is_fallback": False,
+            "generated_by": "rules",
+            "ai_reasoning": f"Rules-based triage (confidence {triage['confidence']})",
+            "resource_utilization": f"Coordinate with {nearby_resources[0].get('name', 'nearby resource')}" if nearby_resources else "none",
+        }
+        return {**state, "generated_task": task}
     prompt = f"""
     You are an emergency response coordinator AI. A citizen has submitted an emergency request that requires immediate response. Analyze the situation and determine both the appropriate response task AND which responder roles are needed.
 
@@ -115,22 +143,11 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
     Respond ONLY with valid JSON.
     """
     try:
-        messages = [{"role": "user", "content": prompt}]
-        response = gemini.invoke(messages)
-        ai_response = response.content.strip()
-        if ai_response.startswith("```json"):
-            ai_response = ai_response.replace("```json", "").replace("```", "").strip()
-        elif ai_response.startswith("```"):
-            ai_response = ai_response.replace("```", "").strip()
-        ai_data = json.loads(ai_response)
-        ai_generated_description = ai_data.get("description", "").strip()
-        ai_selected_role = ai_data.get("roles", "vol")
-        if ai_selected_role == "both":
-            valid_roles = ["vol", "fr"]
-        elif ai_selected_role in ["vol", "fr"]:
-            valid_roles = [ai_selected_role]
-        else:
-            valid_roles = ["vol"]
+        ai_task = generate_structured_task(prompt, caller="emergency_task")
+        if ai_task is None:
+            raise ValueError("No usable task JSON from Gemini")
+        ai_generated_description = ai_task.description.strip()
+        valid_roles = roles_from_choice(ai_task.roles)
         if not ai_generated_description:
             raise ValueError("Empty description from Gemini")
         task_id = str(uuid.uuid4())
@@ -148,9 +165,10 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
             "user_id": state["user_id"],
             "disaster_id": state["disaster_id"],
             "is_fallback": False,
+            "generated_by": "llm",
             "first_Task": False,
-            "ai_reasoning": ai_data.get("reasoning", "AI-determined role assignment"),
-            "resource_utilization": ai_data.get("resource_utilization", "none"),
+            "ai_reasoning": ai_task.reasoning or "AI-determined role assignment",
+            "resource_utilization": ai_task.resource_utilization or "none",
         }
         return {**state, "generated_task": task}
     except Exception as e:
@@ -166,43 +184,17 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
             }}
             """
             fallback_messages = [{"role": "user", "content": fallback_prompt}]
-            fallback_response = gemini.invoke(fallback_messages)
-            fallback_text = fallback_response.content.strip()
-            fallback_data = json.loads(fallback_text)
-            role_choice = fallback_data.get("roles", "vol")
-            if role_choice == "both":
-                roles = ["vol", "fr"]
-            elif role_choice in ["vol", "fr"]:
-                roles = [role_choice]
-            else:
-                roles = ["vol"]
+            record_metric("fallback_llm_calls")
+            fallback_response = llm_gateway.invoke(fallback_messages, caller="emergency_task_fallback")
+            fallback_data = repair_json(fallback_response.content)
+            roles = roles_from_choice(fallback_data.get("roles", "vol"))
             description = fallback_data.get(
                 "description",
                 f"Assist person needing {help_needed} at location ({latitude}, {longitude})."
             )
         except Exception as e:
-            description = f"Assist person needing {help_needed} at location ({latitude}, {longitude})."
-            help_lower = help_needed.lower()
-            emergency_lower = emergency_type.lower()
-            inappropriate_keywords = ["joke", "funny", "lol", "haha", "prank", "fake", "test123", "random"]
-            is_inappropriate = any(keyword in help_lower for keyword in inappropriate_keywords)
-            if is_inappropriate:
-                description = "Assess situation appropriately and provide guidance on proper emergency procedures."
-                roles = ["vol"]
-            else:
-                mass_casualty = any(keyword in help_lower for keyword in ["many people", "multiple people", "crowd", "group", "families"])
-                complex_emergency = any(keyword in emergency_lower for keyword in ["major", "widespread", "multiple", "mass", "large scale"])
-                needs_fr = any(keyword in help_lower for keyword in ["medical", "injury", "hurt", "bleeding", "unconscious", "rescue", "trapped", "fire", "emergency"])
-                high_urgency = urgency in ["high", "urgent"] or any(keyword in help_lower for keyword in ["urgent", "critical", "immediate", "asap"])
-                if (mass_casualty or complex_emergency) and (needs_fr or high_urgency):
-                    roles = ["vol", "fr"]
-                elif needs_fr or high_urgency:
-                    roles = ["fr"]
-                else:
-                    roles = ["vol"]
-            if nearby_resources and not is_inappropriate:
-                closest_resource = nearby_resources[0]
-                description += f" Coordinate with {closest_resource.get('name', 'nearby resource')} for assistance."
+            roles = triage["roles"]
+            description = triage["description"]
         task_id = str(uuid.uuid4())
         task = {
             "task_id": task_id,
@@ -219,7 +211,9 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
             "disaster_id": state["disaster_id"],
             "first_Task": False,
             "is_fallback": True,
+            "generated_by": "fallback",
             "ai_reasoning": "Intelligent fallback assignment based on context analysis",
+            "resource_utilization": "none",
         }
         return {**state, "generated_task": task}
 
@@ -227,29 +221,33 @@ def generate_emergency_task(state: EmergencyRequestState) -> EmergencyRequestSta
 def save_task_to_db(state: EmergencyRequestState) -> EmergencyRequestState:
     user_id = state["user_id"]
     disaster_id = state["disaster_id"]
-    # Delete any existing tasks for this user and disaster before saving the new one
+    new_task = state["generated_task"]
+    # The new task is created alongside the deletes of this user's older tasks for the disaster
+    create = write_executor.submit(appwrite_service.save_task_document, new_task)
+    writes = []
     try:
         existing_tasks = appwrite_service.list_tasks_by_user_and_disaster(user_id, disaster_id)
         for task in existing_tasks:
             task_id = task.get("$id") or task.get("task_id")
             # Only delete if first_Task is False (or missing)
-            if task_id and not task.get("first_Task", False):
-                try:
-                    appwrite_service.databases.delete_document(
-                        database_id=appwrite_service.database_id,
-                        collection_id=appwrite_service.tasks_collection_Id,
-                        document_id=task_id
-                    )
-                except Exception as e:
-                    pass
+            if task_id and task_id != new_task["task_id"] and not task.get("first_Task", False):
+                writes.append(write_executor.submit(appwrite_service.delete_task_document, task_id))
+                dispatch_service.retire_task(task_id)
+                task_index.remove(task_id)
     except Exception as e:
         pass
-    # Now save the new task
+    for write in writes:
+        try:
+            write.result()
+        except Exception as e:
+            pass
     try:
-        appwrite_service.save_task_document(state["generated_task"])
+        create.result()
+        dispatch_service.dispatch_task(new_task)
+        task_index.upsert(new_task)
     except Exception as e:
         pass
-    return state
+    return {}
 
 
 def save_user_request(state: EmergencyRequestState) -> EmergencyRequestState:
@@ -279,22 +277,25 @@ def save_user_request(state: EmergencyRequestState) -> EmergencyRequestState:
         appwrite_service.save_user_request_document(user_id, user_request_data)
     except Exception as e:
         pass
-    return {**state, "user_request_data": user_request_data}
+    return {"user_request_data": user_request_data}
 
 
 def create_emergency_request_graph():
     graph = StateGraph(EmergencyRequestState)
-    graph.add_node("fetch_disaster", fetch_disaster_type)
-    graph.add_node("fetch_resources", fetch_nearby_resources)
-    graph.add_node("generate_task", generate_emergency_task)
-    graph.add_node("save_task", save_task_to_db)
-    graph.add_node("save_request", save_user_request)
-    graph.set_entry_point("fetch_disaster")
-    graph.add_edge("fetch_disaster", "fetch_resources")
-    graph.add_edge("fetch_resources", "generate_task")
+    graph.add_node("fetch_disaster", timed_node("fetch_disaster", fetch_disaster_type))
+    graph.add_node("fetch_resources", timed_node("fetch_resources", fetch_nearby_resources))
+    graph.add_node("generate_task", timed_node("generate_task", generate_emergency_task))
+    graph.add_node("save_task", timed_node("save_task", save_task_to_db))
+    graph.add_node("save_request", timed_node("save_request", save_user_request))
+    # Both reads only need disaster_id, so they run in the same step
+    graph.add_edge(START, "fetch_disaster")
+    graph.add_edge(START, "fetch_resources")
+    graph.add_edge(["fetch_disaster", "fetch_resources"], "generate_task")
+    # The task and the user request are independent writes
     graph.add_edge("generate_task", "save_task")
-    graph.add_edge("save_task", "save_request")
-    graph.set_finish_point("save_request")
+    graph.add_edge("generate_task", "save_request")
+    graph.add_edge("save_task", END)
+    graph.add_edge("save_request", END)
     return graph.compile()
 
 
@@ -318,18 +319,20 @@ async def process_emergency_request(
         nearby_resources=[],
         generated_task={},
         user_request_data={},
+        node_timings={},
     )
+    started = time.perf_counter()
     result = await graph.ainvoke(initial_state)
+    result["node_timings"]["total"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"Emergency request timings (ms): {result['node_timings']}")
     return result
 
 
 def delete_task_by_id(task_id: str):
     """Delete a task document from the tasks collection by its ID."""
     try:
-        appwrite_service.databases.delete_document(
-            database_id=appwrite_service.database_id,
-            collection_id=appwrite_service.tasks_collection_Id,
-            document_id=task_id
-        )
+        appwrite_service.delete_task_document(task_id)
+        dispatch_service.retire_task(task_id)
+        task_index.remove(task_id)
     except Exception as e:
         pass
\ No newline at end of file
@@ -0,0 +1,64 @@
+from app.services.appwrite_service import AppwriteService
+import threading
+import pygeohash as pgh
+
+GEOHASH_PRECISION = 4
+CONTACT_FIELDS = ["uid", "name", "email", "phone", "role", "telegram_chat_id"]
+
+appwrite_service = AppwriteService()
+
+
+class UserGeoIndex:
+    """Every user's contact details bucketed by the geohash of their last login."""
+
+    def __init__(self):
+        self.cells = {}
+        self.users = {}
+        self.lock = threading.Lock()
+        self.warmed = False
+
+    def warm(self):
+        """Load all users once (e.g. at startup)."""
+        count = 0
+        for document in appwrite_service.iter_documents(appwrite_service.users_collection_id):
+            # A login during warm-up carries a fresher location than the stored document
+            self.upsert(document, replace=False)
+            count += 1
+        self.warmed = True
+        print(f"User geo index warmed with {count} users")
+
+    def upsert(self, user_document: dict, replace: bool = True):
+        uid = str(user_document.get("uid") or user_document.get("$id") or "")
+        geohash = user_document.get("geohash")
+        if not geohash and user_document.get("latitude") is not None and user_document.get("longitude") is not None:
+            try:
+                geohash = pgh.encode(float(user_document["latitude"]), float(user_document["longitude"]), precision=GEOHASH_PRECISION)
+            except (TypeError, ValueError):
+                geohash = None
+        if not uid:
+            return
+        with self.lock:
+            if not replace and uid in self.users:
+                return
+            previous = self.users.pop(uid, None)
+            if previous:
+                self.cells.get(previous["geohash"], {}).pop(uid, None)
+            if not geohash:
+                return
+            geohash = str(geohash)[:GEOHASH_PRECISION]
+            user = {field: user_document.get(field) for field in CONTACT_FIELDS}
+            user["uid"] = uid
+            user["geohash"] = geohash
+            self.users[uid] = user
+            self.cells.setdefault(geohash, {})[uid] = user
+
+    def users_in_cells(self, cells: list) -> list:
+        with self.lock:
+            return [user for cell in cells for user in self.cells.get(cell, {}).values()]
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {"warmed": self.warmed, "users": len(self.users), "cells": len(self.cells)}
+
+
+user_geo_index = UserGeoIndex()
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import asyncio
+import os
+import tempfile
+import time
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(50 * 1024 * 1024)))
+# Only the start of a clip is decoded; frames are sampled at VIDEO_SAMPLE_FPS for scene detection
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MAX_SECONDS", "60"))
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "2"))
+VIDEO_MAX_KEYFRAMES = int(os.getenv("VIDEO_MAX_KEYFRAMES", "6"))
+# Histogram (Bhattacharyya) distance from the previous keyframe that counts as a new scene
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.3"))
+# Wall-clock budget for decoding one clip, and how many clips are decoded at once
+VIDEO_DECODE_TIMEOUT = float(os.getenv("VIDEO_DECODE_TIMEOUT", "20"))
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))
+VIDEO_UPLOAD_CHUNK_SIZE = 1024 * 1024
+KEYFRAME_SIZE = 1280
+
+video_executor = ThreadPoolExecutor(max_workers=VIDEO_WORKERS, thread_name_prefix="video-decode")
+
+
+class VideoUploadError(Exception):
+    """A video rejected before analysis; status_code is 413 (too large) or 415 (not a supported video)."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_supported_container(header: bytes) -> bool:
+    # MP4/MOV/3GP carry an "ftyp" box at offset 4; WebM/Matroska start with the EBML magic
+    return header[4:8] == b"ftyp" or header[:4] == b"\x1a\x45\xdf\xa3"
+
+
+async def read_video_upload(upload) -> str:
+    """Spool an uploaded clip to a temporary file in chunks and return its path.
+
+    The size cap is enforced while copying, and anything that is not an MP4, MOV,
+    3GP or WebM container is rejected after the first chunk. The caller deletes
+    the file.
+    """
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > VIDEO_MAX_BYTES:
+        raise VideoUploadError(413, f"Video is larger than {VIDEO_MAX_BYTES} bytes")
+    spool = tempfile.NamedTemporaryFile(prefix="report-video-", delete=False)
+    try:
+        with spool:
+            size = 0
+            while True:
+                chunk = await upload.read(VIDEO_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not is_supported_container(chunk):
+                    raise VideoUploadError(415, "Unsupported video; use MP4, MOV, 3GP or WebM")
+                size += len(chunk)
+                if size > VIDEO_MAX_BYTES:
+                    raise VideoUploadError(413, f"Video is larger than {VIDEO_MAX_BYTES} bytes")
+                spool.write(chunk)
+        if size == 0:
+            raise VideoUploadError(415, "Video upload is empty")
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+
+def frame_histogram(frame):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, [32, 32], [0, 180, 0, 256])
+    return cv2.normalize(histogram, histogram).flatten()
+
+
+def extract_keyframes(path: str, limit: int = VIDEO_MAX_KEYFRAMES) -> List[bytes]:
+    """Pick up to limit (at most VIDEO_MAX_KEYFRAMES) JPEG frames of a clip, one per scene change.
+
+    Frames are read one at a time: only every sampled frame is decoded (the rest
+    are just grabbed), decoding stops after VIDEO_MAX_SECONDS of footage or
+    VIDEO_DECODE_TIMEOUT of wall time, and only the chosen keyframes are kept.
+    When a clip has more scenes than the limit, the sharpest cuts win.
+    """
+    limit = max(1, min(limit, VIDEO_MAX_KEYFRAMES))
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise VideoUploadError(415, "Video could not be decoded")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps / VIDEO_SAMPLE_FPS))
+        max_frames = int(VIDEO_MAX_SECONDS * fps)
+        deadline = time.monotonic() + VIDEO_DECODE_TIMEOUT
+        candidates = []
+        previous = None
+        position = 0
+        while position < max_frames and time.monotonic() < deadline:
+            if not capture.grab():
+                break
+            position += 1
+            if (position - 1) % step:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            height, width = frame.shape[:2]
+            scale = KEYFRAME_SIZE / max(height, width)
+            if scale < 1:
+                frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+            histogram = frame_histogram(frame)
+            change = 1.0 if previous is None else cv2.compareHist(previous, histogram, cv2.HISTCMP_BHATTACHARYYA)
+            if change >= VIDEO_SCENE_THRESHOLD:
+                previous = histogram
+                encoded, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                if encoded:
+                    candidates.append((change, position, jpeg.tobytes()))
+                if len(candidates) > limit:
+                    # Drop the weakest cut, never the opening frame
+                    weakest = min(range(1, len(candidates)), key=lambda index: candidates[index][0])
+                    candidates.pop(weakest)
+    finally:
+        capture.release()
+    if not candidates:
+        raise VideoUploadError(415, "No frames could be decoded from the video")
+    return [jpeg for _, _, jpeg in candidates]
+
+
+async def video_keyframes(upload, limit: int = VIDEO_MAX_KEYFRAMES) -> List[bytes]:
+    """Up to limit keyframes of an uploaded clip, decoded on the bounded video pool."""
+    path = await read_video_upload(upload)
+    try:
+        return await asyncio.wrap_future(video_executor.submit(extract_keyframes, path, limit))
+    finally:
+        os.unlink(path)
@@ -3,12 +3,35 @@ from app.apis.private import router as private_router
 from app.apis.public import router as public_router
 from app.apis.user import router as user_router
 from app.apis.government import router as government_router
+from app.services.dispatch_service import dispatch_service
+from app.services.task_index import task_index
+from app.services.user_geo_index import user_geo_index
+from app.services.report_dedup import report_deduplicator
+from app.services.guide_templates import guide_templates
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+import threading
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+
+def warm_indexes():
+    for index in [dispatch_service, task_index, user_geo_index, report_deduplicator, guide_templates]:
+        try:
+            index.warm()
+        except Exception as e:
+            print(f"Failed to warm {type(index).__name__}: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Indexes load in the background; logins and task writes keep them current meanwhile
+    threading.Thread(target=warm_indexes, daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,